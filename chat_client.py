@@ -9,6 +9,7 @@ import time
 TRACKER_URL = "http://127.0.0.1:8000" # Địa chỉ server trung tâm
 MY_USERNAME = ""
 MY_P2P_PORT = 0
+my_channels = set() # Các kênh đã join, để join lại nếu lease đã hết hạn
 
 # --- Biến toàn cục (được bảo vệ bởi Lock) ---
 # Danh sách các socket đang kết nối P2P (để broadcast)
@@ -135,6 +136,30 @@ def connect_to_peer(peer_info):
     except Exception as e:
         print(f"[P2P Client] Lỗi kết nối đến {peer_info['username']}: {e}")
 
+def heartbeat_loop(ttl):
+    """
+    Luồng 3: Gửi heartbeat cho Tracker mỗi ttl/3 giây để giữ lease.
+    Nếu Tracker đã xóa mình (mất mạng lâu hơn ttl), đăng ký và join kênh lại.
+    """
+    while True:
+        time.sleep(ttl / 3)
+        try:
+            resp = requests.post(f"{TRACKER_URL}/chat/heartbeat", json={
+                "username": MY_USERNAME
+            }, timeout=3)
+            if resp.json().get('code') != "not_registered":
+                continue
+            print(f"[Tracker] Lease đã hết hạn, đăng ký lại...")
+            requests.post(f"{TRACKER_URL}/chat/register", json={
+                "username": MY_USERNAME, "p2p_port": MY_P2P_PORT
+            }, timeout=3)
+            for channel in list(my_channels):
+                requests.post(f"{TRACKER_URL}/chat/join", json={
+                    "username": MY_USERNAME, "channel": channel
+                }, timeout=3)
+        except Exception as e:
+            print(f"[Tracker] Heartbeat lỗi: {e}")
+
 def main_cli():
     """
     Luồng 2: Chạy giao diện dòng lệnh (CLI).
@@ -157,6 +182,9 @@ def main_cli():
         print(f"[Tracker] Server nói: {resp.json().get('message')}")
         if resp.json().get('status') == 'error':
             return # Dừng nếu không đăng ký được
+        ttl = resp.json().get('lease_ttl')
+        if ttl: # None nếu Tracker không bật lease
+            threading.Thread(target=heartbeat_loop, args=(ttl,), daemon=True).start()
     except Exception as e:
         print(f"[Tracker] Không thể kết nối Tracker Server: {e}")
         return
@@ -186,6 +214,8 @@ def main_cli():
                     "username": MY_USERNAME, "channel": channel
                 })
                 print(f"[Tracker] {resp.json().get('message')}")
+                if resp.json().get('status') == 'success':
+                    my_channels.add(channel)
             except Exception as e:
                 print(f"[Lỗi] {e}")
 
@@ -304,15 +304,50 @@ class ChatClientGUI:
             self.log_message(f"[Tracker Error] Lỗi khi gọi {method} {path}: {e}")
             return {"status": "error", "message": str(e)}
 
+    def batch_request(self, calls, stop_on_error=False):
+        """
+        Gọi nhiều API của Tracker trong 1 round trip qua /chat/batch.
+        stop_on_error: bỏ qua các lời gọi sau một lời gọi lỗi (join chỉ chạy khi register thành công).
+        Trả về list body theo thứ tự, hoặc None nếu tracker không hỗ trợ batch.
+        """
+        body = {"requests": calls, "stop_on_error": True} if stop_on_error else calls
+        try:
+            resp = requests.post(f"{self.tracker_url}/chat/batch", json=body, timeout=5)
+            if resp.status_code == 404:
+                return None # Tracker cũ, không có batch
+            resp.raise_for_status()
+            res = resp.json()
+            if res.get("status") != "success":
+                return None
+            return [item.get("body") or {} for item in res.get("results", [])]
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log_message(f"[Tracker Error] Lỗi khi gọi batch: {e}")
+            return None
+
     def register_with_tracker(self):
-        """API 1: Đăng ký với tracker."""
+        """API 1: Đăng ký với tracker (kèm join #general và lấy peers trong 1 batch)."""
         payload = {"username": self.username, "p2p_port": self.p2p_port}
-        res = self.http_request("POST", "/chat/register", payload)
+        channel = "#general"
+        results = self.batch_request([
+            {"method": "POST", "path": "/chat/register", "body": payload},
+            {"method": "POST", "path": "/chat/join",
+             "body": {"username": self.username, "channel": channel}},
+            {"method": "POST", "path": "/chat/peers",
+             "body": {"username": self.username, "channel": channel}},
+        ], stop_on_error=True) # Đăng ký lỗi (trùng username) thì không join thay người khác
+        res = results[0] if results else self.http_request("POST", "/chat/register", payload)
         
         if res and res.get("status") == "success":
             self.log_message(f"[Tracker] Đăng ký thành công: {res.get('message')}")
+            # Giữ lease bằng heartbeat (lease_ttl là None nếu Tracker không bật lease)
+            if res.get("lease_ttl"):
+                threading.Thread(target=self.heartbeat_loop, args=(res["lease_ttl"],),
+                                 daemon=True).start()
             # Tự động tham gia #general khi đăng ký
-            self.join_channel("#general")
+            if results and len(results) == 3:
+                self.handle_join_result(channel, results[1], results[2])
+            else:
+                self.join_channel(channel)
         else:
             msg = res.get('message', 'Không rõ lỗi')
             self.log_message(f"[Tracker Error] Đăng ký thất bại: {msg}")
@@ -322,11 +357,37 @@ class ChatClientGUI:
             )
             self.root.after(0, self.on_closing)
 
+    def heartbeat_loop(self, ttl):
+        """Gửi heartbeat mỗi ttl/3 giây; nếu lease đã hết hạn thì đăng ký và join kênh lại."""
+        while self.running:
+            time.sleep(ttl / 3)
+            if not self.running:
+                break
+            res = self.http_request("POST", "/chat/heartbeat", {"username": self.username})
+            if res.get("code") != "not_registered":
+                continue
+            self.log_message("[Tracker] Lease đã hết hạn, đăng ký lại...")
+            self.http_request("POST", "/chat/register",
+                              {"username": self.username, "p2p_port": self.p2p_port})
+            for channel in list(self.joined_channels):
+                self.http_request("POST", "/chat/join",
+                                  {"username": self.username, "channel": channel})
+
     def join_channel(self, channel_name):
-        """API 3: Tham gia kênh."""
+        """API 3: Tham gia kênh (join + lấy peers trong 1 batch)."""
         payload = {"username": self.username, "channel": channel_name}
-        res = self.http_request("POST", "/chat/join", payload)
-        
+        results = self.batch_request([
+            {"method": "POST", "path": "/chat/join", "body": payload},
+            {"method": "POST", "path": "/chat/peers", "body": payload},
+        ])
+        if results and len(results) == 2:
+            self.handle_join_result(channel_name, results[0], results[1])
+        else:
+            res = self.http_request("POST", "/chat/join", payload)
+            self.handle_join_result(channel_name, res)
+
+    def handle_join_result(self, channel_name, res, peers_res=None):
+        """Xử lý kết quả join; peers_res là kết quả /chat/peers nếu đã lấy cùng batch."""
         if res and res.get("status") == "success":
             if channel_name not in self.joined_channels:
                 self.joined_channels.add(channel_name)
@@ -335,7 +396,10 @@ class ChatClientGUI:
                 self.root.after(0, self.update_channel_list_ui)
             
             # Tự động đồng bộ khi join kênh mới
-            self.sync_peers(channel_name)
+            if peers_res is not None:
+                self.connect_peers(channel_name, peers_res)
+            else:
+                self.sync_peers(channel_name)
         else:
             self.log_message(f"[Tracker Error] Tham gia kênh thất bại: {res.get('message')}")
 
@@ -343,7 +407,10 @@ class ChatClientGUI:
         """API 4: Lấy danh sách peer và kết nối."""
         payload = {"username": self.username, "channel": channel}
         res = self.http_request("POST", "/chat/peers", payload)
-        
+        self.connect_peers(channel, res)
+
+    def connect_peers(self, channel, res):
+        """Kết nối tới các peer trong kết quả của /chat/peers."""
         if res and res.get("status") == "success":
             peers = res.get("peers", [])
             if not peers:
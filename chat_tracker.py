@@ -0,0 +1,619 @@
+# chat_tracker.py
+"""
+Lớp dữ liệu của Tracker (start_chat_server.py): peers, kênh và chỉ mục thành viên.
+
+Hai chỉ mục được giữ nhất quán ở mọi thao tác (register, join, leave, remove):
+
+- members: channel -> set(username), để /chat/peers chỉ duyệt thành viên của kênh
+  (O(số thành viên) thay vì O(tổng số peer x số kênh mỗi peer));
+- memberships: username -> set(channel), để gỡ một peer khỏi mọi kênh của nó
+  mà không quét toàn bộ kênh.
+
+Đồng thời (copy-on-write, giống cách ConfigReloader thay cả bảng route):
+
+- các thao tác ghi giữ ``TrackerStore.lock`` (chỉ cập nhật chỉ mục, rất ngắn);
+- các thao tác đọc (channel_names, peers_in, stats) không khóa: chúng đọc các
+  giá trị bất biến được ghi thay thế nguyên khối (tuple tên kênh, frozenset thành
+  viên của từng kênh, bản ghi peer), nên không bao giờ thấy một set đang bị sửa.
+  Thêm/bớt thành viên tốn O(số thành viên của kênh), bằng chi phí một lần đọc.
+
+Việc parse JSON và dựng response nằm ngoài lock, ở các route của Tracker.
+
+Lưu bền (TrackerJournal, tùy chọn): mỗi thao tác ghi được đánh số thứ tự và đưa
+vào journal append-only ngay trong lock của store (thứ tự journal = thứ tự áp
+dụng), rồi người gọi chờ bản ghi được fsync ở ngoài lock. Một luồng flusher
+gom mọi bản ghi đang chờ vào một lần write + fsync (group commit), nên nhiều
+request đồng thời chỉ tốn một fsync. Định kỳ, flusher ghi snapshot toàn bộ
+state (ghi file tạm, fsync, đổi tên) rồi cắt journal. Khi khởi động: nạp
+snapshot, phát lại phần journal sau nó, bỏ dòng cuối bị ghi dở.
+
+Lease (tùy chọn, :meth:`TrackerStore.enable_leases`): mỗi peer có hạn lease, gia
+hạn bằng heartbeat. Heartbeat chỉ ghi lại hạn mới (O(1)), không đụng tới bánh xe
+thời gian (TimingWheel); khi ô của peer tới lượt, peer còn hạn thì được xếp lại
+theo hạn mới, hết hạn thì bị xóa khỏi peers và mọi kênh (qua journal như một
+thao tác remove). Không có lần quét toàn bộ peer nào. Lease không được lưu: peer
+khôi phục từ journal nhận một lease mới khi Tracker khởi động.
+"""
+
+import os
+import json
+import time
+import threading
+
+#: Độ phân giải mặc định của bánh xe thời gian (giây).
+LEASE_TICK = 1.0
+
+
+#: Mã lỗi (không đổi theo ngôn ngữ) để client xử lý, ví dụ đăng ký lại khi lease hết hạn
+NOT_REGISTERED = "not_registered"
+USERNAME_TAKEN = "username_taken"
+UNKNOWN_CHANNEL = "unknown_channel"
+JOURNAL_FAILED = "journal_failed"
+
+
+class TrackerError(Exception):
+    """Lỗi nghiệp vụ của Tracker, message được trả nguyên cho client, kèm ``code``."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class TimingWheel:
+    """
+    Bánh xe thời gian phân cấp: ``levels`` vòng, mỗi vòng ``slots`` ô; ô ở vòng k
+    chứa các khóa hết hạn trong một khoảng ``slots**k`` tick. Thêm, hủy một khóa là
+    O(1); mỗi tick chỉ xử lý một ô, các khóa ở vòng trên được hạ dần xuống khi tới
+    gần hạn. Không tự khóa, người gọi giữ lock.
+
+    :attrs tick (float): độ dài một tick (giây).
+    :attrs current (int): tick hiện tại.
+    """
+
+    def __init__(self, tick=LEASE_TICK, slots=64, levels=4, now=None):
+        """
+        :param tick (float): độ dài một tick (giây).
+        :param slots (int): số ô mỗi vòng.
+        :param levels (int): số vòng; hạn xa hơn ``slots**levels`` tick được xếp lại nhiều lần.
+        :param now (float): thời điểm bắt đầu (time.monotonic() nếu bỏ trống).
+        """
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        #: khóa -> (vòng, ô, tick hết hạn)
+        self.where = {}
+        self.current = int((time.monotonic() if now is None else now) / tick)
+
+    def __len__(self):
+        return len(self.where)
+
+    def schedule(self, key, deadline):
+        """
+        Đặt (hoặc dời) hạn của ``key``.
+
+        :param deadline (float): thời điểm hết hạn, cùng đồng hồ với ``now``.
+        """
+        self.cancel(key)
+        self._place(key, max(int(-(-deadline // self.tick)), self.current + 1))
+
+    def _place(self, key, when):
+        delta = when - self.current
+        level, span = 0, self.slots
+        while delta >= span and level < self.levels - 1:
+            level += 1
+            span *= self.slots
+        slot = (when // self.slots ** level) % self.slots
+        self.wheels[level][slot].add(key)
+        self.where[key] = (level, slot, when)
+
+    def cancel(self, key):
+        entry = self.where.pop(key, None)
+        if entry is not None:
+            self.wheels[entry[0]][entry[1]].discard(key)
+
+    def advance(self, now):
+        """
+        Quay bánh xe tới ``now``.
+
+        :rtype list: các khóa tới hạn (đã bị gỡ khỏi bánh xe).
+        """
+        target = int(now / self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            # Vòng dưới vừa hết một lượt: hạ các khóa của ô tương ứng ở vòng trên
+            for level in range(1, self.levels):
+                if self.current % self.slots ** level:
+                    break
+                slot = (self.current // self.slots ** level) % self.slots
+                bucket, self.wheels[level][slot] = self.wheels[level][slot], set()
+                for key in bucket:
+                    self._place(key, self.where[key][2])
+            slot = self.current % self.slots
+            bucket, self.wheels[0][slot] = self.wheels[0][slot], set()
+            for key in bucket:
+                del self.where[key]
+                expired.append(key)
+        return expired
+
+
+class TrackerStore:
+    """
+    Dữ liệu in-memory của Tracker.
+
+    :attrs peers (dict): username -> {"ip": str, "port": int}, không sửa sau khi tạo.
+    :attrs channels (dict): tên kênh -> {"description": str}.
+    :attrs members (dict): tên kênh -> frozenset(username), thay mới ở mỗi lần ghi.
+    :attrs memberships (dict): username -> set(tên kênh), chỉ dùng khi giữ lock.
+    :attrs journal (TrackerJournal): nơi ghi lại các thao tác, None nếu chỉ in-memory.
+    :attrs lease_ttl (float): thời hạn lease (giây), None nếu peer không hết hạn.
+    """
+
+    def __init__(self, channels=None):
+        """
+        :param channels (dict): các kênh có sẵn, tên -> mô tả.
+        """
+        self.lock = threading.Lock()
+        self.peers = {}
+        self.channels = {}
+        #: Tên các kênh, tuple được thay khi có kênh mới
+        self.names = ()
+        self.members = {}
+        self.memberships = {}
+        self.joined = 0
+        self.journal = None
+        self.lease_ttl = None
+        #: username -> hạn lease (time.monotonic())
+        self.leases = {}
+        self.wheel = None
+        self.expired = 0
+        for name, description in (channels or {}).items():
+            self.add_channel(name, description)
+
+    def add_channel(self, channel, description=None):
+        """
+        Tạo kênh nếu chưa có.
+
+        :rtype bool: True nếu kênh vừa được tạo.
+        """
+        with self.lock:
+            created = self._add_channel(channel, description)
+            seq = self._record("channel", channel=channel, description=description) if created else None
+        self._durable(seq)
+        return created
+
+    def _record(self, op, **fields):
+        # Gọi khi đang giữ self.lock, để thứ tự journal đúng thứ tự áp dụng
+        if self.journal is None:
+            return None
+        return self.journal.append(op, fields)
+
+    def _durable(self, seq):
+        # Gọi sau khi nhả self.lock: chờ fsync mà không chặn các thao tác khác
+        if seq is not None:
+            self.journal.wait(seq)
+
+    def _add_channel(self, channel, description=None):
+        if channel in self.channels:
+            return False
+        self.channels[channel] = {"description": description or f"Kênh {channel} được tạo tự động"}
+        # Thành viên trước, tên kênh sau: ai thấy tên kênh thì cũng thấy chỉ mục của nó
+        self.members[channel] = frozenset()
+        self.names = self.names + (channel,)
+        return True
+
+    def register(self, username, ip, port):
+        """
+        Đăng ký một peer mới.
+
+        :raise TrackerError: nếu username đã tồn tại.
+        """
+        with self.lock:
+            if username in self.peers:
+                raise TrackerError("Username đã tồn tại", USERNAME_TAKEN)
+            self.memberships[username] = set()
+            self.peers[username] = {"ip": ip, "port": port}
+            if self.wheel is not None:
+                self._lease(username, time.monotonic())
+            seq = self._record("register", username=username, ip=ip, port=port)
+        self._durable(seq)
+
+    def join(self, username, channel):
+        """
+        Cho peer tham gia kênh, tạo kênh nếu chưa có.
+
+        :raise TrackerError: nếu peer chưa đăng ký.
+        :rtype bool: True nếu kênh vừa được tạo.
+        """
+        with self.lock:
+            if username not in self.peers:
+                raise TrackerError("Peer chưa đăng ký", NOT_REGISTERED)
+            created = self._add_channel(channel)
+            seq = None
+            if channel not in self.memberships[username]:
+                self.memberships[username].add(channel)
+                self.members[channel] = self.members[channel] | {username}
+                self.joined += 1
+                seq = self._record("join", username=username, channel=channel)
+        self._durable(seq)
+        return created
+
+    def leave(self, username, channel):
+        """
+        Cho peer rời kênh (kênh vẫn được giữ lại).
+
+        :raise TrackerError: nếu peer chưa đăng ký.
+        :rtype bool: True nếu peer đã ở trong kênh.
+        """
+        with self.lock:
+            if username not in self.peers:
+                raise TrackerError("Peer chưa đăng ký", NOT_REGISTERED)
+            if channel not in self.memberships[username]:
+                return False
+            self.memberships[username].discard(channel)
+            self.members[channel] = self.members[channel] - {username}
+            self.joined -= 1
+            seq = self._record("leave", username=username, channel=channel)
+        self._durable(seq)
+        return True
+
+    def remove(self, username):
+        """
+        Xóa một peer (hủy đăng ký hoặc hết hạn) khỏi mọi kênh của nó.
+
+        :rtype bool: True nếu peer tồn tại.
+        """
+        with self.lock:
+            if username not in self.peers:
+                return False
+            seq = self._remove(username)
+        self._durable(seq)
+        return True
+
+    def _remove(self, username):
+        channels = self.memberships.pop(username)
+        for channel in channels:
+            self.members[channel] = self.members[channel] - {username}
+        self.joined -= len(channels)
+        del self.peers[username]
+        if self.leases.pop(username, None) is not None:
+            self.wheel.cancel(username)
+        return self._record("remove", username=username)
+
+    def enable_leases(self, ttl, tick=LEASE_TICK):
+        """
+        Cho các peer hết hạn nếu không heartbeat trong ``ttl`` giây; các peer đang
+        có (ví dụ vừa khôi phục từ journal) nhận một lease mới.
+
+        :param ttl (float): thời hạn lease (giây).
+        :param tick (float): độ phân giải của việc hết hạn (giây).
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.lease_ttl = ttl
+            self.wheel = TimingWheel(tick, now=now)
+            for username in self.peers:
+                self._lease(username, now)
+
+    def _lease(self, username, now):
+        deadline = now + self.lease_ttl
+        self.leases[username] = deadline
+        self.wheel.schedule(username, deadline)
+
+    def heartbeat(self, username):
+        """
+        Gia hạn lease của peer: O(1), bánh xe chỉ được cập nhật khi ô cũ tới lượt.
+
+        :raise TrackerError: nếu peer chưa đăng ký (hoặc đã hết hạn).
+        :rtype float: thời hạn lease (giây), None nếu lease bị tắt.
+        """
+        with self.lock:
+            if username not in self.peers:
+                raise TrackerError("Peer chưa đăng ký", NOT_REGISTERED)
+            if self.wheel is not None:
+                self.leases[username] = time.monotonic() + self.lease_ttl
+            return self.lease_ttl
+
+    def expire(self, now=None):
+        """
+        Quay bánh xe tới ``now`` và xóa các peer hết hạn khỏi peers và mọi kênh.
+
+        :rtype list: username của các peer vừa hết hạn.
+        """
+        if self.wheel is None:
+            return []
+        now = time.monotonic() if now is None else now
+        expired, seq = [], None
+        with self.lock:
+            for username in self.wheel.advance(now):
+                deadline = self.leases.get(username)
+                if deadline is None:
+                    continue
+                if deadline > now:
+                    # Đã heartbeat từ lần xếp trước: xếp lại theo hạn mới
+                    self.wheel.schedule(username, deadline)
+                    continue
+                seq = self._remove(username)
+                expired.append(username)
+            self.expired += len(expired)
+        self._durable(seq)
+        return expired
+
+    def channel_names(self):
+        """
+        :rtype list: tên các kênh.
+        """
+        return list(self.names)
+
+    def peers_in(self, channel, exclude=None):
+        """
+        Danh sách peer của một kênh, trừ ``exclude`` (thường là người hỏi).
+
+        :raise TrackerError: nếu kênh không tồn tại.
+        :rtype list: các {"username", "ip", "port"}.
+        """
+        members = self.members.get(channel)
+        if members is None:
+            raise TrackerError("Kênh không tồn tại", UNKNOWN_CHANNEL)
+        peers = []
+        for username in members:
+            # Peer vừa bị xóa song song thì bỏ qua
+            peer = self.peers.get(username)
+            if peer is not None and username != exclude:
+                peers.append({"username": username, "ip": peer["ip"], "port": peer["port"]})
+        return peers
+
+    def stats(self):
+        """
+        :rtype dict: số peer, số kênh, số lượt tham gia kênh (và số liệu journal).
+        """
+        stats = {"peers": len(self.peers), "channels": len(self.names), "memberships": self.joined}
+        if self.wheel is not None:
+            stats["lease_ttl"] = self.lease_ttl
+            stats["expired"] = self.expired
+        if self.journal is not None:
+            stats["journal"] = self.journal.stats()
+        return stats
+
+    def state(self):
+        """
+        Bản sao toàn bộ state để ghi snapshot; người gọi giữ self.lock.
+
+        :rtype dict: {"channels": {tên: mô tả}, "peers": {username: {"ip", "port", "channels"}}}.
+        """
+        return {
+            "channels": {name: self.channels[name]["description"] for name in self.names},
+            "peers": {username: {"ip": peer["ip"], "port": peer["port"],
+                                 "channels": sorted(self.memberships[username])}
+                      for username, peer in self.peers.items()},
+        }
+
+    def load(self, state):
+        """
+        Thay toàn bộ state bằng một snapshot (lúc khởi động, trước khi phục vụ).
+
+        :param state (dict): kết quả của :meth:`state`.
+        """
+        with self.lock:
+            self.peers, self.channels, self.names = {}, {}, ()
+            self.members, self.memberships, self.joined = {}, {}, 0
+            for name, description in state["channels"].items():
+                self._add_channel(name, description)
+            for username, peer in state["peers"].items():
+                self.memberships[username] = set(peer["channels"])
+                self.peers[username] = {"ip": peer["ip"], "port": peer["port"]}
+                for channel in peer["channels"]:
+                    self._add_channel(channel)
+                    self.members[channel] = self.members[channel] | {username}
+                self.joined += len(peer["channels"])
+
+    def apply(self, record):
+        """
+        Áp dụng lại một bản ghi journal (lúc phát lại, chưa gắn journal).
+
+        :param record (dict): {"op": ..., các tham số của thao tác}.
+        """
+        op = record["op"]
+        try:
+            if op == "register":
+                self.register(record["username"], record["ip"], record["port"])
+            elif op == "join":
+                self.join(record["username"], record["channel"])
+            elif op == "leave":
+                self.leave(record["username"], record["channel"])
+            elif op == "remove":
+                self.remove(record["username"])
+            elif op == "channel":
+                self.add_channel(record["channel"], record["description"])
+        except TrackerError:
+            # Journal và snapshot có thể chồng nhau một đoạn, thao tác đã có thì bỏ qua
+            pass
+
+
+class TrackerJournal:
+    """
+    Journal append-only (group commit) và snapshot của một TrackerStore.
+
+    :attrs directory (str): thư mục chứa ``snapshot.json`` và ``journal.log``.
+    :attrs snapshot_every (int): số bản ghi journal giữa hai lần snapshot.
+    """
+
+    def __init__(self, directory, snapshot_every=10000, fsync=True):
+        """
+        :param directory (str): thư mục dữ liệu, được tạo nếu chưa có.
+        :param snapshot_every (int): số bản ghi giữa hai lần snapshot.
+        :param fsync (bool): False chỉ để thử nghiệm: không chờ dữ liệu xuống đĩa.
+        """
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.journal_path = os.path.join(directory, "journal.log")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.store = None
+        self.file = None
+        self.thread = None
+        self.lock = threading.Lock()
+        #: Báo flusher có bản ghi mới
+        self.work = threading.Condition(self.lock)
+        #: Báo người ghi rằng bản ghi của họ đã xuống đĩa
+        self.done = threading.Condition(self.lock)
+        self.pending = []
+        self.seq = 0
+        self.durable = 0
+        self.error = None
+        self.closing = False
+        self.since_snapshot = 0
+        self.counters = {"records": 0, "commits": 0, "snapshots": 0}
+
+    def open(self, store):
+        """
+        Khôi phục ``store`` từ snapshot và journal, rồi bắt đầu ghi các thao tác mới.
+
+        :param store (TrackerStore): store rỗng (chỉ có các kênh mặc định).
+        """
+        started = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        self.store = store
+        seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            store.load(snapshot["state"])
+            seq = snapshot["seq"]
+        replayed, good = 0, 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("torn record")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Dòng cuối ghi dở khi tiến trình chết: bỏ từ đây
+                        break
+                    good += len(line)
+                    if record["seq"] > seq:
+                        store.apply(record)
+                        seq = record["seq"]
+                        replayed += 1
+        self.file = open(self.journal_path, "ab")
+        self.file.truncate(good)
+        self.seq = self.durable = seq
+        print(f"[Tracker] Restored {len(store.peers)} peer(s), {len(store.names)} channel(s), "
+              f"{replayed} journal record(s) in {(time.monotonic() - started) * 1000:.1f} ms")
+        if replayed:
+            # Gộp phần vừa phát lại vào snapshot, lần khởi động sau nhanh hơn
+            self.snapshot()
+        store.journal = self
+        self.thread = threading.Thread(target=self._run, name="tracker-journal", daemon=True)
+        self.thread.start()
+
+    def append(self, op, fields):
+        """
+        Đưa một thao tác vào hàng chờ ghi; gọi khi đang giữ lock của store.
+
+        :rtype int: số thứ tự của bản ghi, để :meth:`wait`.
+        """
+        with self.lock:
+            self.seq += 1
+            record = {"seq": self.seq, "op": op}
+            record.update(fields)
+            self.pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+            self.work.notify()
+            return self.seq
+
+    def wait(self, seq):
+        """
+        Chờ tới khi bản ghi ``seq`` đã xuống đĩa.
+
+        :raise TrackerError: nếu không ghi được journal.
+        """
+        with self.lock:
+            while self.durable < seq and self.error is None:
+                self.done.wait()
+            if self.durable < seq:
+                raise TrackerError(f"Không ghi được journal: {self.error}", JOURNAL_FAILED)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closing:
+                    self.work.wait()
+                batch, self.pending = self.pending, []
+                last, closing = self.seq, self.closing
+            if batch:
+                # Mọi bản ghi tới trong lúc fsync trước sẽ đi chung lần ghi này
+                try:
+                    self.file.write("".join(batch).encode("utf-8"))
+                    self.file.flush()
+                    if self.fsync:
+                        os.fsync(self.file.fileno())
+                except OSError as e:
+                    print(f"[Tracker] Journal write failed: {e}")
+                    with self.lock:
+                        self.error = e
+                        self.done.notify_all()
+                    return
+                with self.lock:
+                    self.durable = last
+                    self.counters["records"] += len(batch)
+                    self.counters["commits"] += 1
+                    self.done.notify_all()
+                self.since_snapshot += len(batch)
+            if self.since_snapshot >= self.snapshot_every or (closing and self.since_snapshot):
+                try:
+                    self.snapshot()
+                except OSError as e:
+                    # Journal vẫn đầy đủ, lần sau thử lại
+                    print(f"[Tracker] Snapshot failed: {e}")
+            if closing and not batch:
+                return
+
+    def snapshot(self):
+        """
+        Ghi snapshot của store rồi cắt journal (chỉ gọi từ flusher hoặc lúc mở).
+        """
+        with self.store.lock:
+            state = self.store.state()
+            seq = self.seq
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, "state": state}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        # Mọi bản ghi đã nằm trong file đều có seq <= seq, đã có trong snapshot
+        self.file.truncate(0)
+        os.fsync(self.file.fileno())
+        self.since_snapshot = 0
+        with self.lock:
+            self.counters["snapshots"] += 1
+
+    def close(self):
+        """
+        Ghi nốt các bản ghi đang chờ, snapshot nếu cần, rồi đóng journal.
+        """
+        if self.thread is None:
+            return
+        with self.lock:
+            self.closing = True
+            self.work.notify()
+        self.thread.join()
+        self.file.close()
+
+    def stats(self):
+        """
+        :rtype dict: số bản ghi, số lần fsync (commit), số snapshot và seq hiện tại.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["seq"] = self.seq
+            stats["pending"] = len(self.pending)
+        return stats
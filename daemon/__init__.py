@@ -12,9 +12,21 @@
 
 from .backend import create_backend
 from .proxy import create_proxy
+from .asyncproxy import create_async_proxy
 from .weaprous import WeApRous
 from .response import Response
 from .request import Request
 from .backend import create_backend
 from .httpadapter import HttpAdapter
-from .dictionary import CaseInsensitiveDict
\ No newline at end of file
+from .dictionary import CaseInsensitiveDict
+from .cache import ResponseCache
+from .tasks import TaskQueue
+from .ratelimit import RateLimiter
+from .httpcache import HttpCache
+from .coalesce import SingleFlight
+from .retry import RetryPolicy
+from .routing import RoutingTable
+from .reload import ConfigReloader
+from .upstream import RequestQueue
+from .tls import TlsTerminator
+from .tracing import SpanExporter
@@ -0,0 +1,337 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.accesslog
+~~~~~~~~~~~~~~~~~
+
+This module breaks the time of every proxied request down into spans and reports
+them two ways:
+
+- a structured access log, one JSON object per line, written by :class:`AccessLog
+  <AccessLog>`;
+- latency histograms per route and per upstream, kept by :class:`TimingMetrics
+  <TimingMetrics>` and shown on the ``/__proxy/status`` page.
+
+The spans of a :class:`RequestTiming <RequestTiming>`, in milliseconds:
+
+- ``tls``: the TLS handshake, on a listener terminating TLS;
+- ``read``: from the accepted connection (or the handshake) to the parsed request
+  header block;
+- ``route``: resolving the route of the request;
+- ``select``: picking the upstreams, including the wait in the route's queue while
+  they are all at their ``max_conns``;
+- ``connect``: checking a connection out of the pool, opening it if none was idle;
+- ``first_byte``: from the request being sent to the response header block;
+- ``transfer``: relaying the response body to the client;
+- ``total``: the whole request.
+
+``connect`` and ``first_byte`` are those of the attempt whose response was relayed;
+a request that was retried or hedged also logs every upstream it was sent to.
+
+Every entry carries the request's ``trace_id`` and the proxy's ``span_id``, the
+parent of the backend spans (see :mod:`daemon.tracing`), and the request can be
+exported as a span itself with :meth:`RequestTiming.span`.
+
+Usage Example:
+--------------
+>>> timing = RequestTiming("10.0.0.7")
+>>> timing.lap("read")
+>>> ...
+>>> timing.finish(200)
+>>> METRICS.record(timing)
+>>> access_log.write(timing)
+"""
+
+import sys
+import json
+import time
+import threading
+
+from .tracing import Span, new_id, parse_traceparent
+
+#: Upper bounds of the histogram buckets in milliseconds; the last is unbounded.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+              1000, 2500, 5000, 10000, 30000, float("inf"))
+
+#: Spans recorded per route and per upstream.
+ROUTE_SPANS = ("tls", "read", "route", "select", "connect", "first_byte", "transfer", "total")
+UPSTREAM_SPANS = ("connect", "first_byte", "transfer")
+
+
+class RequestTiming:
+    """The :class:`RequestTiming <RequestTiming>` object, the spans and outcome of
+    one client request.
+
+    :attrs spans (dict): span name -> seconds.
+    :attrs tried (list): ``"host:port"`` of every upstream the request was sent to.
+    :attrs upstream (str): the upstream whose response was relayed, or None.
+    :attrs status (int): status code relayed to the client, None if the exchange failed.
+    :attrs trace_id (str): the trace of the request, continued or started by the proxy.
+    :attrs span_id (str): the proxy's span, parent of the backend spans.
+    """
+
+    __slots__ = ("client", "started", "last", "wall", "spans", "method", "host", "target",
+                 "route", "tried", "upstream", "reused", "answered", "status", "bytes",
+                 "trace_id", "span_id", "parent_id", "sampled")
+
+    def __init__(self, client):
+        """
+        :param client (str): the client address.
+        """
+        self.client = client
+        self.started = self.last = time.monotonic()
+        self.wall = time.time()
+        self.spans = {}
+        self.method = self.host = self.target = self.route = None
+        self.tried = []
+        self.upstream = None
+        self.reused = None
+        self.answered = None
+        self.status = None
+        self.bytes = 0
+        self.trace_id = self.span_id = self.parent_id = None
+        self.sampled = True
+
+    def lap(self, name):
+        """
+        Close the span ``name``, which started at the end of the previous one.
+        """
+        now = time.monotonic()
+        self.spans[name] = now - self.last
+        self.last = now
+
+    def add(self, name, seconds):
+        """
+        Add ``seconds`` to the span ``name`` (spans made of several waits).
+        """
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def request(self, request, host):
+        """
+        :param request (ProxyRequest): the parsed client request.
+        :param host (str): the host it was routed by.
+        """
+        self.method = request.method
+        self.target = request.target
+        self.host = host
+
+    def trace(self, traceparent):
+        """
+        Continue the client's trace, or start one, with a new span for the proxy.
+
+        :param traceparent (str): the client's ``traceparent`` header, or None.
+        """
+        context = parse_traceparent(traceparent)
+        if context is None:
+            self.trace_id = new_id(16)
+        else:
+            self.trace_id, self.parent_id, self.sampled = context
+        self.span_id = new_id(8)
+
+    def attempt(self, attempt):
+        """
+        Record the spans of the attempt whose response is relayed.
+
+        :param attempt (Attempt): the winning attempt, its connection not yet released.
+        """
+        self.upstream = attempt.upstream.name
+        self.reused = attempt.conn.requests > 0
+        self.answered = attempt.answered
+        self.spans["connect"] = attempt.conn.acquired - attempt.started
+        self.spans["first_byte"] = attempt.answered - attempt.conn.acquired
+
+    def finish(self, status):
+        """
+        Close the request: the transfer (if a response was relayed) and total spans.
+
+        :param status (int): status code sent to the client, or None.
+        """
+        now = time.monotonic()
+        self.status = status
+        if self.answered is not None:
+            self.spans["transfer"] = now - self.answered
+        self.spans["total"] = now - self.started
+
+    def record(self):
+        """
+        :rtype dict: the access log entry of the request.
+        """
+        return {
+            "time": round(self.wall, 3),
+            "client": self.client,
+            "method": self.method,
+            "host": self.host,
+            "target": self.target,
+            "route": self.route,
+            "status": self.status,
+            "bytes": self.bytes,
+            "upstream": self.upstream,
+            "attempts": len(self.tried),
+            "tried": self.tried,
+            "reused": self.reused,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "ms": {name: round(seconds * 1000, 3) for name, seconds in self.spans.items()},
+        }
+
+    def span(self):
+        """
+        :rtype Span: the finished request as a ``SERVER`` span, its timing spans
+                     as tags.
+        """
+        span = Span(f"{self.method} {self.route or '-'}", self.trace_id, self.parent_id,
+                    "SERVER", self.started, self.span_id)
+        span.finish(self.started + self.spans["total"])
+        span.tags.update({"http.method": self.method, "http.host": self.host,
+                          "http.target": self.target, "http.client_ip": self.client,
+                          "http.status_code": self.status, "upstream": self.upstream,
+                          "attempts": len(self.tried)})
+        span.tags.update((f"proxy.{name}_ms", round(seconds * 1000, 3))
+                         for name, seconds in self.spans.items())
+        return span
+
+
+class Histogram:
+    """Counts of durations in the fixed :data:`BUCKETS_MS` buckets, enough to
+    estimate quantiles without keeping samples. Not locked itself; see
+    :class:`TimingMetrics <TimingMetrics>`.
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms):
+        index = 0
+        while ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+
+    def quantile(self, q):
+        """
+        :rtype float: upper bound of the bucket holding the ``q`` quantile, None if
+                      it is the unbounded one or the histogram is empty.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float("inf") else None
+        return None
+
+    def stats(self):
+        """
+        :rtype dict: count, mean, quantile estimates and non-empty buckets.
+        """
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {("+inf" if bound == float("inf") else str(bound)): count
+                        for bound, count in zip(BUCKETS_MS, self.counts) if count},
+        }
+
+
+class TimingMetrics:
+    """The :class:`TimingMetrics <TimingMetrics>` object, span histograms and
+    counters per route and per upstream of the whole process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.upstreams = {}
+
+    def _group(self, groups, name, spans):
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = {"requests": 0, "retried": 0, "status": {},
+                                    "spans": {span: Histogram() for span in spans}}
+        return group
+
+    def record(self, timing):
+        """
+        Fold the spans of a finished request into its route and upstream.
+
+        :param timing (RequestTiming): the finished request.
+        """
+        status = f"{timing.status // 100}xx" if timing.status else "failed"
+        with self.lock:
+            groups = [(self._group(self.routes, timing.route or "-", ROUTE_SPANS), ROUTE_SPANS)]
+            if timing.upstream is not None:
+                groups.append((self._group(self.upstreams, timing.upstream, UPSTREAM_SPANS),
+                               UPSTREAM_SPANS))
+            for group, spans in groups:
+                group["requests"] += 1
+                if len(timing.tried) > 1:
+                    group["retried"] += 1
+                group["status"][status] = group["status"].get(status, 0) + 1
+                for span in spans:
+                    seconds = timing.spans.get(span)
+                    if seconds is not None:
+                        group["spans"][span].observe(seconds * 1000)
+
+    def stats(self):
+        """
+        :rtype dict: ``{"routes": ..., "upstreams": ...}`` with the counters and
+                     histogram figures of each.
+        """
+        def export(groups):
+            return {name: {"requests": group["requests"], "retried": group["retried"],
+                           "status": dict(group["status"]),
+                           "spans": {span: histogram.stats()
+                                     for span, histogram in group["spans"].items()
+                                     if histogram.count}}
+                    for name, group in groups.items()}
+
+        with self.lock:
+            return {"routes": export(self.routes), "upstreams": export(self.upstreams)}
+
+
+#: Timings of every request served by this process.
+METRICS = TimingMetrics()
+
+
+class AccessLog:
+    """The :class:`AccessLog <AccessLog>` object, a JSON-lines access log.
+
+    :attrs path (str): the log file, ``"-"`` for the standard output.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Line buffered: every entry reaches the file as soon as it is written
+        self.stream = sys.stdout if path == "-" else open(path, "a", buffering=1)
+
+    def write(self, timing):
+        """
+        :param timing (RequestTiming): the finished request.
+        """
+        line = json.dumps(timing.record(), separators=(",", ":")) + "\n"
+        with self.lock:
+            self.stream.write(line)
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
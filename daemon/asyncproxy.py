@@ -0,0 +1,902 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.asyncproxy
+~~~~~~~~~~~~~~~~~
+
+This module implements the asyncio engine of the proxy. One event loop serves every
+client connection, so an idle or slow connection costs a coroutine instead of a
+blocked thread.
+
+It takes the same ``routes`` as :func:`daemon.proxy.create_proxy`, compiled into the
+same :class:`RoutingTable <RoutingTable>`, and shares the balancing policies, the upstream health state (circuit breakers and active health
+checks), the per-host :class:`RetryPolicy <RetryPolicy>` and the ``/__proxy/status``
+page. Upstream connections are pooled per upstream like in the threaded engine, in a
+separate :class:`AsyncConnectionPool <AsyncConnectionPool>`.
+
+Every stage of an exchange has its own timeout (:class:`Timeouts <Timeouts>`):
+
+- connect: establishing a new upstream connection;
+- first_byte: from the request being sent until the response header block arrived;
+- idle: longest silence of a peer while a request or response is relayed, and the
+  time a client has to send its request header block.
+
+A connect or first byte timeout answers ``504 Gateway Timeout`` and counts as a
+failure of the upstream. Requests waiting for a slot of upstreams at their
+``max_conns`` wait on the loop, like the threaded engine's waiting threads.
+
+Notes:
+------
+- The shared HTTP cache and single-flight are only available in the threaded engine.
+- SIGTERM/SIGINT drain in-flight connections, SIGUSR2 hands the listening socket to
+  a new process first, as in :mod:`daemon.lifecycle`; SIGHUP reloads the routes when
+  a :class:`ConfigReloader <ConfigReloader>` is given.
+
+Usage Example:
+--------------
+>>> routes = {"app1.local": ("127.0.0.1:9001", "round-robin")}
+>>> create_async_proxy("0.0.0.0", 8080, routes, timeouts=Timeouts(first_byte=10))
+"""
+
+import time
+import signal
+import asyncio
+
+from .proxy import (ProxyRequest, Attempt, NoUpstream, Saturated, upstream_head, retryable,
+                    forward_headers, proxy_status, status_response, NOT_FOUND, BAD_GATEWAY,
+                    SERVICE_UNAVAILABLE, STATUS_PATH)
+from .upstream import UPSTREAMS, SLOT_WAITERS, CONNECT_TIMEOUT, IO_TIMEOUT, POOL_IDLE_TIMEOUT
+from .routing import RoutingTable, compile_routes
+from .accesslog import RequestTiming, METRICS
+from .tracing import TRACEPARENT
+from .health import HealthChecker
+from .lifecycle import create_listener, spawn_successor, DRAIN_TIMEOUT, ACCEPT_POLL
+from .framing import (MAX_HEAD, BUFSIZE, parse_head, parse_status, request_framing,
+                      response_framing, rewrite_head)
+
+#: Listen backlog of the asyncio engine, sized for many concurrent clients.
+BACKLOG = 1024
+
+# Backend không trả lời kịp (kết nối hoặc byte đầu tiên)
+GATEWAY_TIMEOUT = (
+    "HTTP/1.1 504 Gateway Timeout\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 19\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "504 Gateway Timeout"
+).encode('utf-8')
+
+
+class Timeouts:
+    """The per-stage timeouts of the asyncio engine, in seconds.
+
+    :attrs connect (float): establishing an upstream connection.
+    :attrs first_byte (float): waiting for the response header block.
+    :attrs idle (float): longest silence while relaying, and the client's header read.
+    """
+
+    __slots__ = ("connect", "first_byte", "idle")
+
+    def __init__(self, connect=CONNECT_TIMEOUT, first_byte=IO_TIMEOUT, idle=IO_TIMEOUT):
+        self.connect = connect
+        self.first_byte = first_byte
+        self.idle = idle
+
+
+class StageTimeout(ConnectionError):
+    """A stage of an exchange did not complete within its timeout."""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} timeout after {timeout}s")
+        self.stage = stage
+
+
+#: Errors that end an upstream attempt or a relay.
+FAILURES = (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError)
+
+
+async def within(stage, timeout, awaitable):
+    """
+    Await ``awaitable`` for at most ``timeout`` seconds.
+
+    :raises StageTimeout: naming ``stage`` if the timeout expires.
+    """
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeout(stage, timeout) from None
+
+
+class AsyncHttpReader:
+    """The :class:`AsyncHttpReader <AsyncHttpReader>` object, the asyncio counterpart of
+    :class:`HttpReader <HttpReader>` on an ``asyncio.StreamReader``.
+
+    :attrs stream (asyncio.StreamReader): the connection to read from.
+    :attrs buf (bytearray): received bytes not consumed yet.
+    """
+
+    def __init__(self, stream, bufsize=BUFSIZE):
+        self.stream = stream
+        self.bufsize = bufsize
+        self.buf = bytearray()
+
+    async def _fill(self, timeout):
+        data = await within("idle", timeout, self.stream.read(self.bufsize))
+        if not data:
+            return False
+        self.buf += data
+        return True
+
+    async def _read_head(self, limit):
+        while True:
+            end = self.buf.find(b"\r\n\r\n")
+            if end >= 0:
+                head = bytes(self.buf[:end + 4])
+                del self.buf[:end + 4]
+                return head
+            if len(self.buf) > limit:
+                raise ValueError("HTTP header block too large")
+            data = await self.stream.read(self.bufsize)
+            if not data:
+                if self.buf:
+                    raise ValueError("Connection closed inside HTTP header")
+                return None
+            self.buf += data
+
+    async def read_head(self, stage, timeout, limit=MAX_HEAD):
+        """
+        Read the start line and headers of the next message.
+
+        :param stage (str): stage name reported if the header is late.
+        :param timeout (float): seconds allowed for the whole header block.
+        :param limit (int): largest accepted header block.
+
+        :rtype bytes: the header block including the final blank line, or None if
+                      the peer closed the connection before sending anything.
+        """
+        return await within(stage, timeout, self._read_head(limit))
+
+    async def _read_line(self, timeout, limit=8192):
+        while True:
+            end = self.buf.find(b"\r\n")
+            if end >= 0:
+                line = bytes(self.buf[:end + 2])
+                del self.buf[:end + 2]
+                return line
+            if len(self.buf) > limit:
+                raise ValueError("HTTP chunk line too long")
+            if not await self._fill(timeout):
+                raise ConnectionError("Connection closed inside chunked body")
+
+    async def _iter_length(self, remaining, timeout):
+        while remaining > 0:
+            if not self.buf and not await self._fill(timeout):
+                raise ConnectionError("Connection closed before end of body")
+            take = min(remaining, len(self.buf), self.bufsize)
+            chunk = bytes(self.buf[:take])
+            del self.buf[:take]
+            remaining -= take
+            yield chunk
+
+    async def _iter_chunked(self, timeout):
+        while True:
+            line = await self._read_line(timeout)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ValueError(f"Invalid chunk size line {line!r}")
+            yield line
+            if size == 0:
+                while True:
+                    line = await self._read_line(timeout)
+                    yield line
+                    if line == b"\r\n":
+                        return
+            async for chunk in self._iter_length(size + 2, timeout):
+                yield chunk
+
+    async def _iter_eof(self, timeout):
+        if self.buf:
+            chunk = bytes(self.buf)
+            self.buf.clear()
+            yield chunk
+        while await self._fill(timeout):
+            chunk = bytes(self.buf)
+            self.buf.clear()
+            yield chunk
+
+    async def _iter_none(self):
+        return
+        yield
+
+    def iter_body(self, framing, timeout):
+        """
+        :param framing (tuple): ``(kind, length)`` of the current message.
+        :param timeout (float): idle timeout of each read.
+
+        :rtype async iterator: raw body chunks, see :meth:`HttpReader.iter_body`.
+        """
+        kind, length = framing
+        if kind == "length":
+            return self._iter_length(length, timeout)
+        if kind == "chunked":
+            return self._iter_chunked(timeout)
+        if kind == "eof":
+            return self._iter_eof(timeout)
+        return self._iter_none()
+
+
+class AsyncConnection:
+    """One persistent asyncio connection to an upstream."""
+
+    __slots__ = ("reader", "writer", "created", "last_used", "acquired", "requests")
+
+    def __init__(self, stream, writer):
+        self.reader = AsyncHttpReader(stream)
+        self.writer = writer
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.acquired = self.created
+        self.requests = 0
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """The :class:`AsyncConnectionPool <AsyncConnectionPool>` object, the idle
+    asyncio connections to one upstream. Same rules and counters as
+    :class:`ConnectionPool <ConnectionPool>`; only used from the event loop thread,
+    so it needs no lock.
+    """
+
+    def __init__(self, host, port, max_idle=16, max_age=60.0, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.closed = False
+        self.counters = {"created": 0, "reused": 0, "expired": 0,
+                         "stale": 0, "discarded": 0, "pooled": 0}
+
+    async def acquire(self, connect_timeout):
+        """
+        Check out a healthy idle connection, or open a new one.
+
+        :param connect_timeout (float): seconds allowed to open a new connection.
+
+        :rtype AsyncConnection: a connection ready for a request.
+        """
+        while self.idle:
+            conn = self.idle.pop()
+            now = time.monotonic()
+            if now - conn.created > self.max_age or now - conn.last_used > self.idle_timeout:
+                self.counters["expired"] += 1
+                conn.close()
+                continue
+            # The event loop kept reading the idle socket: EOF means the backend closed it
+            if conn.writer.is_closing() or conn.reader.stream.at_eof():
+                self.counters["stale"] += 1
+                conn.close()
+                continue
+            self.counters["reused"] += 1
+            return conn
+        stream, writer = await within("connect", connect_timeout,
+                                      asyncio.open_connection(self.host, self.port))
+        self.counters["created"] += 1
+        return AsyncConnection(stream, writer)
+
+    def release(self, conn, reusable):
+        """
+        Return a connection after a complete exchange.
+
+        :param conn (AsyncConnection): the connection.
+        :param reusable (bool): whether the response allowed keep-alive and was fully read.
+        """
+        conn.requests += 1
+        now = time.monotonic()
+        if (not reusable or self.closed or conn.reader.buf or now - conn.created > self.max_age
+                or len(self.idle) >= self.max_idle):
+            self.discard(conn)
+            return
+        conn.last_used = now
+        self.idle.append(conn)
+        self.counters["pooled"] += 1
+
+    def discard(self, conn):
+        """
+        Close a connection that must not be reused.
+
+        :param conn (AsyncConnection): the connection.
+        """
+        self.counters["discarded"] += 1
+        conn.close()
+
+    def close_all(self):
+        """
+        Close every idle connection and stop pooling new ones.
+        """
+        self.closed = True
+        idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """
+        :rtype dict: pool counters and current idle count.
+        """
+        snapshot = dict(self.counters)
+        snapshot["idle"] = len(self.idle)
+        return snapshot
+
+
+#: asyncio connection pools of this process, keyed by upstream ``"host:port"``.
+POOLS = {}
+
+
+def pool_of(upstream):
+    """
+    :param upstream (Upstream): the backend.
+
+    :rtype AsyncConnectionPool: its asyncio connection pool, created on first use.
+    """
+    pool = POOLS.get(upstream.name)
+    if pool is None:
+        pool = POOLS[upstream.name] = AsyncConnectionPool(upstream.host, upstream.port)
+    return pool
+
+
+def retire_pool(name):
+    """
+    Close the idle connections of a retired upstream and forget its pool.
+
+    :param name (str): ``"host:port"`` of the upstream.
+    """
+    pool = POOLS.pop(name, None)
+    if pool is not None:
+        pool.close_all()
+
+
+async def read_request(reader, timeouts):
+    """
+    Reads the header block of the next client request, see
+    :func:`daemon.proxy.read_request`.
+
+    :params reader (AsyncHttpReader): reader on the client connection.
+    :params timeouts (Timeouts): the engine's timeouts.
+
+    :rtype ProxyRequest: the request, or None if the client sent nothing.
+    """
+    head = await reader.read_head("request header", timeouts.idle)
+    if head is None:
+        return None
+    start_line, headers = parse_head(head)
+    try:
+        method, target, version = start_line.split(" ", 2)
+    except ValueError:
+        raise ValueError(f"Invalid request line {start_line!r}")
+    framing = request_framing(headers)
+    body = None
+    if framing[0] == "none":
+        body = b""
+    elif framing[0] == "length" and framing[1] <= BUFSIZE:
+        body = b"".join([chunk async for chunk in reader.iter_body(framing, timeouts.idle)])
+    return ProxyRequest(head, method, target, version, headers, framing, reader, body)
+
+
+async def send(writer, data, timeouts):
+    """
+    Write ``data`` and wait until the peer accepted it (backpressure).
+    """
+    writer.write(data)
+    await within("idle", timeouts.idle, writer.drain())
+
+
+async def start_exchange(pool, head, request, timeouts):
+    """
+    Sends a request over a pooled connection and reads the response header block,
+    see :func:`daemon.proxy.start_exchange`.
+
+    :rtype tuple: (conn, resp_head, version, status, headers, framing).
+    """
+    while True:
+        conn = await pool.acquire(timeouts.connect)
+        conn.acquired = time.monotonic()
+        reused = conn.requests > 0
+        try:
+            conn.writer.write(head)
+            if request.body:
+                conn.writer.write(request.body)
+            elif request.body is None:
+                async for chunk in request.reader.iter_body(request.framing, timeouts.idle):
+                    await send(conn.writer, chunk, timeouts)
+            await within("idle", timeouts.idle, conn.writer.drain())
+            resp_head = await conn.reader.read_head("first byte", timeouts.first_byte)
+            if resp_head is None:
+                raise ConnectionError("upstream closed the connection")
+            status_line, headers = parse_head(resp_head)
+            version, status = parse_status(status_line)
+        except FAILURES as e:
+            pool.discard(conn)
+            # A late answer is the backend being slow, not a stale connection
+            if reused and request.replayable and not isinstance(e, StageTimeout):
+                continue
+            raise
+        except asyncio.CancelledError:
+            pool.discard(conn)
+            raise
+        framing = response_framing(request.method, status, headers)
+        return conn, resp_head, version, status, headers, framing
+
+
+async def send_attempt(upstream, head, request, timeouts):
+    """
+    Sends a request to one upstream and waits for the response header block, with
+    the load and health accounting of the upstream.
+
+    :rtype Attempt: the answered attempt.
+    """
+    pool = pool_of(upstream)
+    started = upstream.begin()
+    try:
+        conn, resp_head, version, status, headers, framing = await start_exchange(
+            pool, head, request, timeouts)
+    except FAILURES:
+        upstream.end(False)
+        raise
+    except asyncio.CancelledError:
+        # A hedge that lost the race
+        upstream.end(None)
+        raise
+    upstream.observe(started)
+    return Attempt(upstream, pool, started, conn, resp_head, version, status, headers, framing)
+
+
+async def acquire_upstream(route, request, client_ip, exclude=()):
+    """
+    Reserves a connection slot on an upstream of the route, waiting in the route's
+    queue while every upstream is at its ``max_conns``, see
+    :func:`daemon.proxy.acquire_upstream`.
+
+    :rtype Upstream: the reserved upstream, or None if every one is ejected or excluded.
+
+    :raises Saturated: if the request cannot wait for a slot.
+    """
+    upstream = route.reserve(request, client_ip, exclude)
+    if upstream is not None or exclude or not route.busy():
+        return upstream
+    waitlist = route.queue
+    if waitlist is None or not waitlist.enter():
+        raise Saturated()
+    loop = asyncio.get_running_loop()
+    freed = asyncio.Event()
+
+    def wake():
+        # Slots are also freed from other threads (health checks, reloads), and
+        # asyncio.Event is not thread-safe: set it from the loop
+        try:
+            loop.call_soon_threadsafe(freed.set)
+        except RuntimeError:
+            pass  # loop closed
+
+    deadline = loop.time() + waitlist.timeout
+    served = False
+    SLOT_WAITERS.add(wake)
+    try:
+        while True:
+            freed.clear()
+            upstream = route.reserve(request, client_ip)
+            if upstream is not None or not route.busy():
+                served = True
+                return upstream
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise Saturated()
+            try:
+                await asyncio.wait_for(freed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        SLOT_WAITERS.discard(wake)
+        waitlist.leave(served)
+
+
+async def open_response(request, head, select_upstream, policy, timeouts):
+    """
+    Sends a request and returns the first usable response, retrying and hedging
+    idempotent requests as allowed by the host's :class:`RetryPolicy <RetryPolicy>`,
+    see :func:`daemon.proxy.open_response`. Attempts still running when a winner is
+    chosen are cancelled.
+
+    :rtype Attempt: the winning attempt, or the last retryable response.
+
+    :raises NoUpstream: if no upstream could be selected at all.
+    """
+    if policy is None or not policy.allows(request):
+        upstream = await select_upstream(())
+        if upstream is None:
+            raise NoUpstream()
+        return await send_attempt(upstream, head, request, timeouts)
+
+    policy.count("requests")
+    policy.budget.deposit()
+    delay = policy.hedge_delay()
+    tried, pending = [], set()
+
+    async def launch(counter):
+        if len(tried) > policy.retries:
+            return False
+        upstream = await select_upstream(tried)
+        if upstream is None:
+            return False
+        if tried:
+            if not policy.budget.withdraw():
+                upstream.release()
+                return False
+            policy.count(counter)
+        tried.append(upstream.name)
+        # The task starts before this coroutine next awaits, so a cancelled
+        # attempt always gives its slot back in send_attempt
+        pending.add(asyncio.ensure_future(send_attempt(upstream, head, request, timeouts)))
+        return True
+
+    if not await launch(None):
+        raise NoUpstream()
+    hedged, winner, fallback, error = False, None, None, None
+    try:
+        while pending and winner is None:
+            done, _ = await asyncio.wait(pending, timeout=None if hedged else delay,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                await launch("hedges")
+                continue
+            for task in done:
+                pending.discard(task)
+                try:
+                    attempt = task.result()
+                except FAILURES as e:
+                    error = e
+                    continue
+                policy.observe(attempt.upstream, time.monotonic() - attempt.started)
+                if winner is not None:
+                    attempt.close()
+                elif not retryable(policy, attempt):
+                    winner = attempt
+                else:
+                    # Keep the error response in case no retry is possible
+                    if fallback is not None:
+                        fallback.close(False)
+                    fallback = attempt
+            if winner is None and not pending:
+                await launch("retries")
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if winner is not None:
+        if fallback is not None:
+            fallback.close(False)
+        if hedged and winner.upstream.name != tried[0]:
+            policy.count("hedge_wins")
+        return winner
+    if fallback is not None:
+        return fallback
+    if error is not None:
+        raise error
+    raise NoUpstream()
+
+
+async def forward_request(request, client, select_upstream, policy, timeouts, timing=None):
+    """
+    Forwards an HTTP request to a backend server and streams the response back one
+    buffer at a time, waiting for the client to accept each one.
+
+    :params request (ProxyRequest): incoming HTTP request.
+    :params client (asyncio.StreamWriter): client connection.
+    :params select_upstream (callable): ``await select_upstream(exclude)`` returns the
+                                        reserved Upstream to use, or None.
+    :params policy (RetryPolicy): the host's retry policy, or None.
+    :params timeouts (Timeouts): the engine's timeouts.
+    :params timing (RequestTiming): receives the spans of the relayed attempt, or None.
+
+    :rtype int: status code relayed to the client, or None if the backend failed.
+    """
+    try:
+        attempt = await open_response(request, upstream_head(request), select_upstream,
+                                      policy, timeouts)
+    except NoUpstream:
+        await send(client, SERVICE_UNAVAILABLE, timeouts)
+        return 503
+    except StageTimeout as e:
+        print(f"[Proxy] Upstream {e}")
+        await send(client, GATEWAY_TIMEOUT, timeouts)
+        return 504
+    except FAILURES as e:
+        print("Socket error: {}".format(e))
+        await send(client, BAD_GATEWAY, timeouts)
+        return None
+
+    if timing is not None:
+        timing.attempt(attempt)
+    sent = 0
+    try:
+        await send(client, rewrite_head(attempt.head, {"Connection": "close"}), timeouts)
+        async for chunk in attempt.conn.reader.iter_body(attempt.framing, timeouts.idle):
+            await send(client, chunk, timeouts)
+            sent += len(chunk)
+    except FAILURES as e:
+        print("Socket error: {}".format(e))
+        # The backend answered; a relay error is not held against it
+        attempt.close(attempt.ok)
+        return None
+    except asyncio.CancelledError:
+        attempt.close()
+        raise
+    finally:
+        if timing is not None:
+            timing.bytes = sent
+    attempt.finish()
+    return attempt.status
+
+
+def async_status(table=None, tls=None):
+    """
+    :rtype dict: :func:`daemon.proxy.proxy_status` with the asyncio pool figures.
+    """
+    status = proxy_status(table=table, tls=tls)
+    for name, pool in list(POOLS.items()):
+        if name in status["upstreams"]:
+            status["upstreams"][name]["pool"] = pool.stats()
+    return status
+
+
+async def handle_client(ip, port, table, timeouts, stream, writer, access_log=None, tls=None,
+                        tracer=None):
+    """
+    Handles an individual client connection, see :func:`daemon.proxy.handle_client`.
+
+    :params ip (str): IP address of the proxy server.
+    :params port (int): port number of the proxy server.
+    :params table (RoutingTable): the compiled routes.
+    :params timeouts (Timeouts): the engine's timeouts.
+    :params stream (asyncio.StreamReader): client connection, read side.
+    :params writer (asyncio.StreamWriter): client connection, write side.
+    :params access_log (AccessLog): where finished requests are logged, or None.
+    :params tls (TlsTerminator): the TLS contexts of the listener, or None; the
+                                 event loop has already performed the handshake.
+    :params tracer (SpanExporter): where the span of the request goes, or None.
+    """
+    addr = writer.get_extra_info("peername")
+    timing, status = RequestTiming(addr[0]), None
+    try:
+        try:
+            request = await read_request(AsyncHttpReader(stream), timeouts)
+        except FAILURES as e:
+            print(f"Error receiving from {addr}: {e}")
+            return
+        if request is None:
+            return
+
+        if request.target == STATUS_PATH and addr[0] in ("127.0.0.1", "::1"):
+            await send(writer, status_response(async_status(table, tls)), timeouts)
+            return
+
+        timing.lap("read")
+        hostname = request.headers.get('host', '') or f"{ip}:{port}"
+        timing.request(request, hostname)
+        timing.trace(request.headers.get(TRACEPARENT))
+        request.forward = forward_headers(request, addr[0], timing,
+                                          "https" if tls is not None else "http")
+        route = table.resolve(hostname, request.target)
+        timing.lap("route")
+        if route is None:
+            await send(writer, NOT_FOUND, timeouts)
+            status = 404
+            return
+        timing.route = route.name
+
+        async def select_upstream(exclude=()):
+            started = time.monotonic()
+            try:
+                upstream = await acquire_upstream(route, request, addr[0], exclude)
+            finally:
+                timing.add("select", time.monotonic() - started)
+            if upstream is not None:
+                timing.tried.append(upstream.name)
+            return upstream
+
+        status = await forward_request(request, writer, select_upstream, route.retry, timeouts,
+                                       timing)
+    except FAILURES as e:
+        print(f"Error sending to {addr}: {e}")
+    finally:
+        writer.close()
+        # Connections that sent no request or asked for the status page are not logged
+        if timing.method is not None:
+            timing.finish(status)
+            METRICS.record(timing)
+            if access_log is not None:
+                access_log.write(timing)
+            if tracer is not None and timing.sampled:
+                tracer.export([timing.span()])
+
+
+class AsyncProxy:
+    """The :class:`AsyncProxy <AsyncProxy>` object, the accept loop and shutdown state
+    of the asyncio engine.
+
+    :attrs drain_timeout (float): seconds granted to in-flight connections at shutdown.
+    :attrs clients (set): tasks of the connections being served.
+    """
+
+    def __init__(self, ip, port, table, drain_timeout=DRAIN_TIMEOUT, timeouts=None,
+                 reloader=None, access_log=None, tls=None, tracer=None):
+        self.ip = ip
+        self.port = port
+        self.table = table
+        self.reloader = reloader
+        self.access_log = access_log
+        self.tls = tls
+        self.tracer = tracer
+        self.drain_timeout = drain_timeout
+        self.timeouts = timeouts or Timeouts()
+        self.clients = set()
+        self.listener = None
+        self.stopping = None
+        self.force = False
+
+    async def _client(self, stream, writer):
+        task = asyncio.current_task()
+        self.clients.add(task)
+        try:
+            if self.tls is not None:
+                self.tls.count(writer.get_extra_info("ssl_object"))
+            table = self.reloader.table if self.reloader is not None else self.table
+            await handle_client(self.ip, self.port, table, self.timeouts, stream, writer,
+                                self.access_log, self.tls, self.tracer)
+        finally:
+            self.clients.discard(task)
+
+    def _on_stop(self, signum):
+        if self.stopping.is_set():
+            print("[Proxy] Second stop signal, abandoning drain")
+            self.force = True
+            return
+        print(f"[Proxy] Signal {signum} received, shutting down gracefully")
+        self.stopping.set()
+
+    def _on_restart(self):
+        if self.stopping.is_set():
+            return
+        try:
+            spawn_successor("Proxy", self.listener)
+        except OSError as e:
+            print(f"[Proxy] Restart failed, keep serving: {e}")
+            return
+        self.stopping.set()
+
+    def install_signals(self, loop):
+        """
+        Install the shutdown and restart signal handlers on the event loop.
+        """
+        loop.add_signal_handler(signal.SIGTERM, self._on_stop, signal.SIGTERM)
+        loop.add_signal_handler(signal.SIGINT, self._on_stop, signal.SIGINT)
+        if hasattr(signal, "SIGUSR2"):
+            loop.add_signal_handler(signal.SIGUSR2, self._on_restart)
+        if self.reloader is not None and hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, self.reloader.request)
+            # Retired upstreams' pools belong to the loop, close them from it
+            self.reloader.on_retire.append(
+                lambda upstream: loop.call_soon_threadsafe(retire_pool, upstream.name))
+
+    async def serve(self):
+        """
+        Accept and serve connections until a stop or restart signal, then drain.
+        """
+        self.stopping = asyncio.Event()
+        self.listener = create_listener(self.ip, self.port, BACKLOG)
+        if self.tls is not None:
+            # The loop runs the handshakes, interleaved with the other connections
+            server = await asyncio.start_server(
+                self._client, sock=self.listener, ssl=self.tls.context,
+                ssl_handshake_timeout=self.tls.handshake_timeout)
+        else:
+            server = await asyncio.start_server(self._client, sock=self.listener)
+        self.install_signals(asyncio.get_running_loop())
+        print(f"[Proxy] Listening on IP {self.ip} port {self.port} (asyncio engine"
+              + (", TLS)" if self.tls else ")"))
+        try:
+            await self.stopping.wait()
+        finally:
+            server.close()
+            await self.drain()
+            for pool in POOLS.values():
+                pool.close_all()
+
+    async def drain(self):
+        """
+        Wait for the in-flight connections, at most ``drain_timeout`` seconds, then
+        cancel the rest.
+
+        :rtype bool: True if every connection finished in time.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        if self.clients:
+            print(f"[Proxy] Draining {len(self.clients)} in-flight connection(s)")
+        while self.clients and not self.force and loop.time() < deadline:
+            await asyncio.wait(set(self.clients),
+                               timeout=min(ACCEPT_POLL, deadline - loop.time()))
+        left = list(self.clients)
+        if left:
+            print(f"[Proxy] Drain deadline reached, {len(left)} connection(s) cut off")
+            for task in left:
+                task.cancel()
+            await asyncio.gather(*left, return_exceptions=True)
+            return False
+        print("[Proxy] All connections drained")
+        return True
+
+
+def create_async_proxy(ip, port, routes, drain_timeout=DRAIN_TIMEOUT, health_check="tcp",
+                       health_interval=5.0, retries=None, timeouts=None, reloader=None,
+                       access_log=None, tls=None, tracer=None):
+    """
+    Entry point for launching the proxy server with the asyncio engine.
+
+    :params ip (str): IP address to bind the proxy server.
+    :params port (int): port number to listen on.
+    :params routes (dict): dictionary mapping hostnames and location, or a RoutingTable.
+    :params drain_timeout (float): seconds to drain in-flight requests at shutdown.
+    :params health_check (str): ``"tcp"``, an HTTP path to probe, or None to disable.
+    :params health_interval (float): seconds between two health check rounds.
+    :params retries (dict): ``host`` or ``host/prefix`` -> RetryPolicy of the routes
+                            with retries enabled.
+    :params timeouts (Timeouts): connect, first byte and idle timeouts.
+    :params reloader (ConfigReloader): reloads the routes on SIGHUP or file change.
+    :params access_log (AccessLog): JSON access log of the requests, or None.
+    :params tls (TlsTerminator): terminates TLS on the listener, or None for plain HTTP.
+    :params tracer (SpanExporter): exports a span per request, or None.
+    """
+    checker = None
+    try:
+        table = routes
+        if reloader is not None:
+            table = reloader.table
+            reloader.start()
+        elif not isinstance(routes, RoutingTable):
+            table = compile_routes(routes, retries=retries)
+        if health_check:
+            checker = HealthChecker(UPSTREAMS, health_interval,
+                                    None if health_check == "tcp" else health_check)
+            checker.start()
+        proxy = AsyncProxy(ip, port, table, drain_timeout, timeouts, reloader, access_log, tls,
+                           tracer)
+        asyncio.run(proxy.serve())
+    except OSError as e:
+        print(f"Socket error: {e}")
+    except KeyboardInterrupt:
+        print("\n[Proxy] Server shutting down.")
+    finally:
+        if checker is not None:
+            checker.stop()
+        if reloader is not None:
+            reloader.stop()
+        if access_log is not None:
+            access_log.close()
+        if tracer is not None:
+            tracer.close()
@@ -23,6 +23,7 @@ Requirements:
 --------------
 - socket: provide socket networking interface.
 - threading: Enables concurrent client handling via threads.
+- lifecycle: listening socket hand-off and graceful shutdown.
 - response: response utilities.
 - httpadapter: the class for handling HTTP requests.
 - CaseInsensitiveDict: provides dictionary for managing headers or routes.
@@ -30,9 +31,19 @@ Requirements:
 
 Notes:
 ------
-- The server create daemon threads for client handling.
+- The server create daemon threads for client handling; they are tracked and joined
+  on shutdown (SIGTERM/SIGINT) up to a drain deadline, see :mod:`daemon.lifecycle`.
+- SIGUSR2 restarts the server without refusing connections by handing the listening
+  socket over to a new process.
 - The current implementation error handling is minimal, socket errors are printed to the console.
 - The actual request processing is delegated to the HttpAdapter class.
+- An optional :class:`RateLimiter <RateLimiter>` admits each connection before the
+  request is read, answering ``429`` with ``Retry-After`` when a client IP exceeds
+  its rate or concurrent connection cap.
+- An optional :class:`SpanExporter <SpanExporter>` traces every request, continuing
+  the ``traceparent`` propagated by the proxy (see :mod:`daemon.tracing`).
+- Connections are persistent (HTTP keep-alive): the proxy's upstream pool reuses
+  them for further requests, each of which is charged to the client's rate bucket.
 
 Usage Example:
 --------------
@@ -47,8 +58,9 @@ import argparse
 from .response import *
 from .httpadapter import HttpAdapter
 from .dictionary import CaseInsensitiveDict
+from .lifecycle import create_listener, ServerLifecycle, DRAIN_TIMEOUT
 
-def handle_client(ip, port, conn, addr, routes):
+def handle_client(ip, port, conn, addr, routes, limiter=None, tracer=None, keep_alive=None):
     """
     Initializes an HttpAdapter instance and delegates the client handling logic to it.
 
@@ -57,9 +69,13 @@ def handle_client(ip, port, conn, addr, routes):
     :param conn (socket.socket): Client connection socket.
     :param addr (tuple): client address (IP, port).
     :param routes (dict): Dictionary of route handlers.
+    :param limiter (RateLimiter): limiter that admitted the connection, released on exit.
+    :param tracer (SpanExporter): where the spans of the request go, or None.
+    :param keep_alive (callable): False once the server stops accepting; None closes
+                                  the connection after one request.
     """
     try:
-        daemon = HttpAdapter(ip, port, conn, addr, routes)
+        daemon = HttpAdapter(ip, port, conn, addr, routes, tracer, limiter, keep_alive)
         # Handle client
         daemon.handle_client(conn, addr, routes)
     except Exception as e:
@@ -68,30 +84,62 @@ def handle_client(ip, port, conn, addr, routes):
         # Đảm bảo socket được đóng sau khi xử lý xong
         if conn:
             conn.close()
+        if limiter is not None:
+            limiter.release(addr[0])
 
-def run_backend(ip, port, routes):
+def reject_client(conn, addr, retry_after):
+    """
+    Answers a connection refused by the rate limiter with 429 and closes it,
+    without reading or parsing the request.
+
+    :param conn (socket.socket): Client connection socket.
+    :param addr (tuple): client address (IP, port).
+    :param retry_after (int): seconds advertised in the Retry-After header.
+    """
+    try:
+        conn.settimeout(1.0)
+        conn.sendall(Response().build_too_many_requests(retry_after))
+    except socket.error:
+        pass
+    finally:
+        conn.close()
+
+def run_backend(ip, port, routes, limiter=None, drain_timeout=DRAIN_TIMEOUT, tracer=None):
     """
     Starts the backend server, binds to the specified IP and port, and listens for incoming
     connections. Each connection is handled in a separate thread. The backend accepts incoming
     connections and spawns a thread for each client.
 
+    SIGTERM/SIGINT stop accepting and let in-flight requests finish within ``drain_timeout``
+    seconds; SIGUSR2 hands the listening socket to a freshly started process first.
 
     :param ip (str): IP address to bind the server.
     :param port (int): Port number to listen on.
     :param routes (dict): Dictionary of route handlers.
+    :param limiter (RateLimiter): optional per-client admission control.
+    :param drain_timeout (float): seconds granted to in-flight requests at shutdown.
+    :param tracer (SpanExporter): exports the spans of every request, or None.
     """
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    lifecycle = None
 
     try:
-        server.bind((ip, port))
-        server.listen(50)
+        server = create_listener(ip, port)
+        lifecycle = ServerLifecycle("Backend", server, drain_timeout)
+        lifecycle.install_signals()
         print("[Backend] Listening on port {}".format(port))
         if routes != {}:
             print("[Backend] route settings {}".format(routes))
 
-        while True:
-            conn, addr = server.accept()
+        while lifecycle.running():
+            conn, addr = lifecycle.accept()
+            if conn is None:
+                continue
+            if limiter is not None:
+                allowed, retry_after = limiter.admit(addr[0])
+                if not allowed:
+                    print(f"[Backend] Rate limited {addr}, retry after {retry_after}s")
+                    reject_client(conn, addr, retry_after)
+                    continue
             #
             #  TODO: implement the step of the client incomping connection
             #        using multi-thread programming with the
@@ -99,27 +147,31 @@ def run_backend(ip, port, routes):
             #
             # --- BẮT ĐẦU HOÀN THÀNH TODO ---
             print(f"[Backend] Accepted connection from {addr}") # Thêm log
-            client_thread = threading.Thread(
-                target=handle_client,
-                args=(ip, port, conn, addr, routes)
-            )
-            client_thread.daemon = True # Tự động tắt thread khi chương trình chính tắt
-            client_thread.start()
+            # Thread được theo dõi để chờ request đang xử lý khi tắt server
+            # Kết nối giữ lại (keep-alive) cho tới khi server dừng nhận kết nối
+            lifecycle.spawn(handle_client, (ip, port, conn, addr, routes, limiter, tracer,
+                                            lifecycle.running))
             # --- KẾT THÚC HOÀN THÀNH TODO ---
     except socket.error as e:
       print("Socket error: {}".format(e))
     except KeyboardInterrupt:
         print("\n[Backend] Server shutting down.") # Thêm xử lý ngắt
     finally:
-        server.close()
+        if lifecycle is not None:
+            lifecycle.drain()
+        if tracer is not None:
+            tracer.close()
 
-def create_backend(ip, port, routes={}):
+def create_backend(ip, port, routes={}, limiter=None, drain_timeout=DRAIN_TIMEOUT, tracer=None):
     """
     Entry point for creating and running the backend server.
 
     :param ip (str): IP address to bind the server.
     :param port (int): Port number to listen on.
     :param routes (dict, optional): Dictionary of route handlers. Defaults to empty dict.
+    :param limiter (RateLimiter, optional): per-client admission control. Defaults to None.
+    :param drain_timeout (float, optional): seconds to drain in-flight requests at shutdown.
+    :param tracer (SpanExporter, optional): exports the spans of every request. Defaults to None.
     """
 
-    run_backend(ip, port, routes)
\ No newline at end of file
+    run_backend(ip, port, routes, limiter, drain_timeout, tracer)
\ No newline at end of file
@@ -0,0 +1,316 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.balancer
+~~~~~~~~~~~~~~~~~
+
+This module provides the load balancing policies selectable with ``dist_policy`` in
+``proxy.conf``:
+
+- ``round-robin``: every upstream in turn.
+- ``weighted-round-robin``: smooth weighted rotation, weights come from
+  ``proxy_pass http://ip:port weight=N;``.
+- ``least-conn``: the upstream with the fewest requests in flight.
+- ``random-two-choices``: the less loaded of two random upstreams.
+- ``ewma``: the lowest smoothed time to first byte, scaled by the requests in flight.
+- ``consistent-hash <key>``: sticky routing on a hash ring with virtual nodes, where
+  ``<key>`` is ``ip`` (client address, the default), ``cookie:<name>`` or
+  ``header:<name>``. Adding or removing one of N upstreams moves about 1/N of the keys.
+
+Selection takes no lock: rotations use an atomic ``itertools.count`` and the
+load-aware policies read the live counters of :class:`Upstream <Upstream>`. Worker
+processes each start their rotations at their own index (:func:`set_rotation_offset`),
+so their first picks interleave instead of all hitting the first upstream.
+Upstreams ejected by their circuit breaker, at their ``max_conns``, or listed in
+``exclude`` (already tried by a retry), are skipped by every policy; ``pick`` returns
+None when none is left.
+
+Usage Example:
+--------------
+>>> balancer = create_balancer("least-conn", ["10.0.0.1:9000", "10.0.0.2:9000 weight=2"])
+>>> upstream = balancer.pick(request, client_ip="10.0.0.7")
+>>> retry_to = balancer.pick(request, client_ip="10.0.0.7", exclude={upstream.name})
+"""
+
+import random
+import bisect
+import hashlib
+import itertools
+
+from .upstream import get_upstream
+
+
+#: Position where the rotations of this process start.
+ROTATION_OFFSET = 0
+
+
+def set_rotation_offset(offset):
+    """
+    :param offset (int): the index of this worker process.
+    """
+    global ROTATION_OFFSET
+    ROTATION_OFFSET = offset
+
+
+def parse_server(entry):
+    """
+    Parse a ``proxy_pass`` entry such as ``"10.0.0.1:9000"`` or
+    ``"10.0.0.1:9000 weight=3"``.
+
+    :param entry (str): the server entry.
+
+    :rtype tuple: (host, port, weight).
+    """
+    parts = entry.split()
+    host, port = parts[0].split(":", 1)
+    weight = 1
+    for param in parts[1:]:
+        if param.startswith("weight="):
+            weight = max(1, int(param.split("=", 1)[1]))
+    return host, int(port), weight
+
+
+def parse_max_conns(entry):
+    """
+    :param entry (str): a server entry such as ``"10.0.0.1:9000 max_conns=50"``.
+
+    :rtype int: the ``max_conns`` parameter of the entry, 0 if absent.
+    """
+    for param in entry.split()[1:]:
+        if param.startswith("max_conns="):
+            return max(0, int(param.split("=", 1)[1]))
+    return 0
+
+
+def eligible(upstream, exclude):
+    """
+    :param upstream (Upstream): a candidate.
+    :param exclude (collection): names of the upstreams already tried.
+
+    :rtype bool: whether the upstream may receive the request now: not tried, not
+                 ejected and below its ``max_conns``.
+    """
+    return upstream.name not in exclude and not upstream.saturated() and upstream.available()
+
+
+class RoundRobin:
+    """Every upstream in turn."""
+
+    def __init__(self, upstreams, weights):
+        self.upstreams = upstreams
+        self.counter = itertools.count(ROTATION_OFFSET)
+
+    def start(self, exclude):
+        # A retry or hedge starts at a random position: taking the next turn would
+        # shift the rotation of first attempts by one for every retried request
+        if exclude:
+            return random.randrange(len(self.upstreams))
+        return next(self.counter)
+
+    def pick(self, request=None, client_ip=None, exclude=()):
+        count = len(self.upstreams)
+        start = self.start(exclude)
+        for i in range(count):
+            upstream = self.upstreams[(start + i) % count]
+            if eligible(upstream, exclude):
+                return upstream
+        return None
+
+
+class WeightedRoundRobin(RoundRobin):
+    """Smooth weighted round robin: the schedule is computed once, interleaving the
+    upstreams in proportion to their weights, then walked like a plain rotation."""
+
+    def __init__(self, upstreams, weights):
+        schedule = []
+        current = [0] * len(upstreams)
+        total = sum(weights)
+        for _ in range(total):
+            for i, weight in enumerate(weights):
+                current[i] += weight
+            best = max(range(len(upstreams)), key=lambda i: current[i])
+            current[best] -= total
+            schedule.append(upstreams[best])
+        super().__init__(schedule, weights)
+
+
+class LeastConn(RoundRobin):
+    """Fewest requests in flight relative to weight; ties rotate."""
+
+    def __init__(self, upstreams, weights):
+        super().__init__(upstreams, weights)
+        self.weights = weights
+
+    def pick(self, request=None, client_ip=None, exclude=()):
+        count = len(self.upstreams)
+        start = self.start(exclude) % count
+        best, best_load = None, None
+        for i in range(count):
+            index = (start + i) % count
+            if not eligible(self.upstreams[index], exclude):
+                continue
+            load = self.upstreams[index].in_flight / self.weights[index]
+            if best is None or load < best_load:
+                best, best_load = self.upstreams[index], load
+        return best
+
+
+class RandomTwoChoices(LeastConn):
+    """Power of two choices: sample two upstreams, keep the less loaded one."""
+
+    def pick(self, request=None, client_ip=None, exclude=()):
+        candidates = [i for i, upstream in enumerate(self.upstreams) if eligible(upstream, exclude)]
+        if len(candidates) < 2:
+            return self.upstreams[candidates[0]] if candidates else None
+        i, j = random.sample(candidates, 2)
+        load_i = self.upstreams[i].in_flight / self.weights[i]
+        load_j = self.upstreams[j].in_flight / self.weights[j]
+        return self.upstreams[i] if load_i <= load_j else self.upstreams[j]
+
+
+class EwmaLatency(LeastConn):
+    """Lowest expected latency: EWMA of the time to first byte times (in flight + 1).
+    Unmeasured upstreams score 0 so they get probed first."""
+
+    def pick(self, request=None, client_ip=None, exclude=()):
+        count = len(self.upstreams)
+        start = self.start(exclude) % count
+        best, best_score = None, None
+        for i in range(count):
+            index = (start + i) % count
+            upstream = self.upstreams[index]
+            if not eligible(upstream, exclude):
+                continue
+            score = upstream.ewma * (upstream.in_flight + 1) / self.weights[index]
+            if best is None or score < best_score:
+                best, best_score = upstream, score
+        return best
+
+
+#: Points per unit of weight each upstream gets on the hash ring.
+VIRTUAL_NODES = 160
+
+
+def ring_hash(value):
+    """
+    :param value (str): the value to place on the ring.
+
+    :rtype int: a 64-bit position on the hash ring.
+    """
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+def request_cookie(request, name):
+    """
+    :param request (object): request with a ``headers`` mapping.
+    :param name (str): cookie name.
+
+    :rtype str: the cookie value, or None.
+    """
+    for pair in request.headers.get("cookie", "").split(";"):
+        key, sep, value = pair.strip().partition("=")
+        if sep and key == name:
+            return value
+    return None
+
+
+class ConsistentHash:
+    """Consistent hashing on a ring of virtual nodes. The hash key is the client IP,
+    a named cookie or a named header; requests without the cookie/header fall back
+    to the client IP so they still stick to one upstream."""
+
+    def __init__(self, upstreams, weights, key="ip"):
+        self.upstreams = upstreams
+        self.source, _, self.name = key.partition(":")
+        if self.source not in ("ip", "cookie", "header") or (self.source != "ip" and not self.name):
+            print(f"[Proxy] Invalid consistent-hash key {key!r}, hashing on client ip")
+            self.source, self.name = "ip", ""
+        points = []
+        for upstream, weight in zip(upstreams, weights):
+            for replica in range(VIRTUAL_NODES * weight):
+                points.append((ring_hash(f"{upstream.name}#{replica}"), upstream))
+        points.sort(key=lambda point: point[0])
+        self.ring = [position for position, _ in points]
+        self.owners = [upstream for _, upstream in points]
+
+    def hash_key(self, request, client_ip):
+        value = None
+        if request is not None:
+            if self.source == "cookie":
+                value = request_cookie(request, self.name)
+            elif self.source == "header":
+                value = request.headers.get(self.name)
+        return value or client_ip or ""
+
+    def walk(self, request=None, client_ip=None):
+        """
+        :rtype iterator: the distinct upstreams in ring order starting at the key's
+                         position; the first one owns the key, the next ones are its
+                         successors if it cannot be used.
+        """
+        start = bisect.bisect(self.ring, ring_hash(self.hash_key(request, client_ip)))
+        seen = set()
+        for i in range(len(self.ring)):
+            upstream = self.owners[(start + i) % len(self.ring)]
+            if upstream.name not in seen:
+                seen.add(upstream.name)
+                yield upstream
+                if len(seen) == len(self.upstreams):
+                    return
+
+    def pick(self, request=None, client_ip=None, exclude=()):
+        # Keys of an ejected upstream move to its successor, and come back once it
+        # is re-admitted since the ring itself never changes
+        for upstream in self.walk(request, client_ip):
+            if eligible(upstream, exclude):
+                return upstream
+        return None
+
+
+#: ``dist_policy`` name -> policy class.
+POLICIES = {
+    "round-robin": RoundRobin,
+    "weighted-round-robin": WeightedRoundRobin,
+    "least-conn": LeastConn,
+    "random-two-choices": RandomTwoChoices,
+    "ewma": EwmaLatency,
+    "consistent-hash": ConsistentHash,
+}
+
+
+def create_balancer(policy, proxy_map):
+    """
+    Build the balancer of one host.
+
+    :param policy (str): the ``dist_policy`` value, a policy name optionally followed by
+                         its argument (``consistent-hash cookie:session``); unknown names
+                         fall back to round-robin.
+    :param proxy_map (list): ``proxy_pass`` entries of the host.
+
+    :rtype object: a policy instance exposing
+                   ``pick(request, client_ip, exclude) -> Upstream``
+                   (None when every upstream is ejected or excluded).
+    """
+    name, _, argument = policy.strip().partition(" ")
+    upstreams, weights = [], []
+    for entry in proxy_map:
+        host, port, weight = parse_server(entry)
+        upstreams.append(get_upstream(host, port))
+        weights.append(weight)
+    policy_class = POLICIES.get(name)
+    if policy_class is None:
+        print(f"[Proxy] Unknown dist_policy {policy!r}, using round-robin")
+        policy_class = RoundRobin
+    if policy_class is ConsistentHash:
+        return ConsistentHash(upstreams, weights, argument.strip() or "ip")
+    return policy_class(upstreams, weights)
@@ -0,0 +1,193 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.cache
+~~~~~~~~~~~~~~~~~
+
+This module provides a :class:`ResponseCache <ResponseCache>` object to keep the fully
+serialized responses of WeApRous routes in memory. A cache hit is served as raw bytes,
+so neither the route handler nor ``json.dumps`` runs again until the entry expires or
+is invalidated by a write handler.
+
+Usage Example:
+--------------
+>>> cache = ResponseCache(max_entries=256)
+>>> generation = cache.generation('/chat/channels')  # before running the handler
+>>> cache.put('GET', '/chat/channels', None, b'HTTP/1.1 200 OK...', ttl=5,
+...           generation=generation)
+>>> cache.get('GET', '/chat/channels', None)
+b'HTTP/1.1 200 OK...'
+>>> cache.invalidate('/chat/channels')
+1
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """The :class:`ResponseCache <ResponseCache>` object, a bounded LRU store of
+    serialized route responses with a per-entry time to live.
+
+    Entries are keyed by ``(method, path, vary_key)`` where ``vary_key`` is whatever
+    the route's vary function returned for the request (``None`` when the route does
+    not vary). Statistics are kept per ``(method, path)`` so TTLs can be tuned per route.
+
+    :attrs max_entries (int): maximum number of cached responses before LRU eviction.
+    :attrs entries (OrderedDict): ``(method, path, vary_key) -> (expires_at, payload)``.
+    :attrs generations (dict): path -> number of invalidations of the path, so a
+                               response built before an invalidation is not stored
+                               after it.
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        Initialize an empty response cache.
+
+        :param max_entries (int): maximum number of cached responses.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generations = {}
+        #: bumped by ``invalidate()`` without a path
+        self.epoch = 0
+        #: (method, path) -> {"hits", "misses", "stores", "expired", "evictions",
+        #:                    "invalidations", "stale"}
+        self.counters = {}
+
+    def _count(self, method, path, name, amount=1):
+        route_stats = self.counters.get((method, path))
+        if route_stats is None:
+            route_stats = {"hits": 0, "misses": 0, "stores": 0,
+                           "expired": 0, "evictions": 0, "invalidations": 0, "stale": 0}
+            self.counters[(method, path)] = route_stats
+        route_stats[name] += amount
+
+    def get(self, method, path, vary_key=None):
+        """
+        Look up a cached response.
+
+        :param method (str): HTTP method of the request.
+        :param path (str): routed path of the request.
+        :param vary_key (hashable): key returned by the route's vary function.
+
+        :rtype bytes: the cached response, or None on a miss or an expired entry.
+        """
+        key = (method, path, vary_key)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self._count(method, path, "misses")
+                return None
+            expires_at, payload = entry
+            if expires_at <= now:
+                del self.entries[key]
+                self._count(method, path, "expired")
+                self._count(method, path, "misses")
+                return None
+            self.entries.move_to_end(key)
+            self._count(method, path, "hits")
+            return payload
+
+    def generation(self, path):
+        """
+        Read the invalidation generation of ``path``; take it before building the
+        response that will be passed to :meth:`put`.
+
+        :rtype tuple: an opaque token that changes whenever ``path`` is invalidated.
+        """
+        with self.lock:
+            return self.epoch, self.generations.get(path, 0)
+
+    def put(self, method, path, vary_key, payload, ttl, generation=None):
+        """
+        Store a serialized response for ``ttl`` seconds.
+
+        :param method (str): HTTP method of the request.
+        :param path (str): routed path of the request.
+        :param vary_key (hashable): key returned by the route's vary function.
+        :param payload (bytes): the complete response (header and body).
+        :param ttl (float): time to live in seconds.
+        :param generation (tuple): the :meth:`generation` read before the response
+                                   was built; the response is dropped if the path was
+                                   invalidated since.
+        """
+        if ttl is None or ttl <= 0:
+            return
+        key = (method, path, vary_key)
+        with self.lock:
+            if generation is not None and generation != (self.epoch, self.generations.get(path, 0)):
+                self._count(method, path, "stale")
+                return
+            self.entries[key] = (time.monotonic() + ttl, payload)
+            self.entries.move_to_end(key)
+            self._count(method, path, "stores")
+            while len(self.entries) > self.max_entries:
+                (old_method, old_path, _), _ = self.entries.popitem(last=False)
+                self._count(old_method, old_path, "evictions")
+
+    def invalidate(self, path=None, method=None, vary_key=None):
+        """
+        Drop cached responses. Write handlers call this after changing the data
+        a cached route serializes.
+
+        :param path (str): routed path to invalidate, or None for every path.
+        :param method (str): only drop entries for this method (default: all methods).
+        :param vary_key (hashable): only drop the entry for this vary key
+                                    (default: every vary key of the path).
+
+        :rtype int: number of entries removed.
+        """
+        with self.lock:
+            # Bumped even when nothing is cached: a response may be being built
+            if path is None:
+                self.epoch += 1
+            else:
+                self.generations[path] = self.generations.get(path, 0) + 1
+            doomed = []
+            for key in self.entries:
+                key_method, key_path, key_vary = key
+                if path is not None and key_path != path:
+                    continue
+                if method is not None and key_method != method.upper():
+                    continue
+                if vary_key is not None and key_vary != vary_key:
+                    continue
+                doomed.append(key)
+            for key in doomed:
+                del self.entries[key]
+                self._count(key[0], key[1], "invalidations")
+            return len(doomed)
+
+    def stats(self):
+        """
+        Return a snapshot of the cache statistics.
+
+        :rtype dict: ``{"entries", "max_entries", "routes": {"METHOD path": {...}}}``
+                     where each route reports its counters and hit ratio.
+        """
+        with self.lock:
+            routes = {}
+            for (method, path), counters in self.counters.items():
+                route_stats = dict(counters)
+                lookups = counters["hits"] + counters["misses"]
+                route_stats["hit_ratio"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+                routes[f"{method} {path}"] = route_stats
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "routes": routes,
+            }
@@ -0,0 +1,166 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.coalesce
+~~~~~~~~~~~~~~~~~
+
+This module provides :class:`SingleFlight <SingleFlight>`, request coalescing for the
+proxy: while one upstream fetch for a key is in progress, identical requests wait for
+it and share its response instead of reaching the backend themselves.
+
+Requests only share a fetch with requests carrying the same credentials
+(``Cookie`` and ``Authorization`` headers): backends commonly answer according to
+them without saying so in ``Vary``, so they are part of the flight key.
+
+A waiter falls back to its own fetch when:
+
+- ``max_waiters`` requests are already waiting on the same fetch;
+- the fetch does not finish within ``timeout`` seconds, or fails;
+- the response cannot be shared: ``Set-Cookie``, ``Cache-Control: private`` or
+  ``no-store``, ``Vary: *``, or a ``Vary`` header whose request values differ.
+
+The shared fetch returns ``(resp_head, body, status, extra)``; the response is
+buffered, so coalescing is meant for hosts serving hot, moderately sized resources.
+
+Usage Example:
+--------------
+>>> flights = SingleFlight(timeout=5, max_waiters=100)
+>>> result, shared = flights.do("app1.local/static/app.js",
+...                             lambda: fetch(upstream, head, request), request.headers)
+"""
+
+import threading
+
+from .framing import parse_head
+from .httpcache import parse_cache_control
+
+
+class Flight:
+    """One in-progress fetch and the requests waiting on it."""
+
+    __slots__ = ("done", "result", "error", "headers", "waiters")
+
+    def __init__(self, headers):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        #: Request headers of the leader, to compare ``Vary`` values
+        self.headers = headers
+        self.waiters = 0
+
+
+def shareable(resp_head, leader_headers, headers):
+    """
+    :param resp_head (bytes): the response header block of the shared fetch.
+    :param leader_headers (CaseInsensitiveDict): request headers of the leader.
+    :param headers (CaseInsensitiveDict): request headers of the waiter.
+
+    :rtype bool: whether the waiter may receive the leader's response.
+    """
+    _, response = parse_head(resp_head)
+    directives = parse_cache_control(response.get("cache-control", ""))
+    if "set-cookie" in response or "private" in directives or "no-store" in directives:
+        return False
+    for name in response.get("vary", "").split(","):
+        name = name.strip()
+        if name == "*":
+            return False
+        if name and leader_headers.get(name, "").strip() != headers.get(name, "").strip():
+            return False
+    return True
+
+
+class SingleFlight:
+    """The :class:`SingleFlight <SingleFlight>` object of one host.
+
+    :attrs timeout (float): seconds a waiter waits before fetching on its own.
+    :attrs max_waiters (int): waiters allowed per in-progress fetch.
+    """
+
+    def __init__(self, timeout=5.0, max_waiters=100):
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.counters = {"leaders": 0, "coalesced": 0, "timeouts": 0,
+                         "overflows": 0, "unshareable": 0, "failures": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _join(self, key, headers):
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = Flight(headers)
+                self.flights[key] = flight
+                self.counters["leaders"] += 1
+                return flight, True
+            if flight.waiters >= self.max_waiters:
+                self.counters["overflows"] += 1
+                return None, False
+            flight.waiters += 1
+            return flight, False
+
+    def do(self, key, func, headers):
+        """
+        Run ``func`` once for all concurrent callers with the same key.
+
+        :param key (str): the coalescing key (host and target); the credentials of
+                          ``headers`` are added to it.
+        :param func (callable): performs the fetch, returns
+                                ``(resp_head, body, status, extra)``.
+        :param headers (CaseInsensitiveDict): request headers of the caller.
+
+        :rtype tuple: (result, shared) where shared is True if the result came from
+                      another request's fetch. Errors of the caller's own fetch propagate.
+        """
+        # Never share a response between clients presenting different credentials
+        key = (key, headers.get("cookie", ""), headers.get("authorization", ""))
+        flight, leader = self._join(key, headers)
+        if flight is None:
+            return func(), False
+
+        if leader:
+            try:
+                flight.result = func()
+                return flight.result, False
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self.lock:
+                    self.flights.pop(key, None)
+                flight.done.set()
+
+        if not flight.done.wait(self.timeout):
+            self._count("timeouts")
+            return func(), False
+        if flight.error is not None:
+            self._count("failures")
+            return func(), False
+        if not shareable(flight.result[0], flight.headers, headers):
+            self._count("unshareable")
+            return func(), False
+        self._count("coalesced")
+        return flight.result, True
+
+    def stats(self):
+        """
+        :rtype dict: coalescing counters and the number of fetches in progress.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+            snapshot["in_progress"] = len(self.flights)
+        return snapshot
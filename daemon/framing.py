@@ -0,0 +1,257 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.framing
+~~~~~~~~~~~~~~~~~
+
+This module provides HTTP/1.1 message framing helpers for the proxy. Messages are
+delimited by ``Content-Length`` or chunked ``Transfer-Encoding`` rather than by the
+peer closing the connection, which is what makes persistent upstream connections
+possible.
+
+Usage Example:
+--------------
+>>> reader = HttpReader(sock)
+>>> head = reader.read_head()
+>>> start_line, headers = parse_head(head)
+>>> framing = response_framing("GET", 200, headers)
+>>> body = b"".join(reader.iter_body(framing))
+"""
+
+from .dictionary import CaseInsensitiveDict
+
+#: Largest accepted header block.
+MAX_HEAD = 65536
+
+#: Size of a single socket read, also the largest chunk yielded by ``iter_body``.
+BUFSIZE = 65536
+
+#: Hop-by-hop headers that must not be forwarded as-is (RFC 7230 section 6.1).
+HOP_BY_HOP = ("connection", "keep-alive", "proxy-connection", "te", "trailer", "upgrade")
+
+
+class HttpReader:
+    """The :class:`HttpReader <HttpReader>` object, a buffered reader of HTTP messages
+    from one socket. Bytes read past the end of a message stay buffered for the next one.
+
+    :attrs sock (socket.socket): the connection to read from.
+    :attrs buf (bytearray): received bytes not consumed yet.
+    """
+
+    def __init__(self, sock, bufsize=BUFSIZE):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.buf = bytearray()
+
+    def _fill(self):
+        data = self.sock.recv(self.bufsize)
+        if not data:
+            return False
+        self.buf += data
+        return True
+
+    def read_head(self, limit=MAX_HEAD):
+        """
+        Read the start line and headers of the next message.
+
+        :param limit (int): largest accepted header block.
+
+        :rtype bytes: the header block including the final blank line, or None if
+                      the peer closed the connection before sending anything.
+
+        :raises ValueError: if the header is too large or cut short.
+        """
+        while True:
+            end = self.buf.find(b"\r\n\r\n")
+            if end >= 0:
+                head = bytes(self.buf[:end + 4])
+                del self.buf[:end + 4]
+                return head
+            if len(self.buf) > limit:
+                raise ValueError("HTTP header block too large")
+            if not self._fill():
+                if self.buf:
+                    raise ValueError("Connection closed inside HTTP header")
+                return None
+
+    def _read_line(self, limit=8192):
+        while True:
+            end = self.buf.find(b"\r\n")
+            if end >= 0:
+                line = bytes(self.buf[:end + 2])
+                del self.buf[:end + 2]
+                return line
+            if len(self.buf) > limit:
+                raise ValueError("HTTP chunk line too long")
+            if not self._fill():
+                raise ConnectionError("Connection closed inside chunked body")
+
+    def _iter_length(self, remaining):
+        while remaining > 0:
+            if not self.buf and not self._fill():
+                raise ConnectionError("Connection closed before end of body")
+            take = min(remaining, len(self.buf), self.bufsize)
+            chunk = bytes(self.buf[:take])
+            del self.buf[:take]
+            remaining -= take
+            yield chunk
+
+    def _iter_chunked(self):
+        while True:
+            line = self._read_line()
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ValueError(f"Invalid chunk size line {line!r}")
+            yield line
+            if size == 0:
+                # Optional trailers, terminated by an empty line
+                while True:
+                    line = self._read_line()
+                    yield line
+                    if line == b"\r\n":
+                        return
+            # Chunk data followed by its CRLF
+            yield from self._iter_length(size + 2)
+
+    def _iter_eof(self):
+        if self.buf:
+            chunk = bytes(self.buf)
+            self.buf.clear()
+            yield chunk
+        while self._fill():
+            chunk = bytes(self.buf)
+            self.buf.clear()
+            yield chunk
+
+    def iter_body(self, framing):
+        """
+        Yield the raw body bytes of the current message (chunked bodies keep their
+        chunk framing so they can be relayed untouched).
+
+        :param framing (tuple): ``(kind, length)`` from :func:`request_framing` or
+                                :func:`response_framing`.
+
+        :rtype iterator: body chunks of at most ``bufsize`` bytes.
+        """
+        kind, length = framing
+        if kind == "length":
+            return self._iter_length(length)
+        if kind == "chunked":
+            return self._iter_chunked()
+        if kind == "eof":
+            return self._iter_eof()
+        return iter(())
+
+
+def parse_head(head):
+    """
+    Split a header block into its start line and headers.
+
+    :param head (bytes): header block as returned by :meth:`HttpReader.read_head`.
+
+    :rtype tuple: (start_line, headers) where headers is a
+                  :class:`CaseInsensitiveDict <CaseInsensitiveDict>` (last value wins).
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    headers = CaseInsensitiveDict()
+    for line in lines[1:]:
+        if ":" in line:
+            key, val = line.split(":", 1)
+            headers[key.strip()] = val.strip()
+    return lines[0], headers
+
+
+def parse_status(start_line):
+    """
+    :param start_line (str): response status line, e.g. ``HTTP/1.1 200 OK``.
+
+    :rtype tuple: (version, status_code).
+    """
+    parts = start_line.split(" ", 2)
+    try:
+        return parts[0], int(parts[1])
+    except (IndexError, ValueError):
+        raise ValueError(f"Invalid status line {start_line!r}")
+
+
+def request_framing(headers):
+    """
+    :param headers (CaseInsensitiveDict): request headers.
+
+    :rtype tuple: body framing ``(kind, length)`` of a request.
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return ("chunked", None)
+    length = headers.get("content-length")
+    if length:
+        return ("length", int(length))
+    return ("none", 0)
+
+
+def response_framing(method, status, headers):
+    """
+    :param method (str): method of the request being answered.
+    :param status (int): response status code.
+    :param headers (CaseInsensitiveDict): response headers.
+
+    :rtype tuple: body framing ``(kind, length)`` of a response; ``("eof", None)``
+                  when only closing the connection ends the body.
+    """
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        return ("none", 0)
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return ("chunked", None)
+    length = headers.get("content-length")
+    if length is not None:
+        return ("length", int(length))
+    return ("eof", None)
+
+
+def keeps_alive(version, headers):
+    """
+    :param version (str): HTTP version of the message.
+    :param headers (CaseInsensitiveDict): message headers.
+
+    :rtype bool: whether the sender allows the connection to be reused.
+    """
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        return "keep-alive" in connection
+    return "close" not in connection
+
+
+def rewrite_head(head, set_headers=None, drop=HOP_BY_HOP):
+    """
+    Rebuild a header block, removing ``drop`` headers and setting ``set_headers``.
+
+    :param head (bytes): the original header block.
+    :param set_headers (dict): headers to add or replace.
+    :param drop (tuple): lowercase names of headers to remove.
+
+    :rtype bytes: the new header block.
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    set_headers = set_headers or {}
+    replaced = {name.lower() for name in set_headers}
+    out = [lines[0]]
+    for line in lines[1:]:
+        if not line or ":" not in line:
+            continue
+        name = line.split(":", 1)[0].strip().lower()
+        if name in drop or name in replaced:
+            continue
+        out.append(line)
+    for name, value in set_headers.items():
+        out.append(f"{name}: {value}")
+    return ("\r\n".join(out) + "\r\n\r\n").encode("latin-1")
@@ -0,0 +1,338 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.health
+~~~~~~~~~~~~~~~~~
+
+This module keeps dead upstreams out of rotation. Every :class:`Upstream <Upstream>`
+owns a :class:`CircuitBreaker <CircuitBreaker>` fed by two sources:
+
+- passive tracking: the outcome of each proxied request (connect/read failures and
+  ``502/503/504`` answers count as failures);
+- active probing: a :class:`HealthChecker <HealthChecker>` thread that periodically
+  opens a TCP connection to every upstream, or sends ``GET <path>`` and expects a
+  status below 500.
+
+After ``failure_threshold`` consecutive failures the breaker opens and the upstream is
+ejected for ``eject_time`` seconds (doubling on each consecutive ejection). It then
+turns half-open: a single trial (live request or probe) decides whether it is
+re-admitted or ejected again.
+
+With several worker processes, the breakers of every worker publish their ejections
+and re-admissions on one :class:`HealthBoard <HealthBoard>` in shared memory, and
+adopt those of the other workers the next time they are asked for their upstream.
+
+Usage Example:
+--------------
+>>> checker = HealthChecker(interval=5, path="/healthz")
+>>> checker.start()
+>>> get_upstream("10.0.0.1", 9000).available()
+True
+"""
+
+import mmap
+import zlib
+import time
+import struct
+import socket
+import threading
+import multiprocessing
+
+#: Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+#: Seconds allowed for one active probe.
+PROBE_TIMEOUT = 2.0
+
+
+class HealthBoard:
+    """The :class:`HealthBoard <HealthBoard>` object, the ejection deadline of every
+    upstream in anonymous shared memory, created before the worker processes are
+    forked so they all map it.
+
+    Each slot holds an upstream name and its ``time.monotonic()`` ejection deadline
+    (the clock is shared by the processes of a host), 0 once re-admitted. Writes
+    and slot allocation take a process-shared lock; reads take none.
+
+    :attrs slots (int): most upstreams the board can hold.
+    """
+
+    SLOT = struct.Struct("64sd")
+
+    def __init__(self, slots=1024):
+        self.slots = slots
+        self.memory = mmap.mmap(-1, slots * self.SLOT.size)
+        self.lock = multiprocessing.Lock()
+        #: Name -> offset of its slot, cached per process
+        self.offsets = {}
+
+    def offset(self, name):
+        """
+        :rtype int: offset of the slot of ``name``, allocated on first use, or None
+                    if the board is full.
+        """
+        offset = self.offsets.get(name)
+        if offset is not None:
+            return offset
+        key = name.encode("utf-8")[:64].ljust(64, b"\0")
+        start = zlib.crc32(key) % self.slots
+        with self.lock:
+            for i in range(self.slots):
+                offset = ((start + i) % self.slots) * self.SLOT.size
+                held = self.memory[offset:offset + 64]
+                if held == key:
+                    break
+                if not held.strip(b"\0"):
+                    self.SLOT.pack_into(self.memory, offset, key, 0.0)
+                    break
+            else:
+                return None
+        self.offsets[name] = offset
+        return offset
+
+    def get(self, name):
+        """
+        :rtype float: the ejection deadline of ``name``, 0 if it is not ejected.
+        """
+        offset = self.offset(name)
+        if offset is None:
+            return 0.0
+        return struct.unpack_from("d", self.memory, offset + 64)[0]
+
+    def put(self, name, until):
+        """
+        :param name (str): ``"host:port"`` of the upstream.
+        :param until (float): its ejection deadline, 0 when re-admitted.
+        """
+        offset = self.offset(name)
+        if offset is None:
+            return
+        with self.lock:
+            struct.pack_into("d", self.memory, offset + 64, until)
+
+
+#: Board shared with the other worker processes, None in a single process.
+BOARD = None
+
+
+def share_health(board):
+    """
+    Make the breakers of this process publish to and follow ``board``.
+
+    :param board (HealthBoard): the board of the worker processes.
+    """
+    global BOARD
+    BOARD = board
+
+
+class CircuitBreaker:
+    """The :class:`CircuitBreaker <CircuitBreaker>` object of one upstream.
+
+    :attrs state (str): ``closed`` (in rotation), ``open`` (ejected) or ``half-open``.
+    :attrs failure_threshold (int): consecutive failures that open the breaker.
+    :attrs eject_time (float): base ejection time in seconds.
+    :attrs max_eject_time (float): upper bound of the ejection time.
+    """
+
+    def __init__(self, name, failure_threshold=3, eject_time=5.0, max_eject_time=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.ejections = 0
+        self.total_ejections = 0
+        self.open_until = 0.0
+        self.trial = False
+        #: Last deadline read from the shared board
+        self.seen = 0.0
+
+    def sync(self, board):
+        """
+        Adopt an ejection or re-admission another worker published on the board.
+        """
+        until = board.get(self.name)
+        if until == self.seen:
+            return
+        with self.lock:
+            self.seen = until
+            if until > time.monotonic() and self.state != OPEN:
+                self.state = OPEN
+                self.trial = False
+                self.open_until = until
+                print(f"[Health] {self.name} ejected by another worker")
+            elif until == 0.0 and self.state != CLOSED:
+                self.state = CLOSED
+                self.failures = 0
+                self.ejections = 0
+                self.trial = False
+                print(f"[Health] {self.name} re-admitted by another worker")
+
+    def publish(self, until):
+        if BOARD is not None:
+            self.seen = until
+            BOARD.put(self.name, until)
+
+    def allow(self):
+        """
+        Whether the upstream may receive a request now. Does not reserve anything;
+        an expired ejection moves the breaker to half-open here.
+
+        :rtype bool: True if the upstream is in rotation.
+        """
+        if BOARD is not None:
+            self.sync(BOARD)
+        state = self.state
+        if state == CLOSED:
+            return True
+        with self.lock:
+            if self.state == OPEN and time.monotonic() >= self.open_until:
+                self.state = HALF_OPEN
+                self.trial = False
+                print(f"[Health] {self.name} half-open, waiting for a trial")
+            return self.state == CLOSED or (self.state == HALF_OPEN and not self.trial)
+
+    def on_request(self):
+        """
+        Note a request sent to the upstream; in half-open state it is the trial.
+        """
+        if self.state == HALF_OPEN:
+            with self.lock:
+                self.trial = True
+
+    def record(self, ok):
+        """
+        Feed the outcome of a request or probe.
+
+        :param ok (bool): whether the upstream answered properly.
+        """
+        with self.lock:
+            if ok:
+                if self.state == OPEN:
+                    # Still ejected: only a half-open trial may re-admit it
+                    return
+                if self.state == HALF_OPEN:
+                    print(f"[Health] {self.name} re-admitted")
+                    self.publish(0.0)
+                self.state = CLOSED
+                self.failures = 0
+                self.ejections = 0
+                self.trial = False
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._eject()
+
+    def _eject(self):
+        self.ejections += 1
+        self.total_ejections += 1
+        duration = min(self.eject_time * (2 ** (self.ejections - 1)), self.max_eject_time)
+        self.state = OPEN
+        self.trial = False
+        self.open_until = time.monotonic() + duration
+        self.publish(self.open_until)
+        print(f"[Health] {self.name} ejected for {duration:.1f}s after {self.failures} failure(s)")
+
+    def stats(self):
+        """
+        :rtype dict: breaker state, consecutive failures and ejection counts.
+        """
+        with self.lock:
+            remaining = max(0.0, self.open_until - time.monotonic()) if self.state == OPEN else 0.0
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "ejections": self.total_ejections,
+                "ejected_for_s": round(remaining, 3),
+            }
+
+
+def probe(upstream, path=None, timeout=PROBE_TIMEOUT):
+    """
+    Actively check one upstream.
+
+    :param upstream (Upstream): the backend to probe.
+    :param path (str): HTTP path to request, None for a plain TCP connect.
+    :param timeout (float): seconds allowed for the probe.
+
+    :rtype bool: True if the upstream is healthy.
+    """
+    try:
+        with socket.create_connection((upstream.host, upstream.port), timeout=timeout) as sock:
+            if path is None:
+                return True
+            sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {upstream.name}\r\n"
+                          f"Connection: close\r\n\r\n").encode("latin-1"))
+            status_line = sock.recv(64).split(b"\r\n", 1)[0].split()
+            return len(status_line) >= 2 and status_line[1].isdigit() and int(status_line[1]) < 500
+    except OSError:
+        return False
+
+
+class HealthChecker:
+    """The :class:`HealthChecker <HealthChecker>` object, a background thread probing
+    every registered upstream each ``interval`` seconds.
+
+    :attrs interval (float): seconds between two probing rounds.
+    :attrs path (str): HTTP path to probe, None for TCP connect probes.
+    """
+
+    def __init__(self, upstreams, interval=5.0, path=None):
+        """
+        :param upstreams (dict): live ``name -> Upstream`` registry to probe.
+        :param interval (float): seconds between probing rounds.
+        :param path (str): HTTP path to probe, None for TCP connect probes.
+        """
+        self.upstreams = upstreams
+        self.interval = interval
+        self.path = path
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start the probing thread.
+        """
+        self.thread = threading.Thread(target=self._run, name="proxy-health")
+        self.thread.daemon = True
+        self.thread.start()
+        kind = f"HTTP GET {self.path}" if self.path else "TCP connect"
+        print(f"[Health] Probing upstreams every {self.interval}s ({kind})")
+
+    def stop(self):
+        """
+        Stop the probing thread.
+        """
+        self.stopping.set()
+
+    def run_once(self):
+        """
+        Probe every upstream once and feed the results to their breakers.
+        """
+        for upstream in list(self.upstreams.values()):
+            breaker = upstream.breaker
+            if breaker.state == OPEN and not breaker.allow():
+                # Still ejected, no point probing before the ejection ends
+                continue
+            if breaker.state == HALF_OPEN:
+                breaker.on_request()
+            breaker.record(probe(upstream, self.path))
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            self.run_once()
@@ -18,12 +18,143 @@ This module provides a http adapter object to manage and persist
 http settings (headers, bodies). The adapter supports both
 raw URL paths and RESTful route definitions, and integrates with
 Request and Response objects to handle client-server communication.
+
+With a :class:`SpanExporter <SpanExporter>`, every request is traced: the
+``traceparent`` set by the proxy is continued and the ``parse``, ``dispatch``,
+``serialize`` and ``send`` steps are exported as spans (see :mod:`daemon.tracing`).
+Hook responses then also carry a ``Server-Timing`` header.
+
+Given a ``keep_alive`` check, a connection serves several requests in turn (HTTP
+persistent connections, framed by ``Content-Length``), so a proxy pooling its
+upstream connections saves a connect per request. The connection is closed when the
+client asks for it, after ``KEEPALIVE_MAX`` requests, after ``KEEPALIVE_TIMEOUT``
+idle seconds, or once the server stops accepting.
 """
 
 import json # Cần import json
+import time
+import socket
 from .request import Request
 from .response import Response
 from .dictionary import CaseInsensitiveDict
+from .tracing import ServerTrace
+from .framing import parse_head, rewrite_head, keeps_alive
+
+#: Idle seconds a persistent connection waits for its next request.
+KEEPALIVE_TIMEOUT = 15.0
+
+#: Requests served on one persistent connection before it is closed.
+KEEPALIVE_MAX = 100
+
+#: Seconds between two checks of the server state while a connection is idle.
+KEEPALIVE_POLL = 0.5
+
+def run_hook(req, resp):
+    """
+    Call the WeApRous hook mapped to a prepared request.
+
+    Hooks are called as ``hook(request=, response=)`` and, for older handlers,
+    as ``hook(headers=, body=)``. A failing hook yields an error payload and
+    sets the response status to 500.
+
+    :param req (Request): the prepared request carrying the hook.
+    :param resp (Response): the response object the hook may modify.
+
+    :rtype object: the JSON-serializable result of the hook.
+    """
+    print(f"[HttpAdapter] hook in route-path METHOD {req.hook._route_path} PATH {req.hook._route_methods}")
+
+    try:
+        handler_result_dict = req.hook(request=req, response=resp)
+    except TypeError: 
+        try:
+            handler_result_dict = req.hook(headers=req.headers, body=req.body)
+        except Exception as e:
+             print(f"[HttpAdapter] Error executing hook (headers, body): {e}")
+             handler_result_dict = {"status": "error", "message": f"Hook execution error: {e}"}
+             resp.status_code = 500
+             resp.reason = "Internal Server Error"
+    except Exception as e:
+        print(f"[HttpAdapter] Error executing hook (request, response): {e}")
+        handler_result_dict = {"status": "error", "message": f"Hook execution error: {e}"}
+        resp.status_code = 500
+        resp.reason = "Internal Server Error"
+
+    return handler_result_dict
+
+def cache_lookup(req):
+    """
+    Look a prepared request up in the response cache of its route (routes
+    declared with ``cache_ttl``).
+
+    :param req (Request): the prepared request carrying the hook.
+
+    :rtype tuple: ``(cache, vary_key, generation, cached)``; ``cache`` is None when
+                  the route is not cached, ``cached`` holds the response bytes on a hit.
+    """
+    cache = getattr(req.hook, '_route_cache', None)
+    if cache is None:
+        return None, None, None, None
+    vary = req.hook._route_cache_vary
+    try:
+        vary_key = vary(req) if vary else None
+    except Exception as e:
+        print(f"[HttpAdapter] Cache vary function failed, bypassing cache: {e}")
+        return None, None, None, None
+    cached = cache.get(req.method, req.path, vary_key)
+    if cached is not None:
+        print(f"[HttpAdapter] Cache hit for {req.method} {req.path}")
+        return cache, vary_key, None, cached
+    # Read before the handler runs: a write invalidating the path meanwhile
+    # makes the response stale, and put() then drops it
+    return cache, vary_key, cache.generation(req.path), None
+
+def cache_store(req, resp, response, lookup):
+    """
+    Store a fresh hook response in the route cache it was looked up in.
+
+    :param req (Request): the prepared request carrying the hook.
+    :param resp (Response): the response filled by the hook.
+    :param response (bytes): the complete serialized response.
+    :param lookup (tuple): what :func:`cache_lookup` returned for ``req``.
+    """
+    cache, vary_key, generation, _ = lookup
+    # Only plain successful responses are shared between clients
+    if cache is not None and resp.status_code == 200 and not resp.set_cookie:
+        cache.put(req.method, req.path, vary_key, response, req.hook._route_cache_ttl,
+                  generation=generation)
+
+def serialize_hook_result(req, resp, result, server_timing=None):
+    """
+    Serialize the result of a hook as a JSON response.
+
+    :param req (Request): the prepared request carrying the hook.
+    :param resp (Response): the response filled by the hook.
+    :param result (object): what the hook returned.
+    :param server_timing (str): a ``Server-Timing`` header value, or None.
+
+    :rtype bytes: the complete HTTP response, a 500 if ``result`` is not serializable.
+    """
+    try:
+        json_body = json.dumps(result).encode('utf-8')
+
+        if resp.status_code is None:
+            resp.status_code = 200
+            resp.reason = "OK"
+
+        resp.headers['Content-Type'] = 'application/json'
+        resp._content = json_body
+        if server_timing is not None:
+            resp.headers['Server-Timing'] = server_timing
+    except Exception as e:
+        print(f"[HttpAdapter] Error serializing hook response: {e}")
+        resp.status_code = 500
+        resp.reason = "Internal Server Error"
+        resp.headers['Content-Type'] = 'application/json'
+        error_payload = json.dumps({"status": "error", "message": str(e)})
+        resp._content = error_payload.encode('utf-8')
+    resp._header = resp.build_response_header(req)
+    return resp._header + resp._content
 
 class HttpAdapter:
     """
@@ -39,11 +170,21 @@ class HttpAdapter:
         "routes",
         "request",
         "response",
+        "tracer",
+        "limiter",
     ]
 
-    def __init__(self, ip, port, conn, connaddr, routes):
+    def __init__(self, ip, port, conn, connaddr, routes, tracer=None, limiter=None,
+                 keep_alive=None):
         """
         Initialize a new HttpAdapter instance.
+
+        :param tracer (SpanExporter): where the spans of the request go, or None.
+        :param limiter (RateLimiter): charges requests forwarded by a trusted proxy
+                                      to their client, and the requests following the
+                                      first one of a persistent connection, or None.
+        :param keep_alive (callable): returns False once the server stops accepting;
+                                      None serves a single request per connection.
         """
 
         #: IP address.
@@ -60,24 +201,88 @@ class HttpAdapter:
         self.request = Request()
         #: Response
         self.response = Response()
+        #: Span exporter, None when tracing is disabled
+        self.tracer = tracer
+        #: Spans of the request being served
+        self.trace = None
+        #: Rate limiter, None when no limits are configured
+        self.limiter = limiter
+        #: Server state check of persistent connections, None disables them
+        self.keep_alive = keep_alive
+        #: Requests already served on the connection
+        self.served = 0
+        #: Bytes received past the end of the previous request
+        self.pending = b""
         
         # Gán connaddr cho request để start_chat_server.py có thể lấy IP
         self.request.connaddr = connaddr 
+        # Client thật khi đi qua proxy tin cậy (X-Forwarded-For), xem RateLimiter.client_ip
+        self.request.client_ip = connaddr[0]
 
     def handle_client(self, conn, addr, routes):
         """
-        Handle an incoming client connection.
+        Handle an incoming client connection: a single request, or with keep-alive
+        enabled, the requests the client sends until one of them closes it.
         """
 
         self.conn = conn        
         self.connaddr = addr
+        while self.serve_request(conn, addr, routes):
+            self.served += 1
+            if not self.wait_next_request(conn):
+                return
+            # Đối tượng mới cho mỗi request, handler có thể còn giữ tham chiếu
+            self.request = Request()
+            self.request.connaddr = addr
+            self.request.client_ip = addr[0]
+            self.response = Response()
+            self.trace = None
+
+    def wait_next_request(self, conn):
+        """
+        Wait for the next request of a persistent connection, waking up regularly
+        to notice a server stop.
+
+        :rtype bool: True once the request has started to arrive.
+        """
+        deadline = time.monotonic() + KEEPALIVE_TIMEOUT
+        conn.settimeout(KEEPALIVE_POLL)
+        try:
+            while not self.pending:
+                if not self.keep_alive():
+                    return False
+                try:
+                    chunk = conn.recv(1024)
+                except socket.timeout:
+                    if time.monotonic() >= deadline:
+                        return False
+                    continue
+                if not chunk:
+                    return False
+                self.pending = chunk
+        except OSError:
+            return False
+        finally:
+            try:
+                conn.settimeout(None)
+            except OSError:
+                pass
+        return True
+
+    def serve_request(self, conn, addr, routes):
+        """
+        Read, dispatch and answer one request of the connection.
+
+        :rtype bool: True if the connection stays open for another request.
+        """
         req = self.request
         resp = self.response
+        started = time.monotonic()
 
         # --- SỬA LỖI ĐỌC BUFFER TCP ---
         try:
             # 1. Đọc phần header trước (giả định header không quá 4096 bytes)
-            header_data = b""
+            header_data, self.pending = self.pending, b""
             while b'\r\n\r\n' not in header_data:
                 chunk = conn.recv(1024)
                 if not chunk:
@@ -86,7 +291,7 @@ class HttpAdapter:
             
             if not header_data:
                 print(f"Client {addr} disconnected before sending headers.")
-                return 
+                return False
             
             # 2. Tách header và phần body (có thể đã đọc lố)
             parts = header_data.split(b'\r\n\r\n', 1)
@@ -103,30 +308,50 @@ class HttpAdapter:
             content_length = int(headers_dict.get('content-length', 0))
 
             # 4. Đọc phần body còn lại (nếu có)
+            complete = 'transfer-encoding' not in headers_dict
             while len(body_bytes) < content_length:
                 bytes_to_read = content_length - len(body_bytes)
                 chunk = conn.recv(min(bytes_to_read, 4096)) # Đọc phần còn thiếu
                 if not chunk:
                     print(f"Client {addr} disconnected before sending full body.")
+                    complete = False
                     break # Client ngắt kết nối
                 body_bytes += chunk
+            # Phần đọc lố thuộc về request kế tiếp (pipelining)
+            body_bytes, self.pending = body_bytes[:content_length], body_bytes[content_length:]
                 
             # msg = Toàn bộ request
             msg = header_text + '\r\n\r\n' + body_bytes.decode('utf-8')
 
         except Exception as e:
             print(f"Error receiving full request data from {addr}: {e}")
-            return
+            return False
         # --- KẾT THÚC SỬA LỖI ĐỌC BUFFER ---
 
         req.prepare(msg, routes)
+        if self.tracer is not None:
+            self.trace = ServerTrace(self.tracer, req.headers, started)
+            self.lap("parse")
 
         response = None # Khởi tạo response
 
+        # Behind a trusted proxy the connection was not limited at accept: charge
+        # the request to the forwarded client instead. Later requests of a
+        # persistent connection are charged like new connections
+        if self.limiter is not None:
+            req.client_ip = self.limiter.client_ip(addr[0], req.headers.get("x-forwarded-for"))
+            if addr[0] in self.limiter.trusted_proxies or self.served:
+                allowed, retry_after = self.limiter.check_client(req.client_ip)
+                if not allowed:
+                    print(f"[HttpAdapter] Rate limited client {req.client_ip} behind {addr}")
+                    response = resp.build_too_many_requests(retry_after)
+
         # --- BẮT ĐẦU LOGIC TASK 1A & 1B (Theo PDF) ---
 
         # Task 1A: Xử lý POST /login
-        if req.method == 'POST' and req.path == '/login':
+        if response is not None:
+            pass # Đã bị rate limit
+        elif req.method == 'POST' and req.path == '/login':
             form_data = {}
             if req.body:
                 pairs = req.body.split('&')
@@ -148,7 +373,7 @@ class HttpAdapter:
                 response = resp.build_unauthorized()
         
         # Task 1B: Xử lý GET (kiểm tra cookie)
-        elif req.method == 'GET':
+        elif req.method == 'GET' and not req.hook:
             if req.path == '/login.html':
                 print(f"[HttpAdapter] Serving public asset: {req.path}")
                 response = resp.build_response(req)
@@ -164,54 +389,91 @@ class HttpAdapter:
         # --- KẾT THÚC LOGIC TASK 1 ---
 
         # Handle request hook (Task 2 - WeApRous)
-        if req.hook:
-            if response is None: 
-                print(f"[HttpAdapter] hook in route-path METHOD {req.hook._route_path} PATH {req.hook._route_methods}")
-                
-                try:
-                    handler_result_dict = req.hook(request=req, response=resp)
-                except TypeError: 
-                    try:
-                        handler_result_dict = req.hook(headers=req.headers, body=req.body)
-                    except Exception as e:
-                         print(f"[HttpAdapter] Error executing hook (headers, body): {e}")
-                         handler_result_dict = {"status": "error", "message": f"Hook execution error: {e}"}
-                         resp.status_code = 500
-                         resp.reason = "Internal Server Error"
-                except Exception as e:
-                    print(f"[HttpAdapter] Error executing hook (request, response): {e}")
-                    handler_result_dict = {"status": "error", "message": f"Hook execution error: {e}"}
-                    resp.status_code = 500
-                    resp.reason = "Internal Server Error"
-
-                # Xử lý kết quả trả về từ hook
-                try:
-                    json_body = json.dumps(handler_result_dict).encode('utf-8') 
-                    
-                    if resp.status_code is None: 
-                        resp.status_code = 200
-                        resp.reason = "OK"
-                        
-                    resp.headers['Content-Type'] = 'application/json' 
-                    resp._content = json_body
-                        
-                    resp._header = resp.build_response_header(req)
-                    response = resp._header + resp._content
-                    
-                except Exception as e:
-                    print(f"[HttpAdapter] Error serializing hook response: {e}")
-                    resp.status_code = 500
-                    resp.reason = "Internal Server Error"
-                    resp.headers['Content-Type'] = 'application/json'
-                    error_payload = json.dumps({"status": "error", "message": str(e)})
-                    resp._content = error_payload.encode('utf-8')
-                    resp._header = resp.build_response_header(req)
-                    response = resp._header + resp._content
+        if req.hook and response is None:
+            response = self.dispatch_hook(req, resp)
 
         if response is None:
             response = resp.build_response(req)
+        keep_alive = (self.keep_alive is not None and complete and self.keep_alive()
+                      and self.served + 1 < KEEPALIVE_MAX
+                      and keeps_alive(req.version, req.headers))
+        if keep_alive:
+            response, keep_alive = self.persist(response)
+        self.lap("serialize")
+
+        try:
+            conn.sendall(response)
+        finally:
+            if self.trace is not None:
+                self.lap("send")
+                self.trace.finish(**{"http.method": req.method, "http.path": req.path,
+                                     "http.status_code": response[9:12].decode("latin-1")})
+        return keep_alive
 
-        conn.sendall(response)
+    def persist(self, response):
+        """
+        Mark a response as keeping the connection open. Responses are built (and
+        cached) with ``Connection: close``; only those delimited by
+        ``Content-Length`` can be followed by another one.
+
+        :param response (bytes): the complete response.
+
+        :rtype tuple: (response, kept alive).
+        """
+        end = response.find(b"\r\n\r\n") + 4
+        if end < 4:
+            return response, False
+        _, headers = parse_head(response[:end])
+        if "content-length" not in headers:
+            return response, False
+        return rewrite_head(response[:end], {"Connection": "keep-alive"}) + response[end:], True
+
+    def lap(self, name):
+        """
+        Close the traced step ``name`` of the request, if tracing is enabled.
+        """
+        if self.trace is not None:
+            self.trace.lap(name)
+
+    def dispatch_hook(self, req, resp):
+        """
+        Run the WeApRous hook mapped to the request and serialize its result
+        as a JSON response.
+
+        Routes declared with ``rate_limit`` are checked against the client's route
+        bucket first and answered with 429 when it is empty. Routes declared with
+        ``cache_ttl`` are answered from the route cache when possible; otherwise the
+        fresh response bytes are stored for later requests.
+
+        :param req (Request): the prepared request carrying the hook.
+        :param resp (Response): the response object to fill.
+
+        :rtype bytes: the complete HTTP response.
+        """
+        route_limit = getattr(req.hook, '_route_rate_limit', None)
+        if route_limit is not None:
+            limiter, rate, burst = route_limit
+            allowed, retry_after = limiter.check_route(req.client_ip, req.method, req.path, rate, burst)
+            if not allowed:
+                print(f"[HttpAdapter] Route rate limit hit by {req.client_ip} on {req.method} {req.path}")
+                self.lap("dispatch")
+                return resp.build_too_many_requests(retry_after)
+
+        lookup = cache_lookup(req)
+        if lookup[3] is not None:
+            self.lap("dispatch")
+            return lookup[3]
+
+        handler_result_dict = run_hook(req, resp)
+        self.lap("dispatch")
+
+        # Not on cached routes, a stored response would replay old timings
+        server_timing = None
+        if self.trace is not None and lookup[0] is None:
+            server_timing = self.trace.server_timing()
+        response = serialize_hook_result(req, resp, handler_result_dict, server_timing)
+        cache_store(req, resp, response, lookup)
+        return response
 
     @property
     def extract_cookies(self, req, resp):
@@ -0,0 +1,547 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.httpcache
+~~~~~~~~~~~~~~~~~
+
+This module provides :class:`HttpCache <HttpCache>`, the shared response cache of the
+proxy. Unlike :class:`ResponseCache <ResponseCache>`, which caches route results inside
+one WeApRous app with a TTL chosen by the route, this cache follows the HTTP caching
+headers sent by the backends (RFC 7234):
+
+- only ``GET`` responses with an explicit lifetime are stored (``s-maxage``,
+  ``max-age`` or ``Expires``); ``no-store``, ``private``, ``Set-Cookie`` and
+  ``Vary: *`` responses are not, and requests with ``Authorization`` bypass the cache;
+- ``Vary`` selects a variant from the listed request headers;
+- a stale entry with an ``ETag`` or ``Last-Modified`` is revalidated with a
+  conditional request, a ``304`` refreshes it without transferring the body;
+- within ``stale-while-revalidate`` the stale entry is served at once and refreshed
+  in the background;
+- unsafe methods (``POST``, ``PUT``, ``DELETE``...) invalidate the target URL.
+
+Entries live in a memory tier bounded in bytes (LRU). With ``disk_dir`` set, entries
+evicted from memory are demoted to a disk tier, itself a byte-bounded LRU, and
+promoted back on a hit. The disk tier is rebuilt from its directory at startup.
+
+Usage Example:
+--------------
+>>> cache = HttpCache(max_bytes=64 * 1024 * 1024, disk_dir="/var/cache/weaprous")
+>>> entry = cache.lookup("app1.local/static/app.js", request.headers)
+>>> if entry is None or not entry.fresh():
+...     entry = cache.store("app1.local/static/app.js", request.headers, head, body, 200)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from .framing import parse_head, rewrite_head
+
+#: Statuses stored when the response carries an explicit lifetime.
+CACHEABLE_STATUS = (200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501)
+
+#: Response headers taken from a ``304 Not Modified`` into the stored entry.
+REFRESHED_HEADERS = ("cache-control", "expires", "date", "etag", "last-modified", "vary")
+
+
+def parse_cache_control(value):
+    """
+    :param value (str): a ``Cache-Control`` header value.
+
+    :rtype dict: lowercase directive -> value (None for directives without value).
+    """
+    directives = {}
+    for part in value.split(","):
+        name, sep, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def seconds(directives, name):
+    """
+    :rtype int: the integer value of a directive, or None if absent or invalid.
+    """
+    try:
+        return max(0, int(directives.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+def http_date(value):
+    """
+    :param value (str): an HTTP date such as ``Wed, 21 Oct 2015 07:28:00 GMT``.
+
+    :rtype float: the Unix timestamp, or None if the date is invalid.
+    """
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def request_cacheable(request):
+    """
+    :param request (ProxyRequest): the client request.
+
+    :rtype bool: whether the cache may answer or store this request.
+    """
+    if request.method != "GET" or "authorization" in request.headers:
+        return False
+    return "no-store" not in parse_cache_control(request.headers.get("cache-control", ""))
+
+
+def wants_revalidation(request):
+    """
+    :rtype bool: True if the client asked for an end-to-end revalidation
+                 (``no-cache`` or ``max-age=0``).
+    """
+    directives = parse_cache_control(request.headers.get("cache-control", ""))
+    return "no-cache" in directives or seconds(directives, "max-age") == 0 \
+        or "no-cache" in request.headers.get("pragma", "").lower()
+
+
+class CacheEntry:
+    """One stored response.
+
+    :attrs status (int): response status code.
+    :attrs head (bytes): response header block as received from the backend.
+    :attrs body (bytes): raw response body (chunk framing kept).
+    :attrs stored_at (float): Unix time the response was received or revalidated.
+    :attrs lifetime (float): freshness lifetime in seconds.
+    :attrs swr (float): ``stale-while-revalidate`` window in seconds.
+    """
+
+    __slots__ = ("key", "variant", "status", "head", "body", "stored_at", "initial_age",
+                 "lifetime", "swr", "must_revalidate", "etag", "last_modified", "vary")
+
+    def __init__(self, key, variant, status, head, body, stored_at, initial_age, lifetime,
+                 swr, must_revalidate, etag, last_modified, vary):
+        self.key = key
+        self.variant = variant
+        self.status = status
+        self.head = head
+        self.body = body
+        self.stored_at = stored_at
+        self.initial_age = initial_age
+        self.lifetime = lifetime
+        self.swr = swr
+        self.must_revalidate = must_revalidate
+        self.etag = etag
+        self.last_modified = last_modified
+        self.vary = vary
+
+    @property
+    def size(self):
+        return len(self.head) + len(self.body)
+
+    def age(self, now=None):
+        """
+        :rtype float: current age of the response in seconds.
+        """
+        return self.initial_age + max(0.0, (now or time.time()) - self.stored_at)
+
+    def fresh(self, now=None):
+        return self.age(now) < self.lifetime
+
+    def stale_servable(self, now=None):
+        """
+        :rtype bool: True while a stale entry may still be served during revalidation.
+        """
+        return not self.must_revalidate and self.age(now) < self.lifetime + self.swr
+
+    def validators(self):
+        """
+        :rtype dict: conditional request headers for revalidating this entry.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_meta(self):
+        meta = {name: getattr(self, name) for name in self.__slots__ if name not in ("head", "body")}
+        meta["variant"] = list(self.variant)
+        meta["head"] = self.head.decode("latin-1")
+        return meta
+
+    @classmethod
+    def from_meta(cls, meta, body):
+        meta = dict(meta)
+        meta["variant"] = tuple(meta["variant"])
+        meta["vary"] = tuple(meta["vary"])
+        meta["head"] = meta["head"].encode("latin-1")
+        return cls(body=body, **meta)
+
+
+def build_entry(key, request_headers, resp_head, body, status, max_object):
+    """
+    Decide whether a backend response may be stored and build its entry.
+
+    :param key (str): primary cache key (host and target).
+    :param request_headers (CaseInsensitiveDict): headers of the request.
+    :param resp_head (bytes): response header block.
+    :param body (bytes): raw response body.
+    :param status (int): response status code.
+    :param max_object (int): largest storable response in bytes.
+
+    :rtype CacheEntry: the entry, or None if the response is not cacheable.
+    """
+    if status not in CACHEABLE_STATUS or len(resp_head) + len(body) > max_object:
+        return None
+    _, headers = parse_head(resp_head)
+    directives = parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in directives or "private" in directives or "set-cookie" in headers:
+        return None
+    vary = tuple(sorted(name.strip().lower() for name in headers.get("vary", "").split(",")
+                        if name.strip()))
+    if "*" in vary:
+        return None
+
+    now = time.time()
+    lifetime = seconds(directives, "s-maxage")
+    if lifetime is None:
+        lifetime = seconds(directives, "max-age")
+    if lifetime is None and "expires" in headers:
+        expires = http_date(headers["expires"])
+        date = http_date(headers.get("date", "")) or now
+        lifetime = max(0.0, expires - date) if expires is not None else 0
+    if lifetime is None:
+        # No explicit lifetime: not stored (no heuristic freshness)
+        return None
+    if "no-cache" in directives:
+        lifetime = 0
+
+    try:
+        initial_age = max(0, int(headers.get("age", "0")))
+    except ValueError:
+        initial_age = 0
+    etag = headers.get("etag")
+    last_modified = headers.get("last-modified")
+    if lifetime == 0 and not etag and not last_modified:
+        # Would have to be refetched every time anyway
+        return None
+
+    must_revalidate = "must-revalidate" in directives or "proxy-revalidate" in directives
+    swr = seconds(directives, "stale-while-revalidate") or 0
+    variant = tuple(request_headers.get(name, "").strip() for name in vary)
+    return CacheEntry(key, variant, status, resp_head, body, now, initial_age, lifetime,
+                      swr, must_revalidate, etag, last_modified, vary)
+
+
+class DiskTier:
+    """Byte-bounded LRU of cache entries stored one file per entry in ``directory``.
+    Each file holds one JSON metadata line followed by the raw body."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = OrderedDict()   # file name -> size, oldest first
+        self.bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._rebuild()
+
+    @staticmethod
+    def key_prefix(key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + "-"
+
+    @classmethod
+    def file_name(cls, key, variant):
+        # Every variant of a URL shares the prefix, so invalidation finds them all
+        return cls.key_prefix(key) + hashlib.sha256(repr(variant).encode("utf-8")).hexdigest()[:16]
+
+    def _rebuild(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                files.append((os.path.getmtime(path), name, os.path.getsize(path)))
+        for _, name, size in sorted(files):
+            self.index[name] = size
+            self.bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self.index:
+            name, size = self.index.popitem(last=False)
+            self.bytes -= size
+            self._unlink(name)
+
+    def _unlink(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def get(self, key, variant):
+        """
+        :rtype CacheEntry: the stored entry, or None.
+        """
+        name = self.file_name(key, variant)
+        with self.lock:
+            if name not in self.index:
+                return None
+            self.index.move_to_end(name)
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                return CacheEntry.from_meta(meta, f.read())
+        except (OSError, ValueError, TypeError, KeyError):
+            self.remove(key, variant)
+            return None
+
+    def put(self, entry):
+        """
+        Write an entry, replacing any previous version of it.
+        """
+        name = self.file_name(entry.key, entry.variant)
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(json.dumps(entry.to_meta()).encode("utf-8") + b"\n")
+                f.write(entry.body)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"[HttpCache] Disk write failed: {e}")
+            self._unlink(os.path.basename(tmp))
+            return
+        with self.lock:
+            self.bytes += size - self.index.pop(name, 0)
+            self.index[name] = size
+            self._evict()
+
+    def remove(self, key, variant=None):
+        """
+        Remove one variant of a URL, or all of them when ``variant`` is None.
+        """
+        with self.lock:
+            if variant is None:
+                prefix = self.key_prefix(key)
+                names = [name for name in self.index if name.startswith(prefix)]
+            else:
+                names = [self.file_name(key, variant)]
+            removed = []
+            for name in names:
+                size = self.index.pop(name, None)
+                if size is not None:
+                    self.bytes -= size
+                    removed.append(name)
+        for name in removed:
+            self._unlink(name)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.index), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+class HttpCache:
+    """The :class:`HttpCache <HttpCache>` object, a shared HTTP cache keyed by
+    ``host + target`` and the ``Vary`` request headers.
+
+    :attrs max_bytes (int): memory tier capacity in bytes.
+    :attrs max_object (int): largest cached response in bytes.
+    :attrs disk (DiskTier): optional second tier, None when disabled.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_object=1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_object = max_object
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # (key, variant) -> CacheEntry, oldest first
+        self.vary = {}                  # key -> names of the Vary request headers
+        self.bytes = 0
+        self.refreshing = set()
+        self.disk = DiskTier(disk_dir, disk_max_bytes) if disk_dir else None
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "revalidated": 0,
+                         "stores": 0, "evictions": 0, "disk_hits": 0, "invalidations": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def lookup(self, key, request_headers):
+        """
+        Find the stored variant matching a request, fresh or not.
+
+        :param key (str): primary cache key.
+        :param request_headers (CaseInsensitiveDict): headers of the request.
+
+        :rtype CacheEntry: the entry, or None.
+        """
+        with self.lock:
+            vary = self.vary.get(key, ())
+            variant = tuple(request_headers.get(name, "").strip() for name in vary)
+            entry = self.entries.get((key, variant))
+            if entry is not None:
+                self.entries.move_to_end((key, variant))
+                return entry
+        if self.disk is None:
+            return None
+        entry = self.disk.get(key, variant)
+        if entry is not None:
+            self.count("disk_hits")
+            self._insert(entry)
+        return entry
+
+    def store(self, key, request_headers, resp_head, body, status):
+        """
+        Store a backend response if its headers allow it.
+
+        :rtype CacheEntry: the stored entry, or None if the response is not cacheable.
+        """
+        entry = build_entry(key, request_headers, resp_head, body, status, self.max_object)
+        if entry is None:
+            return None
+        self.count("stores")
+        self._insert(entry)
+        return entry
+
+    def refresh(self, entry, resp_head):
+        """
+        Apply a ``304 Not Modified`` to a stored entry: merge the updated headers and
+        restart its freshness lifetime.
+
+        :rtype CacheEntry: the refreshed entry (None if it is no longer cacheable).
+        """
+        _, headers = parse_head(resp_head)
+        updates = {name: headers[name] for name in REFRESHED_HEADERS if name in headers}
+        head = rewrite_head(entry.head, updates, drop=("age",))
+        refreshed = build_entry(entry.key, {}, head, entry.body, entry.status, self.max_object)
+        self.count("revalidated")
+        if refreshed is None:
+            self.invalidate(entry.key)
+            return None
+        # The request that selected this variant is the same one
+        refreshed.variant = entry.variant
+        self._insert(refreshed)
+        return refreshed
+
+    def _insert(self, entry):
+        demoted = []
+        with self.lock:
+            slot = (entry.key, entry.variant)
+            old = self.entries.pop(slot, None)
+            if old is not None:
+                self.bytes -= old.size
+            self.vary[entry.key] = entry.vary
+            self.entries[slot] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.counters["evictions"] += 1
+                demoted.append(evicted)
+        if self.disk is not None:
+            for evicted in demoted:
+                self.disk.put(evicted)
+
+    def invalidate(self, key):
+        """
+        Drop every variant of a URL, from both tiers.
+
+        :param key (str): primary cache key.
+        """
+        with self.lock:
+            slots = [slot for slot in self.entries if slot[0] == key]
+            for slot in slots:
+                self.bytes -= self.entries.pop(slot).size
+            self.vary.pop(key, None)
+            self.counters["invalidations"] += 1
+        if self.disk is not None:
+            self.disk.remove(key)
+
+    def claim_refresh(self, key):
+        """
+        :rtype bool: True if the caller should run the background refresh of ``key``,
+                     False if one is already running.
+        """
+        with self.lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+            return True
+
+    def release_refresh(self, key):
+        with self.lock:
+            self.refreshing.discard(key)
+
+    def stats(self):
+        """
+        :rtype dict: hit/miss counters, hit ratio and tier sizes.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+            snapshot["entries"] = len(self.entries)
+            snapshot["bytes"] = self.bytes
+            snapshot["max_bytes"] = self.max_bytes
+        served = snapshot["hits"] + snapshot["stale_hits"] + snapshot["revalidated"]
+        lookups = served + snapshot["misses"]
+        snapshot["hit_ratio"] = round(served / lookups, 4) if lookups else 0.0
+        if self.disk is not None:
+            snapshot["disk"] = self.disk.stats()
+        return snapshot
+
+
+def cached_head(entry, state, now=None):
+    """
+    Build the header block sent to a client for a cached entry.
+
+    :param entry (CacheEntry): the cached response.
+    :param state (str): value of the ``X-Cache`` header (HIT, STALE, REVALIDATED...).
+
+    :rtype bytes: the header block.
+    """
+    return rewrite_head(entry.head, {"Age": str(int(entry.age(now))), "X-Cache": state,
+                                     "Connection": "close"})
+
+
+def not_modified(entry, request_headers):
+    """
+    :rtype bool: True if the client's ``If-None-Match`` / ``If-Modified-Since`` already
+                 matches the cached entry, so a ``304`` can be sent without the body.
+    """
+    if entry.status != 200:
+        return False
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if not entry.etag:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        weak = entry.etag[2:] if entry.etag.startswith("W/") else entry.etag
+        return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == weak for tag in tags)
+    since = http_date(request_headers.get("if-modified-since", ""))
+    modified = http_date(entry.last_modified or "")
+    return since is not None and modified is not None and modified <= since
+
+
+def not_modified_head(entry, state, now=None):
+    """
+    :rtype bytes: a ``304 Not Modified`` header block for a cached entry.
+    """
+    _, headers = parse_head(entry.head)
+    lines = ["HTTP/1.1 304 Not Modified"]
+    for name in ("cache-control", "expires", "date", "etag", "last-modified", "vary"):
+        if name in headers:
+            lines.append(f"{name}: {headers[name]}")
+    lines += [f"Age: {int(entry.age(now))}", f"X-Cache: {state}", "Connection: close"]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
@@ -0,0 +1,241 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.lifecycle
+~~~~~~~~~~~~~~~~~
+
+This module provides the listening socket and shutdown handling shared by the backend
+and the proxy daemons.
+
+- ``SIGTERM`` / ``SIGINT`` start a graceful shutdown: the daemon stops accepting,
+  lets in-flight connections finish within ``drain_timeout`` seconds, then closes.
+  A second signal abandons the drain.
+- ``SIGUSR2`` performs a zero-downtime restart: the daemon re-executes itself with
+  the listening socket inherited through the ``WEAPROUS_LISTEN_FD`` environment
+  variable, then drains. Connections arriving meanwhile wait in the shared accept
+  backlog until the new process accepts them, so none are refused.
+
+Usage Example:
+--------------
+>>> listener = create_listener("0.0.0.0", 9000)
+>>> lifecycle = ServerLifecycle("Backend", listener)
+>>> lifecycle.install_signals()
+>>> while lifecycle.running():
+...     conn, addr = lifecycle.accept()
+...     if conn is not None:
+...         lifecycle.spawn(handle, (conn, addr))
+>>> lifecycle.drain()
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+import subprocess
+
+#: Environment variable carrying the inherited listening socket descriptor.
+LISTEN_FD_ENV = "WEAPROUS_LISTEN_FD"
+
+#: Default seconds granted to in-flight connections at shutdown.
+DRAIN_TIMEOUT = 10
+
+#: Accept timeout, bounds how long a stop request waits for the accept loop.
+ACCEPT_POLL = 0.5
+
+
+def create_listener(ip, port, backlog=50):
+    """
+    Create the listening socket, or adopt the one inherited from a previous
+    process during a zero-downtime restart.
+
+    :param ip (str): IP address to bind.
+    :param port (int): port number to listen on.
+    :param backlog (int): listen backlog.
+
+    :rtype socket.socket: the listening socket.
+    """
+    inherited = os.environ.pop(LISTEN_FD_ENV, None)
+    if inherited:
+        listener = socket.socket(fileno=int(inherited))
+        print(f"[Lifecycle] Inherited listening socket fd {inherited} on {listener.getsockname()}")
+        return listener
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((ip, port))
+    listener.listen(backlog)
+    return listener
+
+
+def spawn_successor(name, listener):
+    """
+    Start a new instance of this program that inherits the listening socket.
+
+    :param name (str): log prefix of the daemon.
+    :param listener (socket.socket): the listening socket to hand over.
+
+    :rtype subprocess.Popen: the successor process.
+    """
+    fd = listener.fileno()
+    os.set_inheritable(fd, True)
+    env = dict(os.environ)
+    env[LISTEN_FD_ENV] = str(fd)
+    successor = subprocess.Popen([sys.executable] + sys.argv, env=env, pass_fds=(fd,))
+    print(f"[{name}] Started successor pid {successor.pid} with listening fd {fd}")
+    return successor
+
+
+class ServerLifecycle:
+    """The :class:`ServerLifecycle <ServerLifecycle>` object, which owns the accept
+    loop state of a daemon: stop/restart requests and the in-flight connection threads.
+
+    :attrs name (str): log prefix of the daemon (e.g. "Backend", "Proxy").
+    :attrs listener (socket.socket): the listening socket.
+    :attrs drain_timeout (float): seconds granted to in-flight connections at shutdown.
+    """
+
+    def __init__(self, name, listener, drain_timeout=DRAIN_TIMEOUT):
+        self.name = name
+        self.listener = listener
+        self.drain_timeout = drain_timeout
+        self.stopping = threading.Event()
+        self.force = False
+        self.threads = set()
+        self.lock = threading.Lock()
+        self.listener.settimeout(ACCEPT_POLL)
+
+    def install_signals(self):
+        """
+        Install the shutdown and restart signal handlers. Signals can only be
+        handled by the main thread, elsewhere this is a no-op.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, self._on_restart)
+
+    def _on_stop(self, signum, frame):
+        if self.stopping.is_set():
+            print(f"[{self.name}] Second stop signal, abandoning drain")
+            self.force = True
+            return
+        print(f"[{self.name}] Signal {signum} received, shutting down gracefully")
+        self.stop()
+
+    def _on_restart(self, signum, frame):
+        if self.stopping.is_set():
+            return
+        try:
+            self.spawn_successor()
+        except OSError as e:
+            print(f"[{self.name}] Restart failed, keep serving: {e}")
+            return
+        self.stop()
+
+    def running(self):
+        """
+        :rtype bool: False once a stop or restart has been requested.
+        """
+        return not self.stopping.is_set()
+
+    def stop(self):
+        """
+        Request the accept loop to stop; in-flight connections keep running.
+        """
+        self.stopping.set()
+
+    def accept(self):
+        """
+        Accept one connection, waking up regularly to notice stop requests.
+
+        :rtype tuple: (conn, addr), or (None, None) on timeout or stop.
+        """
+        try:
+            return self.listener.accept()
+        except socket.timeout:
+            return None, None
+        except OSError:
+            if self.stopping.is_set():
+                return None, None
+            raise
+
+    def spawn(self, target, args):
+        """
+        Run a connection handler in a tracked thread so that shutdown can wait for it.
+
+        :param target (callable): the connection handler.
+        :param args (tuple): arguments of the handler.
+        """
+        def run():
+            try:
+                target(*args)
+            finally:
+                with self.lock:
+                    self.threads.discard(threading.current_thread())
+
+        thread = threading.Thread(target=run)
+        # Still daemon so a drain deadline can end the process, but now joined on shutdown
+        thread.daemon = True
+        with self.lock:
+            self.threads.add(thread)
+        thread.start()
+
+    def in_flight(self):
+        """
+        :rtype int: number of connection handlers still running.
+        """
+        with self.lock:
+            return len(self.threads)
+
+    def spawn_successor(self):
+        """
+        Start a new instance of this program that inherits the listening socket.
+
+        :rtype subprocess.Popen: the successor process.
+        """
+        return spawn_successor(self.name, self.listener)
+
+    def drain(self):
+        """
+        Close the listening socket and wait for the in-flight connections,
+        at most ``drain_timeout`` seconds.
+
+        :rtype bool: True if every connection finished in time.
+        """
+        self.stopping.set()
+        try:
+            self.listener.close()
+        except OSError:
+            pass
+
+        deadline = time.monotonic() + self.drain_timeout
+        with self.lock:
+            pending = list(self.threads)
+        if pending:
+            print(f"[{self.name}] Draining {len(pending)} in-flight connection(s)")
+        for thread in pending:
+            remaining = deadline - time.monotonic()
+            while thread.is_alive() and remaining > 0 and not self.force:
+                thread.join(min(remaining, ACCEPT_POLL))
+                remaining = deadline - time.monotonic()
+
+        left = self.in_flight()
+        if left:
+            print(f"[{self.name}] Drain deadline reached, {left} connection(s) cut off")
+            return False
+        print(f"[{self.name}] All connections drained")
+        return True
@@ -25,14 +25,41 @@ Requirement:
 - response: customized :class: `Response <Response>` utilities.
 - httpadapter: :class: `HttpAdapter <HttpAdapter >` adapter for HTTP request processing.
 - dictionary: :class: `CaseInsensitiveDict <CaseInsensitiveDict>` for managing headers and cookies.
+- lifecycle: listening socket hand-off (SIGUSR2) and graceful shutdown (SIGTERM/SIGINT).
+- upstream: per-backend pools of persistent (keep-alive) connections and live load figures.
+- balancer: load balancing policies selected by ``dist_policy``.
+- routing: routes compiled into exact, wildcard and default hosts with path-prefix locations.
+- framing: HTTP/1.1 message framing (Content-Length / chunked).
+- health: circuit breakers and active health checks that keep dead upstreams out of rotation.
+- httpcache: optional shared HTTP cache honoring the backends' caching headers.
+- coalesce: opt-in per-host single-flight of identical concurrent GETs.
+- retry: per-host retry, hedging and retry budget of idempotent requests.
+- upstream: ``max_conns`` per backend and the bounded request queue of saturated routes.
+- accesslog: per-request timing spans, JSON access log and latency histograms.
+- tls: optional HTTPS termination with per-host certificates.
+- tracing: ``traceparent`` propagation to the backends and span export.
 
 """
+import os
+import json
+import time
+import queue
 import socket
 import threading
-import itertools # Thêm thư viện để hỗ trợ round-robin
+from functools import partial
 from .response import *
 from .httpadapter import HttpAdapter
 from .dictionary import CaseInsensitiveDict
+from .lifecycle import create_listener, ServerLifecycle, DRAIN_TIMEOUT
+from .upstream import UPSTREAMS, SLOT_WAITERS
+from .health import HealthChecker
+from .httpcache import (request_cacheable, wants_revalidation, cached_head, not_modified,
+                        not_modified_head)
+from .routing import RoutingTable, compile_routes
+from .accesslog import RequestTiming, METRICS
+from .tracing import TRACEPARENT, REQUEST_START, format_traceparent
+from .framing import (HttpReader, BUFSIZE, parse_head, parse_status, request_framing,
+                      response_framing, keeps_alive, rewrite_head, HOP_BY_HOP)
 
 #: A dictionary mapping hostnames to backend IP and port tuples.
 #: Used to determine routing targets for incoming requests.
@@ -42,125 +69,832 @@ PROXY_PASS = {
     "app2.local": ('192.168.56.103', 9002),
 }
 
-# Biến toàn cục để lưu trữ vòng lặp round-robin cho các host
-round_robin_iterators = {}
-rr_lock = threading.Lock()
+NOT_FOUND = (
+    "HTTP/1.1 404 Not Found\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 13\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "404 Not Found"
+).encode('utf-8')
 
-def forward_request(host, port, request):
+# Backend nhận kết nối nhưng không trả lời được
+BAD_GATEWAY = (
+    "HTTP/1.1 502 Bad Gateway\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 15\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "502 Bad Gateway"
+).encode('utf-8')
+
+# Mọi backend của host đều đang bị loại (circuit breaker mở) hoặc đã đầy max_conns
+SERVICE_UNAVAILABLE = (
+    "HTTP/1.1 503 Service Unavailable\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 23\r\n"
+    "Retry-After: 5\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "503 Service Unavailable"
+).encode('utf-8')
+
+#: Path answered by the proxy itself (loopback clients only) with upstream health and load.
+STATUS_PATH = "/__proxy/status"
+
+#: Statuses that count as a failure of the upstream for its circuit breaker.
+UPSTREAM_ERRORS = (502, 503, 504)
+
+#: Methods that do not invalidate cached responses of their target.
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class ProxyRequest:
+    """
+    A client request read by the proxy: the parsed header block and a body that is
+    either buffered (small bodies, so the request can be replayed) or still waiting
+    on the client socket to be streamed.
+    """
+
+    __slots__ = ("head", "method", "target", "version", "headers", "framing", "reader", "body",
+                 "forward")
+
+    def __init__(self, head, method, target, version, headers, framing, reader, body):
+        self.head = head
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.framing = framing
+        self.reader = reader
+        #: Whole body when buffered, None when it is streamed from ``reader``
+        self.body = body
+        #: Headers added or replaced on the way to the backend, see :func:`forward_headers`
+        self.forward = {}
+
+    @property
+    def replayable(self):
+        return self.body is not None
+
+    def iter_body(self):
+        """
+        :rtype iterator: the request body chunks (a streamed body can be read once).
+        """
+        if self.body is not None:
+            return iter((self.body,)) if self.body else iter(())
+        return self.reader.iter_body(self.framing)
+
+
+def read_request(reader):
+    """
+    Reads the header block of the next client request. Bodies up to one buffer
+    are read eagerly, larger ones are left on the socket for streaming.
+
+    :params reader (HttpReader): reader on the client connection.
+
+    :rtype ProxyRequest: the request, or None if the client sent nothing.
+    """
+    head = reader.read_head()
+    if head is None:
+        return None
+    start_line, headers = parse_head(head)
+    try:
+        method, target, version = start_line.split(" ", 2)
+    except ValueError:
+        raise ValueError(f"Invalid request line {start_line!r}")
+    framing = request_framing(headers)
+    body = None
+    if framing[0] == "none":
+        body = b""
+    elif framing[0] == "length" and framing[1] <= BUFSIZE:
+        body = b"".join(reader.iter_body(framing))
+    return ProxyRequest(head, method, target, version, headers, framing, reader, body)
+
+
+def forward_headers(request, client, timing, scheme="http"):
+    """
+    Builds the headers telling the backend about the original request: the trace
+    context, with the proxy's span as parent, the client chain, the scheme, and the
+    time the proxy read the request (to measure the queueing in between).
+
+    :params request (ProxyRequest): the client request.
+    :params client (str): the client address.
+    :params timing (RequestTiming): the request timing, its trace already started.
+    :params scheme (str): ``"https"`` when the proxy terminated TLS.
+
+    :rtype dict: header name -> value.
+    """
+    forwarded_for = request.headers.get("x-forwarded-for")
+    return {
+        TRACEPARENT: format_traceparent(timing.trace_id, timing.span_id, timing.sampled),
+        "X-Forwarded-For": f"{forwarded_for}, {client}" if forwarded_for else client,
+        "X-Forwarded-Proto": scheme,
+        REQUEST_START: f"t={int(timing.wall * 1e6)}",
+    }
+
+
+def upstream_head(request):
+    """
+    Builds the header block sent to the backend for a client request.
+
+    :params request (ProxyRequest): the client request.
+
+    :rtype bytes: the rewritten header block.
+    """
+    # Ask the backend to keep the connection open for the next request
+    return rewrite_head(request.head, {"Connection": "keep-alive", **request.forward})
+
+
+def start_exchange(upstream, head, request):
+    """
+    Sends a request to an upstream over a pooled keep-alive connection and reads
+    the response header block.
+
+    A reused connection the backend has meanwhile closed fails before any response
+    byte arrives; a replayable request is then sent once more on a fresh connection.
+
+    :params upstream (Upstream): the backend to send to.
+    :params head (bytes): request header block, already rewritten for the upstream.
+    :params request (ProxyRequest): the client request (body and method).
+
+    :rtype tuple: (conn, resp_head, version, status, headers, framing) with the
+                  response body still unread on ``conn``.
+    """
+    pool = upstream.pool
+    while True:
+        conn = pool.acquire()
+        conn.acquired = time.monotonic()
+        reused = conn.requests > 0
+        try:
+            conn.sock.sendall(head)
+            for chunk in request.iter_body():
+                conn.sock.sendall(chunk)
+            resp_head = conn.reader.read_head()
+            if resp_head is None:
+                raise ConnectionError("upstream closed the connection")
+            status_line, headers = parse_head(resp_head)
+            version, status = parse_status(status_line)
+        except (socket.error, ConnectionError, ValueError):
+            pool.discard(conn)
+            if reused and request.replayable:
+                continue
+            raise
+        framing = response_framing(request.method, status, headers)
+        return conn, resp_head, version, status, headers, framing
+
+
+def exchange(upstream, head, request):
+    """
+    Sends one request to an upstream and reads the whole response, framed by
+    ``Content-Length`` or chunked encoding.
+
+    :params upstream (Upstream): the backend to send to.
+    :params head (bytes): request header block, already rewritten for the upstream.
+    :params request (ProxyRequest): the client request.
+
+    :rtype tuple: (response header block, response body bytes, status code).
+    """
+    conn, resp_head, version, status, headers, framing = start_exchange(upstream, head, request)
+    try:
+        resp_body = b"".join(conn.reader.iter_body(framing))
+    except Exception:
+        upstream.pool.discard(conn)
+        raise
+    upstream.pool.release(conn, framing[0] != "eof" and keeps_alive(version, headers))
+    return resp_head, resp_body, status
+
+
+class NoUpstream(Exception):
+    """No live upstream is left to send the request to."""
+
+
+class Saturated(NoUpstream):
+    """Every upstream of the route is at its ``max_conns`` and the request could
+    not wait for a slot (queue full or timed out)."""
+
+
+def acquire_upstream(route, request, client_ip, exclude=()):
     """
-    Forwards an HTTP request to a backend server and retrieves the response.
+    Reserves a connection slot on an upstream of the route. A first attempt that
+    finds every upstream at its ``max_conns`` waits in the route's queue until a
+    slot is freed; retries and hedges (``exclude`` not empty) never wait.
 
-    :params host (str): IP address of the backend server.
-    :params port (int): port number of the backend server.
-    :params request (str): incoming HTTP request.
+    :params route (Route): the route of the request.
+    :params request (ProxyRequest): the client request.
+    :params client_ip (str): the client address.
+    :params exclude (collection): names of the upstreams already tried.
 
-    :rtype bytes: Raw HTTP response from the backend server. If the connection
-                  fails, returns a 404 Not Found response.
+    :rtype Upstream: the reserved upstream, or None if every one is ejected or excluded.
+
+    :raises Saturated: if the request cannot wait for a slot.
     """
+    upstream = route.reserve(request, client_ip, exclude)
+    if upstream is not None or exclude or not route.busy():
+        return upstream
+    waitlist = route.queue
+    # A route compiled before its upstream got a limit has no queue
+    if waitlist is None or not waitlist.enter():
+        raise Saturated()
+    freed = threading.Event()
+    deadline = time.monotonic() + waitlist.timeout
+    served = False
+    SLOT_WAITERS.add(freed.set)
+    try:
+        while True:
+            # Cleared before trying, so a slot freed meanwhile is not missed
+            freed.clear()
+            upstream = route.reserve(request, client_ip)
+            if upstream is not None or not route.busy():
+                served = True
+                return upstream
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Saturated()
+            freed.wait(remaining)
+    finally:
+        SLOT_WAITERS.discard(freed.set)
+        waitlist.leave(served)
+
+
+class Attempt:
+    """
+    One request sent to one upstream whose response header block has been received;
+    the body is still unread on ``conn``.
+    """
+
+    __slots__ = ("upstream", "pool", "started", "answered", "conn", "head", "version",
+                 "status", "headers", "framing")
+
+    def __init__(self, upstream, pool, started, conn, head, version, status, headers, framing):
+        self.upstream = upstream
+        #: Pool the connection goes back to (the upstream's, or the asyncio engine's)
+        self.pool = pool
+        self.started = started
+        self.answered = time.monotonic()
+        self.conn = conn
+        self.head = head
+        self.version = version
+        self.status = status
+        self.headers = headers
+        self.framing = framing
+
+    @property
+    def ok(self):
+        return self.status not in UPSTREAM_ERRORS
 
-    backend = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def finish(self):
+        """
+        The body was fully read: return the connection to the pool if possible.
+        """
+        reusable = self.framing[0] != "eof" and keeps_alive(self.version, self.headers)
+        self.pool.release(self.conn, reusable)
+        self.upstream.end(self.ok)
 
+    def close(self, ok=None):
+        """
+        Abandon the response.
+
+        :params ok (bool): outcome reported to the circuit breaker, None for none.
+        """
+        self.pool.discard(self.conn)
+        self.upstream.end(ok)
+
+
+def send_attempt(upstream, head, request):
+    """
+    Sends a request to one upstream and waits for the response header block,
+    with the load and health accounting of the upstream.
+
+    :rtype Attempt: the answered attempt.
+    """
+    started = upstream.begin()
     try:
-        backend.connect((host, port))
-        backend.sendall(request.encode())
-        response = b""
+        conn, resp_head, version, status, headers, framing = start_exchange(upstream, head, request)
+    except (socket.error, ConnectionError, ValueError):
+        upstream.end(False)
+        raise
+    upstream.observe(started)
+    return Attempt(upstream, upstream.pool, started, conn, resp_head, version, status, headers,
+                   framing)
+
+
+class HedgeGroup:
+    """
+    The concurrent attempts of one hedged request. Attempts that answer after the
+    winner was chosen are closed without holding it against their upstream.
+    """
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.decided = False
+
+    def run(self, upstream, head, request):
+        try:
+            item = ("ok", send_attempt(upstream, head, request))
+        except (socket.error, ConnectionError, ValueError) as e:
+            item = ("error", e)
+        with self.lock:
+            if not self.decided:
+                self.results.put(item)
+                return
+        if item[0] == "ok":
+            item[1].close()
+
+    def launch(self, upstream, head, request):
+        thread = threading.Thread(target=self.run, args=(upstream, head, request))
+        thread.daemon = True
+        thread.start()
+
+    def decide(self):
+        with self.lock:
+            self.decided = True
         while True:
-            chunk = backend.recv(4096)
-            if not chunk:
-                break
-            response += chunk
-        return response
-    except socket.error as e:
-      print("Socket error: {}".format(e))
-      return (
-            "HTTP/1.1 404 Not Found\r\n"
-            "Content-Type: text/plain\r\n"
-            "Content-Length: 13\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            "404 Not Found"
-        ).encode('utf-8')
+            try:
+                kind, value = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "ok":
+                value.close()
+
 
+def retryable(policy, attempt):
+    return attempt.status in policy.retry_on
 
-def resolve_routing_policy(hostname, routes):
+
+def open_response(request, head, select_upstream, policy=None):
     """
-    Handles an routing policy to return the matching proxy_pass.
-    It determines the target backend to forward the request to.
+    Sends a request and returns the first usable response, retrying idempotent
+    requests on another upstream after a connection failure or a retryable status,
+    and hedging slow ones, as allowed by the host's :class:`RetryPolicy <RetryPolicy>`.
 
-    :params host (str): IP address of the request target server.
-    :params port (int): port number of the request target server.
-    :params routes (dict): dictionary mapping hostnames and location.
+    :params request (ProxyRequest): the client request.
+    :params head (bytes): request header block, already rewritten for the upstream.
+    :params select_upstream (callable): ``select_upstream(exclude)`` returns the next
+                                        Upstream, skipping the names in ``exclude``,
+                                        with a connection slot reserved.
+    :params policy (RetryPolicy): the host's retry policy, or None for a single attempt.
+
+    :rtype Attempt: the winning attempt. If every attempt failed, the last retryable
+                    response is returned, or the last connection error raised.
+
+    :raises NoUpstream: if no upstream could be selected at all.
     """
+    if policy is None or not policy.allows(request):
+        upstream = select_upstream(())
+        if upstream is None:
+            raise NoUpstream()
+        return send_attempt(upstream, head, request)
 
-    print(f"[Proxy] Resolving hostname: {hostname}")
-    # Lấy (proxy_map, policy) từ routes, nếu không thấy thì dùng default
-    proxy_map, policy = routes.get(hostname, (['127.0.0.1:9000'], 'round-robin'))
-    
-    print(f"[Proxy] Map: {proxy_map}")
-    print(f"[Proxy] Policy: {policy}")
-
-    proxy_host = '127.0.0.1'
-    proxy_port = '9000'
-    
-    # proxy_map có thể là 1 list (nhiều server) hoặc 1 string (1 server)
-    if isinstance(proxy_map, list):
-        if len(proxy_map) == 0:
-            print(f"[Proxy] Empty resolved routing for hostname {hostname}")
-            # --- BẮT ĐẦU HOÀN THÀNH TODO ---
-            proxy_host = '127.0.0.1'
-            proxy_port = '9000'
-            # --- KẾT THÚC HOÀN THÀNH TODO ---
-            
-        elif len(proxy_map) == 1:
-            # Chỉ có 1 server, dùng server đó
-            proxy_host, proxy_port = proxy_map[0].split(":", 1)
-            
+    policy.count("requests")
+    policy.budget.deposit()
+    delay = policy.hedge_delay()
+    if delay is not None:
+        return hedged_response(request, head, select_upstream, policy, delay)
+
+    tried, fallback, error = [], None, None
+    for number in range(policy.retries + 1):
+        upstream = select_upstream(tried)
+        if upstream is None:
+            break
+        if number > 0 and not policy.budget.withdraw():
+            upstream.release()
+            break
+        tried.append(upstream.name)
+        if number > 0:
+            policy.count("retries")
+        try:
+            attempt = send_attempt(upstream, head, request)
+        except (socket.error, ConnectionError, ValueError) as e:
+            error = e
+            continue
+        policy.observe(attempt.upstream, time.monotonic() - attempt.started)
+        if not retryable(policy, attempt):
+            if fallback is not None:
+                fallback.close(False)
+            return attempt
+        # Keep the error response in case no retry is possible
+        if fallback is not None:
+            fallback.close(False)
+        fallback = attempt
+    if fallback is not None:
+        return fallback
+    if error is not None:
+        raise error
+    raise NoUpstream()
+
+
+def hedged_response(request, head, select_upstream, policy, delay):
+    """
+    :func:`open_response` with hedging: a duplicate is sent to another upstream when
+    the first has not answered within ``delay`` seconds; the first usable answer wins.
+    """
+    group = HedgeGroup()
+    upstream = select_upstream(())
+    if upstream is None:
+        raise NoUpstream()
+    tried = [upstream.name]
+    group.launch(upstream, head, request)
+    pending, hedged, fallback, error = 1, False, None, None
+
+    def extra(counter):
+        if len(tried) > policy.retries:
+            return False
+        upstream = select_upstream(tried)
+        if upstream is None:
+            return False
+        if not policy.budget.withdraw():
+            upstream.release()
+            return False
+        tried.append(upstream.name)
+        policy.count(counter)
+        group.launch(upstream, head, request)
+        return True
+
+    while pending:
+        try:
+            kind, value = group.results.get(timeout=None if hedged else delay)
+        except queue.Empty:
+            hedged = True
+            pending += extra("hedges")
+            continue
+        pending -= 1
+        if kind == "ok":
+            policy.observe(value.upstream, time.monotonic() - value.started)
+            if not retryable(policy, value):
+                group.decide()
+                if fallback is not None:
+                    fallback.close(False)
+                if value.upstream.name != tried[0]:
+                    policy.count("hedge_wins")
+                return value
+            if fallback is not None:
+                fallback.close(False)
+            fallback = value
         else:
-            # Có nhiều server, áp dụng policy
-            # --- BẮT ĐẦU HOÀN THÀNH TODO (round-robin) ---
-            if policy == 'round-robin':
-                with rr_lock:
-                    if hostname not in round_robin_iterators:
-                        # Tạo một vòng lặp vô hạn cho host này
-                        round_robin_iterators[hostname] = itertools.cycle(proxy_map)
-                    # Lấy server tiếp theo trong vòng lặp
-                    next_server = next(round_robin_iterators[hostname])
-                proxy_host, proxy_port = next_server.split(":", 1)
-                print(f"[Proxy] Round-robin selected: {proxy_host}:{proxy_port}")
-            else:
-                # Policy khác (hoặc mặc định), cứ lấy cái đầu tiên
-                proxy_host, proxy_port = proxy_map[0].split(":", 1)
-            # --- KẾT THÚC HOÀN THÀNH TODO ---
-            
+            error = value
+        if not pending:
+            pending += extra("retries")
+
+    group.decide()
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+def fetch(head, request, select_upstream, policy=None, timing=None):
+    """
+    Sends a request through :func:`open_response` and reads the whole response,
+    for callers that need it buffered (the cache, single-flight).
+
+    :params timing (RequestTiming): receives the spans of the winning attempt, or None.
+
+    :rtype tuple: (response header block, response body bytes, status code).
+    """
+    attempt = open_response(request, head, select_upstream, policy)
+    if timing is not None:
+        timing.attempt(attempt)
+    try:
+        body = b"".join(attempt.conn.reader.iter_body(attempt.framing))
+    except Exception:
+        attempt.close(False)
+        raise
+    attempt.finish()
+    return attempt.head, body, attempt.status
+
+
+def cache_key(hostname, request):
+    """
+    :rtype str: primary cache key of a request, its host and target.
+    """
+    return hostname + request.target
+
+
+def cache_fetch_head(request, entry=None):
+    """
+    Builds the header block of a cache fill or revalidation. The client's own
+    conditional headers are dropped (the cache answers them itself), the entry's
+    validators are sent instead.
+
+    :params request (ProxyRequest): the client request.
+    :params entry (CacheEntry): the stale entry to revalidate, or None.
+
+    :rtype bytes: the rewritten header block.
+    """
+    # Same forwarded headers (trace context, client address) as upstream_head
+    set_headers = {**request.forward, **(entry.validators() if entry is not None else {}),
+                   "Connection": "keep-alive"}
+    return rewrite_head(request.head, set_headers,
+                        drop=HOP_BY_HOP + ("if-none-match", "if-modified-since"))
+
+
+def send_cached(client, request, entry, state):
+    """
+    Sends a cached response, or a ``304`` if the client already holds it.
+
+    :rtype int: status code sent to the client.
+    """
+    if not_modified(entry, request.headers):
+        client.sendall(not_modified_head(entry, state))
+        return 304
+    client.sendall(cached_head(entry, state) + entry.body)
+    return entry.status
+
+
+def refill(cache, key, request, select_upstream, policy=None, entry=None, timing=None):
+    """
+    Fetches a response for the cache, conditionally when a stale entry exists.
+
+    :params timing (RequestTiming): receives the upstream spans, or None.
+
+    :rtype tuple: (resp_head, body, status, entry); entry is the stored or refreshed
+                  entry, None if the response could not be cached.
+    """
+    resp_head, body, status = fetch(cache_fetch_head(request, entry), request,
+                                    select_upstream, policy, timing)
+    if status == 304 and entry is not None:
+        return resp_head, body, status, cache.refresh(entry, resp_head) or entry
+    return resp_head, body, status, cache.store(key, request.headers, resp_head, body, status)
+
+
+def fetch_shared(request, select_upstream, policy=None, timing=None):
+    """
+    :func:`fetch` of a client request, in the result shape of :meth:`SingleFlight.do`.
+
+    :rtype tuple: (resp_head, body, status, None).
+    """
+    resp_head, body, status = fetch(upstream_head(request), request, select_upstream, policy,
+                                    timing)
+    return resp_head, body, status, None
+
+
+def background_refresh(cache, key, request, select_upstream, policy, entry):
+    """
+    Revalidates a stale entry that was just served (stale-while-revalidate).
+    """
+    try:
+        refill(cache, key, request, select_upstream, policy, entry)
+    except (socket.error, ConnectionError, ValueError, NoUpstream) as e:
+        print(f"[Proxy] Background refresh of {key} failed: {e!r}")
+    finally:
+        cache.release_refresh(key)
+
+
+def serve_with_cache(cache, key, request, client, select_upstream, flight=None, policy=None,
+                     timing=None):
+    """
+    Answers a cacheable GET: fresh entries directly, stale ones within their
+    ``stale-while-revalidate`` window directly with a background refresh, the rest
+    after a (conditional) request to the backend.
+
+    :params cache (HttpCache): the shared cache.
+    :params key (str): primary cache key of the request.
+    :params request (ProxyRequest): the client request.
+    :params client (socket.socket): client connection.
+    :params select_upstream (callable): ``select_upstream(exclude)`` returns the
+                                        Upstream to use, or None; only called when
+                                        the backend is needed.
+    :params flight (SingleFlight): coalesces concurrent fills of the same key, or None.
+    :params policy (RetryPolicy): retries and hedging of the backend request, or None.
+    :params timing (RequestTiming): receives the upstream spans when this request
+                                    fetches from the backend itself, or None.
+
+    :rtype int: status code sent to the client, or None if the backend failed.
+    """
+    entry = cache.lookup(key, request.headers)
+    now = time.time()
+    if entry is not None and not wants_revalidation(request):
+        if entry.fresh(now):
+            cache.count("hits")
+            return send_cached(client, request, entry, "HIT")
+        if entry.stale_servable(now):
+            cache.count("stale_hits")
+            if cache.claim_refresh(key):
+                thread = threading.Thread(target=background_refresh,
+                                          args=(cache, key, request, select_upstream, policy, entry))
+                thread.daemon = True
+                thread.start()
+            return send_cached(client, request, entry, "STALE")
+
+    # Only the request running the fill records upstream spans, coalesced ones wait
+    fill = partial(refill, cache, key, request, select_upstream, policy, entry, timing)
+    try:
+        if flight is not None:
+            (resp_head, body, status, stored), shared = flight.do(key, fill, request.headers)
+        else:
+            (resp_head, body, status, stored), shared = fill(), False
+    except NoUpstream:
+        client.sendall(SERVICE_UNAVAILABLE)
+        return 503
+    except (socket.error, ConnectionError, ValueError) as e:
+        print(f"[Proxy] Cache fill of {key} failed: {e}")
+        client.sendall(BAD_GATEWAY)
+        return None
+    if shared:
+        state = "COALESCED"
+    elif status == 304:
+        state = "REVALIDATED"
     else:
-        # Trường hợp proxy_map là 1 string đơn
-        print(f"[Proxy] Resolve route for hostname {hostname} is singular")
-        proxy_host, proxy_port = proxy_map.split(":", 1)
+        state = "MISS"
+        cache.count("misses")
+    if stored is not None:
+        return send_cached(client, request, stored, state)
+    client.sendall(rewrite_head(resp_head, {"Connection": "close", "X-Cache": state}) + body)
+    return status
+
+
+def serve_coalesced(flight, key, request, client, select_upstream, policy=None, timing=None):
+    """
+    Forwards a GET through single-flight without a cache: concurrent identical
+    requests share one buffered upstream response.
+
+    :params flight (SingleFlight): the host's coalescing state.
+    :params key (str): coalescing key of the request (host and target).
+    :params request (ProxyRequest): the client request.
+    :params client (socket.socket): client connection.
+    :params select_upstream (callable): ``select_upstream(exclude)`` returns the
+                                        Upstream to use, or None.
+    :params policy (RetryPolicy): retries and hedging of the backend request, or None.
+    :params timing (RequestTiming): receives the upstream spans when this request
+                                    leads the shared fetch, or None.
 
-    return proxy_host, proxy_port
+    :rtype int: status code sent to the client, or None if the backend failed.
+    """
+    try:
+        (resp_head, body, status, _), shared = flight.do(
+            key, partial(fetch_shared, request, select_upstream, policy, timing), request.headers)
+    except NoUpstream:
+        client.sendall(SERVICE_UNAVAILABLE)
+        return 503
+    except (socket.error, ConnectionError, ValueError) as e:
+        print(f"[Proxy] Coalesced fetch of {key} failed: {e}")
+        client.sendall(BAD_GATEWAY)
+        return None
+    set_headers = {"Connection": "close"}
+    if shared:
+        set_headers["X-Coalesced"] = "1"
+    client.sendall(rewrite_head(resp_head, set_headers) + body)
+    return status
+
+
+def forward_request(request, client, select_upstream, policy=None, timing=None):
+    """
+    Forwards an HTTP request to a backend server and streams the response back.
+
+    The request is sent on a persistent connection from the upstream's pool; request
+    and response bodies are relayed one buffer at a time, so memory per connection is
+    bounded and a slow client throttles the upstream read through TCP backpressure.
+    Idempotent requests are retried or hedged on other upstreams according to
+    ``policy``, up to the moment the response starts being relayed.
+
+    :params request (ProxyRequest): incoming HTTP request.
+    :params client (socket.socket): client connection the response is relayed to.
+    :params select_upstream (callable): ``select_upstream(exclude)`` returns the
+                                        Upstream to use, or None.
+    :params policy (RetryPolicy): the host's retry policy, or None.
+    :params timing (RequestTiming): receives the spans of the relayed attempt, or None.
+
+    :rtype int: status code relayed to the client, or None if the backend failed. If
+                no upstream is available the client gets a 503 Service Unavailable,
+                if the backend fails before any byte was relayed a 502 Bad Gateway.
+    """
+
+    try:
+        attempt = open_response(request, upstream_head(request), select_upstream, policy)
+    except NoUpstream:
+        client.sendall(SERVICE_UNAVAILABLE)
+        return 503
+    except (socket.error, ConnectionError, ValueError) as e:
+        print("Socket error: {}".format(e))
+        try:
+            client.sendall(BAD_GATEWAY)
+        except socket.error:
+            pass
+        return None
+
+    if timing is not None:
+        timing.attempt(attempt)
+    sent = 0
+    try:
+        # The client connection is still closed after one response
+        client.sendall(rewrite_head(attempt.head, {"Connection": "close"}))
+        for chunk in attempt.conn.reader.iter_body(attempt.framing):
+            client.sendall(chunk)
+            sent += len(chunk)
+    except (socket.error, ConnectionError, ValueError) as e:
+        print("Socket error: {}".format(e))
+        # The backend answered; a relay error is not held against it
+        attempt.close(attempt.ok)
+        return None
+    finally:
+        if timing is not None:
+            timing.bytes = sent
+    attempt.finish()
+    return attempt.status
+
+
+def proxy_status(cache=None, table=None, tls=None):
+    """
+    :params cache (HttpCache): the shared cache, if enabled.
+    :params table (RoutingTable): the routing table (coalescing and retry state).
+    :params tls (TlsTerminator): the TLS contexts of the listener, if enabled.
+
+    :rtype dict: health, load and pool figures of every known upstream, the cache,
+                 coalescing, retry and request queue counters, the TLS handshake
+                 counters and the latency histograms.
+    """
+    # With worker processes, tells which one answered
+    status = {"pid": os.getpid(),
+              "upstreams": {name: upstream.stats() for name, upstream in list(UPSTREAMS.items())}}
+    if cache is not None:
+        status["cache"] = cache.stats()
+    if table is not None and table.flights:
+        status["single_flight"] = {name: flight.stats() for name, flight in table.flights.items()}
+    if table is not None and table.retries:
+        status["retry"] = {name: policy.stats() for name, policy in table.retries.items()}
+    if table is not None and table.queues:
+        status["queues"] = {name: waitlist.stats() for name, waitlist in table.queues.items()}
+    if tls is not None:
+        status["tls"] = tls.stats()
+    status["timings"] = METRICS.stats()
+    return status
+
+
+def send_status(conn, cache=None, table=None, tls=None):
+    """
+    Answers a :data:`STATUS_PATH` request with :func:`proxy_status` as JSON.
+
+    :params conn (socket.socket): client connection socket.
+    :params cache (HttpCache): the shared cache, if enabled.
+    :params table (RoutingTable): the routing table.
+    :params tls (TlsTerminator): the TLS contexts of the listener, if enabled.
+    """
+    conn.sendall(status_response(proxy_status(cache, table, tls)))
 
-def handle_client(ip, port, conn, addr, routes):
+
+def status_response(status):
+    """
+    :params status (dict): figures from :func:`proxy_status`.
+
+    :rtype bytes: the complete JSON response of a :data:`STATUS_PATH` request.
+    """
+    body = json.dumps(status).encode('utf-8')
+    return (
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    ).encode('utf-8') + body
+
+def handle_client(ip, port, conn, addr, table, cache=None, access_log=None, tls=None,
+                  tracer=None):
     """
     Handles an individual client connection by parsing the request,
     determining the target backend, and forwarding the request.
 
     The handler extracts the Host header from the request to
-    matches the hostname against known routes. In the matching
-    condition,it forwards the request to the appropriate backend.
+    matches the hostname and target against the routing table. In the matching
+    condition,it forwards the request to the appropriate backend, otherwise
+    answers 404.
+
+    The handler sends the backend response back to the client, or
+    returns 503 if every backend of the hostname is ejected, or saturated beyond
+    what its queue absorbs, and 502 if the selected backend fails. With a cache,
+    cacheable GETs go through :func:`serve_with_cache` and successful unsafe
+    requests invalidate their URL. On routes with single-flight enabled, concurrent
+    identical GETs share one upstream fetch. On routes with a retry policy,
+    idempotent requests are retried or hedged on other upstreams.
+
+    The spans of every request (:class:`RequestTiming <RequestTiming>`) go to the
+    latency histograms and, if enabled, to the access log. The request continues
+    the client's trace or starts one, which the backend continues through the
+    headers of :func:`forward_headers`.
 
-    The handler sends the backend response back to the client or
-    returns 404 if the hostname is unreachable or is not recognized.
+    With ``tls``, the TLS handshake is performed here, in the connection's thread,
+    before the request is read.
 
     :params ip (str): IP address of the proxy server.
     :params port (int): port number of the proxy server.
     :params conn (socket.socket): client connection socket.
     :params addr (tuple): client address (IP, port).
-    :params routes (dict): dictionary mapping hostnames and location.
+    :params table (RoutingTable): the compiled routes.
+    :params cache (HttpCache): the shared response cache, or None.
+    :params access_log (AccessLog): where finished requests are logged, or None.
+    :params tls (TlsTerminator): terminates TLS on the connection, or None for
+                                 plain HTTP.
+    :params tracer (SpanExporter): where the span of the request goes, or None.
     """
 
+    timing = RequestTiming(addr[0])
+    if tls is not None:
+        conn = tls.wrap(conn)
+        if conn is None:
+            return
+        timing.lap("tls")
     try:
-        request = conn.recv(1024).decode()
-        if not request:
+        request = read_request(HttpReader(conn))
+        if request is None:
             conn.close()
             return
             
@@ -169,91 +903,149 @@ def handle_client(ip, port, conn, addr, routes):
         conn.close()
         return
 
+    if request.target == STATUS_PATH and addr[0] in ("127.0.0.1", "::1"):
+        try:
+            send_status(conn, cache, table, tls)
+        except socket.error as e:
+            print(f"Error sending to {addr}: {e}")
+        finally:
+            conn.close()
+        return
+
     # Extract hostname
-    hostname = ""
-    try:
-        for line in request.splitlines():
-            if line.lower().startswith('host:'):
-                hostname = line.split(':', 1)[1].strip()
-                break # Tìm thấy host rồi thì dừng
-    except IndexError:
-        print(f"[Proxy] Malformed request from {addr}, no Host header.")
-        
+    hostname = request.headers.get('host', '')
     if not hostname:
         # Nếu không có Host header, ta có thể dùng IP:Port của chính proxy
         # (Giả định từ config file)
         hostname = f"{ip}:{port}" 
-        print(f"[Proxy] No Host header, defaulting to proxy address: {hostname}")
-    else:
-        print(f"[Proxy] Request from {addr} for Host: {hostname}")
 
+    timing.lap("read")
+    timing.request(request, hostname)
+    timing.trace(request.headers.get(TRACEPARENT))
+    request.forward = forward_headers(request, addr[0], timing,
+                                      "https" if tls is not None else "http")
+    route = table.resolve(hostname, request.target)
+    timing.lap("route")
+    timing.route = route.name if route is not None else None
 
-    # Resolve the matching destination in routes and need conver port
-    # to integer value
-    resolved_host, resolved_port = resolve_routing_policy(hostname, routes)
-    try:
-        resolved_port = int(resolved_port)
-    except ValueError:
-        print(f"Not a valid integer port: {resolved_port}")
-        resolved_port = 9000 # Fallback
+    # A retry asks the route again, excluding the upstreams already tried
+    def select_upstream(exclude=()):
+        started = time.monotonic()
+        try:
+            upstream = acquire_upstream(route, request, addr[0], exclude)
+        finally:
+            timing.add("select", time.monotonic() - started)
+        if upstream is not None:
+            timing.tried.append(upstream.name)
+        return upstream
 
-    if resolved_host:
-        print(f"[Proxy] Host {hostname} is forwarded to {resolved_host}:{resolved_port}")
-        response = forward_request(resolved_host, resolved_port, request)        
-    else:
-        response = (
-            "HTTP/1.1 404 Not Found\r\n"
-            "Content-Type: text/plain\r\n"
-            "Content-Length: 13\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            "404 Not Found"
-        ).encode('utf-8')
-        
+    key = cache_key(hostname, request)
+    flight, policy = (route.flight, route.retry) if route is not None else (None, None)
+    status = None
     try:
-        conn.sendall(response)
+        if route is None:
+            conn.sendall(NOT_FOUND)
+            status = 404
+        elif (cache is not None or flight is not None) and request_cacheable(request):
+            # The backend is only selected if the cache cannot answer alone
+            if cache is not None:
+                status = serve_with_cache(cache, key, request, conn, select_upstream, flight,
+                                          policy, timing)
+            else:
+                status = serve_coalesced(flight, key, request, conn, select_upstream, policy,
+                                         timing)
+        else:
+            status = forward_request(request, conn, select_upstream, policy, timing)
+            if cache is not None and request.method not in SAFE_METHODS and status and status < 400:
+                cache.invalidate(key)
     except Exception as e:
         print(f"Error sending to {addr}: {e}")
     finally:
         conn.close()
+        timing.finish(status)
+        METRICS.record(timing)
+        if access_log is not None:
+            access_log.write(timing)
+        if tracer is not None and timing.sampled:
+            tracer.export([timing.span()])
 
-def run_proxy(ip, port, routes):
+def run_proxy(ip, port, routes, drain_timeout=DRAIN_TIMEOUT, health_check="tcp",
+              health_interval=5.0, cache=None, flights=None, retries=None, reloader=None,
+              access_log=None, tls=None, tracer=None):
     """
     Starts the proxy server and listens for incoming connections. 
 
     The process dinds the proxy server to the specified IP and port.
     In each incomping connection, it accepts the connections and
     spawns a new thread for each client using `handle_client`.
- 
+
+    SIGTERM/SIGINT stop accepting and let in-flight requests finish within
+    ``drain_timeout`` seconds; SIGUSR2 hands the listening socket to a freshly
+    started process first.
+
+    Unless ``health_check`` is None, every upstream is probed each ``health_interval``
+    seconds, by TCP connect (``"tcp"``) or by ``GET`` on the given HTTP path.
+
+    With a ``reloader``, SIGHUP or an edit of the config file swaps in a new routing
+    table; each connection is served with the table current when it was accepted.
+
+    With ``tls``, the listener speaks HTTPS; handshakes run in the connection
+    threads, so a slow client never holds up the accept loop.
 
     :params ip (str): IP address to bind the proxy server.
     :params port (int): port number to listen on.
-    :params routes (dict): dictionary mapping hostnames and location.
+    :params routes (dict): dictionary mapping hostnames and location, compiled with
+                           :func:`compile_routes`; or an already compiled RoutingTable.
+    :params drain_timeout (float): seconds granted to in-flight requests at shutdown.
+    :params health_check (str): ``"tcp"``, an HTTP path such as ``"/healthz"``, or None.
+    :params health_interval (float): seconds between two health check rounds.
+    :params cache (HttpCache): shared response cache, or None to disable caching.
+    :params flights (dict): ``host`` or ``host/prefix`` -> SingleFlight of the routes
+                            with coalescing enabled.
+    :params retries (dict): ``host`` or ``host/prefix`` -> RetryPolicy of the routes
+                            with retries enabled.
+    :params reloader (ConfigReloader): reloads the routes at runtime, or None; its
+                                       table replaces ``routes``.
+    :params access_log (AccessLog): JSON access log of the requests, or None.
+    :params tls (TlsTerminator): terminates TLS on the listener, or None for plain HTTP.
+    :params tracer (SpanExporter): exports a span per request, or None.
 
     """
 
-    proxy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    proxy.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    lifecycle = None
+    checker = None
 
     try:
-        proxy.bind((ip, port))
-        proxy.listen(50)
-        print(f"[Proxy] Listening on IP {ip} port {port}")
-        while True:
-            conn, addr = proxy.accept()
+        # Every Upstream exists once compiled, so health checks cover them all
+        table = routes
+        if reloader is not None:
+            table = reloader.table
+            reloader.install_signal()
+            reloader.start()
+        elif not isinstance(routes, RoutingTable):
+            table = compile_routes(routes, flights, retries)
+        if health_check:
+            checker = HealthChecker(UPSTREAMS, health_interval,
+                                    None if health_check == "tcp" else health_check)
+            checker.start()
+        proxy = create_listener(ip, port)
+        lifecycle = ServerLifecycle("Proxy", proxy, drain_timeout)
+        lifecycle.install_signals()
+        print(f"[Proxy] Listening on IP {ip} port {port}" + (" (TLS)" if tls else ""))
+        while lifecycle.running():
+            conn, addr = lifecycle.accept()
+            if conn is None:
+                continue
             #
             #  TODO: implement the step of the client incomping connection
             #        using multi-thread programming with the
             #        provided handle_client routine
             #
             # --- BẮT ĐẦU HOÀN THÀNH TODO ---
-            print(f"[Proxy] Accepted connection from {addr}")
-            client_thread = threading.Thread(
-                target=handle_client,
-                args=(ip, port, conn, addr, routes)
-            )
-            client_thread.daemon = True
-            client_thread.start()
+            if reloader is not None:
+                table = reloader.table
+            lifecycle.spawn(handle_client, (ip, port, conn, addr, table, cache, access_log, tls,
+                                            tracer))
             # --- KẾT THÚC HOÀN THÀNH TODO ---
             
     except socket.error as e:
@@ -261,16 +1053,40 @@ def run_proxy(ip, port, routes):
     except KeyboardInterrupt:
         print("\n[Proxy] Server shutting down.")
     finally:
-        proxy.close()
+        if checker is not None:
+            checker.stop()
+        if reloader is not None:
+            reloader.stop()
+        if lifecycle is not None:
+            lifecycle.drain()
+        if access_log is not None:
+            access_log.close()
+        if tracer is not None:
+            tracer.close()
 
 
-def create_proxy(ip, port, routes):
+def create_proxy(ip, port, routes, drain_timeout=DRAIN_TIMEOUT, health_check="tcp",
+                 health_interval=5.0, cache=None, flights=None, retries=None, reloader=None,
+                 access_log=None, tls=None, tracer=None):
     """
     Entry point for launching the proxy server.
 
     :params ip (str): IP address to bind the proxy server.
     :params port (int): port number to listen on.
     :params routes (dict): dictionary mapping hostnames and location.
+    :params drain_timeout (float): seconds to drain in-flight requests at shutdown.
+    :params health_check (str): ``"tcp"``, an HTTP path to probe, or None to disable.
+    :params health_interval (float): seconds between two health check rounds.
+    :params cache (HttpCache): shared response cache, or None to disable caching.
+    :params flights (dict): ``host`` or ``host/prefix`` -> SingleFlight of the routes
+                            with coalescing enabled.
+    :params retries (dict): ``host`` or ``host/prefix`` -> RetryPolicy of the routes
+                            with retries enabled.
+    :params reloader (ConfigReloader): reloads the routes on SIGHUP or file change.
+    :params access_log (AccessLog): JSON access log of the requests, or None.
+    :params tls (TlsTerminator): terminates TLS on the listener, or None for plain HTTP.
+    :params tracer (SpanExporter): exports a span per request, or None.
     """
 
-    run_proxy(ip, port, routes)
\ No newline at end of file
+    run_proxy(ip, port, routes, drain_timeout, health_check, health_interval, cache, flights,
+              retries, reloader, access_log, tls, tracer)
\ No newline at end of file
@@ -0,0 +1,284 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.ratelimit
+~~~~~~~~~~~~~~~~~
+
+This module provides a :class:`RateLimiter <RateLimiter>` object for admission control
+in the backend. Each client IP gets a token bucket and a cap on concurrent connections,
+and routes may declare their own per-client bucket. Denied requests are answered with
+``429 Too Many Requests`` and a ``Retry-After`` hint.
+
+Notes:
+------
+- The connection-level check runs right after ``accept`` and before the request is
+  read or parsed, so a flooding client costs the server almost nothing.
+- Client state lives in an LRU map bounded by ``max_clients``; idle entries are
+  evicted after ``idle_timeout`` seconds. When every tracked key has connections
+  open, new keys are refused rather than growing the map.
+- Behind a proxy every connection comes from the proxy's address. Connections from
+  ``trusted_proxies`` are not limited at accept; each of their requests is charged
+  to the client named by ``X-Forwarded-For`` (:meth:`RateLimiter.client_ip`) once
+  the headers are parsed.
+
+Usage Example:
+--------------
+>>> limiter = RateLimiter(rate=5, burst=10, max_conns=4)
+>>> allowed, retry_after = limiter.admit("10.0.0.7")
+>>> limiter.release("10.0.0.7")
+"""
+
+import math
+import time
+import threading
+from collections import OrderedDict
+
+#: Number of least recently used keys examined for idle eviction on each insertion
+#: (more are examined while the map is over ``max_clients``).
+EVICT_SCAN = 16
+
+
+class TokenBucket:
+    """The :class:`TokenBucket <TokenBucket>` object, refilled with ``rate`` tokens
+    per second up to ``burst`` tokens.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def take(self, now):
+        """
+        Consume one token.
+
+        :param now (float): current monotonic time.
+
+        :rtype tuple: (allowed, retry_after) where retry_after is the number of
+                      seconds until a token is available.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True, 0.0
+        return False, (1.0 - self.tokens) / self.rate
+
+
+class ClientState:
+    """Per-key limiter state: an optional bucket and the active connection count."""
+
+    __slots__ = ("bucket", "active", "seen")
+
+    def __init__(self, bucket, now):
+        self.bucket = bucket
+        self.active = 0
+        self.seen = now
+
+
+class RateLimiter:
+    """The :class:`RateLimiter <RateLimiter>` object, per-client token buckets and
+    concurrency caps with bounded memory.
+
+    :attrs rate (float): requests per second allowed per client IP, None disables it.
+    :attrs burst (int): bucket capacity per client IP.
+    :attrs max_conns (int): concurrent connections allowed per client IP, None disables it.
+    :attrs max_clients (int): maximum number of tracked keys.
+    :attrs idle_timeout (float): seconds after which an idle key is evicted.
+    :attrs trusted_proxies (frozenset): proxy addresses whose ``X-Forwarded-For`` is honoured.
+    """
+
+    def __init__(self, rate=None, burst=None, max_conns=None,
+                 max_clients=10000, idle_timeout=60, trusted_proxies=None):
+        """
+        Initialize a new rate limiter.
+
+        :param rate (float): per-client token refill rate (requests per second).
+        :param burst (int): per-client bucket size, defaults to ``rate``.
+        :param max_conns (int): per-client concurrent connection cap.
+        :param max_clients (int): bound on tracked client/route keys.
+        :param idle_timeout (float): idle seconds before a key is evicted.
+        :param trusted_proxies (iterable): addresses of the proxies in front of the backend.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.max_conns = max_conns
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.trusted_proxies = frozenset(trusted_proxies or ())
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"admitted": 0, "rate_limited": 0, "conn_limited": 0,
+                         "route_limited": 0, "evicted": 0, "full": 0}
+
+    def _state(self, key, rate, burst, now):
+        state = self.clients.get(key)
+        if state is None:
+            if not self._evict(now, room=1):
+                # Every tracked key has open connections
+                self.counters["full"] += 1
+                return None
+            bucket = TokenBucket(rate, burst or rate, now) if rate else None
+            state = ClientState(bucket, now)
+            self.clients[key] = state
+        else:
+            self.clients.move_to_end(key)
+        state.seen = now
+        return state
+
+    def _evict(self, now, room=0):
+        # Oldest keys sit at the front of the LRU map. Idle keys are looked for among
+        # a few of them per insertion; while the map is over its bound the scan goes
+        # on until enough keys are gone. Keys with open connections stay and are
+        # moved to the back, so the next scan does not examine them again.
+        excess = len(self.clients) + room - self.max_clients
+        budget = EVICT_SCAN
+        skipped = 0
+        while skipped < len(self.clients) and (excess > 0 or budget > 0):
+            budget -= 1
+            key, state = next(iter(self.clients.items()))
+            if state.active:
+                self.clients.move_to_end(key)
+                skipped += 1
+                continue
+            if excess <= 0 and now - state.seen <= self.idle_timeout:
+                break
+            del self.clients[key]
+            self.counters["evicted"] += 1
+            excess -= 1
+        return excess <= 0
+
+    def client_ip(self, peer, forwarded=None):
+        """
+        Resolve the client a request is charged to.
+
+        :param peer (str): address of the connection.
+        :param forwarded (str): the ``X-Forwarded-For`` header of the request, or None.
+
+        :rtype str: ``peer``, or when it is a trusted proxy, the last address of
+                    ``forwarded`` that is not a trusted proxy itself.
+        """
+        if not forwarded or peer not in self.trusted_proxies:
+            return peer
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        # Read from the right: entries left of the first untrusted hop are client supplied
+        for hop in reversed(hops):
+            if hop not in self.trusted_proxies:
+                return hop
+        return hops[0] if hops else peer
+
+    def admit(self, ip):
+        """
+        Admission check for a new connection, done before the request is parsed.
+        On success the connection is counted until :meth:`release` is called.
+
+        :param ip (str): client IP address.
+
+        :rtype tuple: (allowed, retry_after_seconds).
+        """
+        now = time.monotonic()
+        with self.lock:
+            if ip in self.trusted_proxies:
+                # Charged per request to the forwarded client, see check_client()
+                self.counters["admitted"] += 1
+                return True, 0
+            state = self._state(ip, self.rate, self.burst, now)
+            if state is None:
+                return False, 1
+            if self.max_conns is not None and state.active >= self.max_conns:
+                self.counters["conn_limited"] += 1
+                return False, 1
+            if state.bucket is not None:
+                allowed, wait = state.bucket.take(now)
+                if not allowed:
+                    self.counters["rate_limited"] += 1
+                    return False, max(1, math.ceil(wait))
+            state.active += 1
+            self.counters["admitted"] += 1
+            return True, 0
+
+    def release(self, ip):
+        """
+        Mark a connection admitted by :meth:`admit` as finished.
+
+        :param ip (str): client IP address.
+        """
+        with self.lock:
+            state = None if ip in self.trusted_proxies else self.clients.get(ip)
+            if state is not None and state.active > 0:
+                state.active -= 1
+                state.seen = time.monotonic()
+
+    def check_client(self, ip):
+        """
+        Per-request check of a client behind a trusted proxy: the client's bucket is
+        charged as :meth:`admit` would for a direct connection. The connection cap
+        does not apply, the proxy shares its connections between clients.
+
+        :param ip (str): client IP address resolved by :meth:`client_ip`.
+
+        :rtype tuple: (allowed, retry_after_seconds).
+        """
+        if self.rate is None:
+            return True, 0
+        now = time.monotonic()
+        with self.lock:
+            state = self._state(ip, self.rate, self.burst, now)
+            if state is None:
+                return False, 1
+            if state.bucket is None:
+                return True, 0
+            allowed, wait = state.bucket.take(now)
+            if not allowed:
+                self.counters["rate_limited"] += 1
+                return False, max(1, math.ceil(wait))
+            return True, 0
+
+    def check_route(self, ip, method, path, rate, burst=None):
+        """
+        Per-route check with its own bucket for each client IP.
+
+        :param ip (str): client IP address.
+        :param method (str): HTTP method of the route.
+        :param path (str): routed path.
+        :param rate (float): route requests per second per client.
+        :param burst (int): route bucket size, defaults to ``rate``.
+
+        :rtype tuple: (allowed, retry_after_seconds).
+        """
+        now = time.monotonic()
+        with self.lock:
+            state = self._state((ip, method, path), rate, burst, now)
+            if state is None:
+                self.counters["route_limited"] += 1
+                return False, 1
+            allowed, wait = state.bucket.take(now)
+            if not allowed:
+                self.counters["route_limited"] += 1
+                return False, max(1, math.ceil(wait))
+            return True, 0
+
+    def stats(self):
+        """
+        Return a snapshot of the limiter counters.
+
+        :rtype dict: admitted/limited/evicted counts and the number of tracked keys.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+            snapshot["tracked"] = len(self.clients)
+            snapshot["active"] = sum(s.active for s in self.clients.values())
+        return snapshot
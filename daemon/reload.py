@@ -0,0 +1,186 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.reload
+~~~~~~~~~~~~~~~~~
+
+This module reloads the proxy configuration without a restart. A
+:class:`ConfigReloader <ConfigReloader>` thread rebuilds the
+:class:`RoutingTable <RoutingTable>` on ``SIGHUP`` or when the config file changes,
+and swaps it in with a single assignment: connections accepted afterwards use the
+new table, those in progress finish with the one they started with.
+
+Notes:
+------
+- A config that fails to parse or compiles to no route is rejected and the current
+  table stays in place.
+- Upstreams are shared by ``"host:port"``, so those still listed keep their pooled
+  connections and circuit breaker state; routes whose backends and policy did not
+  change keep their balancer (rotation position) and retry statistics.
+- An upstream no route references anymore is drained: it gets no new requests and
+  is retired (idle connections closed, dropped from health checks and the status
+  page) once its in-flight requests are done, or after ``drain_timeout`` seconds.
+
+Usage Example:
+--------------
+>>> reloader = ConfigReloader("config/proxy.conf", load_routing_table)
+>>> reloader.install_signal()
+>>> reloader.start()
+>>> table = reloader.table  # read once per connection
+"""
+
+import os
+import time
+import signal
+import threading
+
+from .upstream import UPSTREAMS, retire_upstream
+from .routing import apply_limits
+
+
+class ConfigReloader:
+    """The :class:`ConfigReloader <ConfigReloader>` object, which owns the current
+    routing table of the proxy.
+
+    :attrs path (str): the config file.
+    :attrs table (RoutingTable): the routing table in use.
+    :attrs interval (float): seconds between two checks of the file, 0 to only
+                             reload on ``SIGHUP``.
+    :attrs drain_timeout (float): longest wait for a removed upstream's requests.
+    """
+
+    def __init__(self, path, load, interval=1.0, drain_timeout=30.0):
+        """
+        :param path (str): the config file.
+        :param load (callable): ``load(path, previous)`` parses the file and returns
+                                the compiled RoutingTable, ``previous`` being the
+                                table it replaces (None on the first load).
+        :param interval (float): seconds between two checks of the file.
+        :param drain_timeout (float): longest wait for a removed upstream's requests.
+        """
+        self.path = path
+        self.load = load
+        self.interval = interval
+        self.drain_timeout = drain_timeout
+        self.signature = self._signature()
+        self.table = load(path, None)
+        self.requested = threading.Event()
+        self.stopping = threading.Event()
+        #: Removed upstream name -> retirement deadline
+        self.draining = {}
+        #: Called with each retired Upstream (e.g. to close engine-specific pools)
+        self.on_retire = []
+        self.reloads = 0
+        self.failures = 0
+        self.thread = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def request(self, *args):
+        """
+        Ask for a reload; safe to call from a signal handler.
+        """
+        self.requested.set()
+
+    def install_signal(self):
+        """
+        Reload on ``SIGHUP``. Signals can only be handled by the main thread,
+        elsewhere this is a no-op.
+        """
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, self.request)
+
+    def start(self):
+        """
+        Start the thread performing reloads and upstream retirement.
+        """
+        self.thread = threading.Thread(target=self._run, name="proxy-reload")
+        self.thread.daemon = True
+        self.thread.start()
+        watch = f"checking {self.path} every {self.interval}s" if self.interval else "SIGHUP only"
+        print(f"[Reload] Config reload enabled ({watch})")
+
+    def stop(self):
+        """
+        Stop the reload thread.
+        """
+        self.stopping.set()
+        self.requested.set()
+
+    def reload(self, reason="request"):
+        """
+        Load the config file and swap the routing table if it is valid.
+
+        :param reason (str): what triggered the reload, for the log.
+
+        :rtype bool: True if the new table is in use.
+        """
+        self.signature = self._signature()
+        try:
+            table = self.load(self.path, self.table)
+            if not table.routes():
+                raise ValueError("no route defined")
+        except Exception as e:
+            self.failures += 1
+            print(f"[Reload] {self.path} rejected ({reason}), keeping the current routes: {e!r}")
+            return False
+        removed = self.table.upstream_names() - table.upstream_names()
+        self.table = table
+        # Only now: a rejected config leaves the live upstream limits alone
+        apply_limits(table)
+        self.reloads += 1
+        print(f"[Reload] {self.path} reloaded ({reason}): {len(table.routes())} route(s), "
+              f"{len(removed)} upstream(s) removed")
+        return True
+
+    def sweep(self):
+        """
+        Drain and retire the upstreams no route references anymore.
+        """
+        live = self.table.upstream_names()
+        now = time.monotonic()
+        for name, upstream in list(UPSTREAMS.items()):
+            if name in live:
+                # Listed again by a later reload
+                self.draining.pop(name, None)
+                continue
+            deadline = self.draining.setdefault(name, now + self.drain_timeout)
+            if upstream.in_flight > 0 and now < deadline:
+                continue
+            if upstream.in_flight > 0:
+                print(f"[Reload] Upstream {name} retired with {upstream.in_flight} request(s) "
+                      f"still in flight")
+            else:
+                print(f"[Reload] Upstream {name} drained and retired")
+            del self.draining[name]
+            retire_upstream(name)
+            for callback in self.on_retire:
+                callback(upstream)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            # Without file checks, still wake up to retire drained upstreams
+            requested = self.requested.wait(self.interval or 1.0)
+            if self.stopping.is_set():
+                return
+            if requested:
+                self.requested.clear()
+                self.reload("SIGHUP")
+            elif self.interval and self._signature() != self.signature:
+                self.reload("file changed")
+            self.sweep()
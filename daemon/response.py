@@ -280,6 +280,9 @@ class Response():
         # Thêm Content-Type từ self.headers (đã được set trong prepare_content_type)
         if 'Content-Type' in self.headers:
             headers['Content-Type'] = self.headers['Content-Type']
+        # Steps of a traced request, see daemon.tracing
+        if 'Server-Timing' in self.headers:
+            headers['Server-Timing'] = self.headers['Server-Timing']
         
         # --- THÊM LOGIC SET-COOKIE CHO TASK 1A ---
         if self.set_cookie:
@@ -325,6 +328,26 @@ class Response():
                 f"{body}"
             ).encode('utf-8')
 
+    def build_too_many_requests(self, retry_after=1):
+        """
+        Constructs a 429 Too Many Requests HTTP response used by the rate limiter.
+
+        :params retry_after (int): seconds the client should wait before retrying.
+
+        :rtype bytes: Encoded 429 response.
+        """
+        body = "429 Too Many Requests"
+        return (
+                f"HTTP/1.1 429 Too Many Requests\r\n"
+                f"Content-Type: text/plain\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Retry-After: {retry_after}\r\n"
+                f"Cache-Control: no-cache\r\n"
+                f"Connection: close\r\n"
+                f"\r\n"
+                f"{body}"
+            ).encode('utf-8')
+
     # --- THÊM HÀM MỚI CHO TASK 1A & 1B ---
     def build_unauthorized(self):
         """
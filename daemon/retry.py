@@ -0,0 +1,199 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.retry
+~~~~~~~~~~~~~~~~~
+
+This module provides the :class:`RetryPolicy <RetryPolicy>` of a proxied host:
+
+- retries: an idempotent request whose body is buffered is sent again to another
+  upstream when the connection fails or the backend answers with a retryable status
+  (``502/503/504`` by default), at most ``retries`` extra attempts;
+- hedging: when the first upstream has not answered after the recent p95 time to
+  first byte of the host's median upstream, a duplicate goes to another upstream and
+  the first answer wins. Taking the median upstream keeps a stalling minority of
+  backends from inflating the delay they are meant to be hedged against;
+- budget: retries and hedges each spend one token of a :class:`RetryBudget
+  <RetryBudget>` that only earns ``ratio`` tokens per request (plus a small floor per
+  second), so a failing backend cannot turn every request into several.
+
+Usage Example:
+--------------
+>>> policy = RetryPolicy(retries=2, hedge=True, budget_ratio=0.1)
+>>> if policy.allows(request) and policy.budget.withdraw():
+...     ...  # send to another upstream
+"""
+
+import time
+import threading
+from collections import deque
+
+#: Methods safe to send twice (RFC 7231 section 4.2.2).
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE", "PUT", "DELETE")
+
+
+class RetryBudget:
+    """Token bucket limiting retries and hedges to a fraction of the traffic.
+
+    :attrs ratio (float): tokens earned per request.
+    :attrs min_per_sec (float): tokens earned per second regardless of traffic.
+    :attrs cap (float): most tokens that can be saved up.
+    """
+
+    def __init__(self, ratio=0.2, min_per_sec=1.0, cap=100.0):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.cap = cap
+        self.tokens = min(cap, min_per_sec)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+        self.exhausted = 0
+
+    def deposit(self):
+        """
+        Earn the share of one request.
+        """
+        with self.lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        :rtype bool: True if a retry or hedge may be sent.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.cap, self.tokens + (now - self.stamp) * self.min_per_sec)
+            self.stamp = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            self.exhausted += 1
+            return False
+
+
+class LatencyWindow:
+    """The most recent time-to-first-byte samples of one upstream, for its p95."""
+
+    def __init__(self, size=512, refresh=32):
+        self.samples = deque(maxlen=size)
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.added = 0
+        self.sorted = []
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.added += 1
+            # Sorting the window on every sample would cost more than the lookup saves
+            if self.added % self.refresh == 0 or len(self.sorted) < self.refresh:
+                self.sorted = sorted(self.samples)
+
+    def quantile(self, q):
+        """
+        :rtype float: the ``q`` quantile of the window, None while it is empty.
+        """
+        ordered = self.sorted
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class RetryPolicy:
+    """The :class:`RetryPolicy <RetryPolicy>` object of one host.
+
+    :attrs retries (int): extra attempts allowed per request (retries and hedges).
+    :attrs retry_on (tuple): response statuses worth another upstream.
+    :attrs hedge (bool): whether slow first attempts are hedged.
+    :attrs hedge_quantile (float): latency quantile used as hedge delay.
+    :attrs hedge_min_delay (float): lower bound of the hedge delay in seconds.
+    :attrs min_samples (int): samples an upstream needs before its p95 counts.
+    :attrs budget (RetryBudget): shared by retries and hedges of the host.
+    """
+
+    def __init__(self, retries=2, retry_on=(502, 503, 504), hedge=False, hedge_quantile=0.95,
+                 hedge_min_delay=0.005, min_samples=20, budget_ratio=0.2, budget_min_per_sec=1.0):
+        self.retries = retries
+        self.retry_on = tuple(retry_on)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.budget = RetryBudget(budget_ratio, budget_min_per_sec)
+        self.latency = {}
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    def adopt(self, previous):
+        """
+        Take over the latency samples and saved budget of the policy this one
+        replaces on a config reload, so hedging does not restart from scratch.
+
+        :param previous (RetryPolicy): the policy of the same route before the reload.
+        """
+        self.latency = previous.latency
+        self.budget.tokens = min(self.budget.cap, previous.budget.tokens)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def allows(self, request):
+        """
+        :param request (ProxyRequest): the client request.
+
+        :rtype bool: True if the request may be sent more than once.
+        """
+        return self.retries > 0 and request.method in IDEMPOTENT_METHODS and request.replayable
+
+    def observe(self, upstream, seconds):
+        """
+        Record the time to first byte of a response.
+
+        :param upstream (Upstream): the upstream that answered.
+        :param seconds (float): the time to first byte.
+        """
+        window = self.latency.get(upstream.name)
+        if window is None:
+            with self.lock:
+                window = self.latency.setdefault(upstream.name, LatencyWindow())
+        window.add(seconds)
+
+    def hedge_delay(self):
+        """
+        :rtype float: seconds to wait before hedging, None if hedging is off or no
+                      upstream has enough latency samples yet.
+        """
+        if not self.hedge:
+            return None
+        quantiles = sorted(window.quantile(self.hedge_quantile)
+                           for window in list(self.latency.values())
+                           if len(window) >= self.min_samples)
+        if not quantiles:
+            return None
+        return max(self.hedge_min_delay, quantiles[(len(quantiles) - 1) // 2])
+
+    def stats(self):
+        """
+        :rtype dict: retry and hedge counters, budget state and the hedge delay.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["budget_exhausted"] = self.budget.exhausted
+        snapshot["budget_tokens"] = round(self.budget.tokens, 2)
+        delay = self.hedge_delay()
+        snapshot["hedge_delay_ms"] = round(delay * 1000, 3) if delay is not None else None
+        return snapshot
@@ -0,0 +1,346 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.routing
+~~~~~~~~~~~~~~~~~
+
+This module compiles the proxy ``routes`` once at startup into a
+:class:`RoutingTable <RoutingTable>`: every ``proxy_pass`` entry becomes an
+:class:`Upstream <Upstream>` and every host or location its :class:`Route <Route>`
+with a ready balancer, so a request is routed by a few dictionary lookups.
+
+A request's ``Host`` is matched, in order, against:
+
+- the exact names, with and then without the port (``app1.local:8080``, ``app1.local``);
+- the wildcard names ``*.suffix``, longest suffix first (``*.local`` matches
+  ``a.local`` and ``a.b.local``);
+- the default host ``*``.
+
+Inside the host, the ``location`` whose prefix is the longest prefix of the request
+target wins; the host's own ``proxy_pass`` acts as location ``/``.
+
+The ``routes`` dictionary maps a hostname to ``(proxy_map, policy)`` or
+``(proxy_map, policy, locations)`` where ``locations`` maps a path prefix to its own
+``(proxy_map, policy)``; an empty ``proxy_map`` or a None ``policy`` in a location is
+inherited from the host.
+
+A ``max_conns=N`` parameter of a ``proxy_pass`` entry caps the requests in flight to
+that upstream; when every upstream of a route is at its cap, requests wait in the
+route's :class:`RequestQueue <RequestQueue>`, or are shed at once without one.
+
+Usage Example:
+--------------
+>>> table = compile_routes({
+...     "app.local": (["10.0.0.1:9000", "10.0.0.2:9000"], "least-conn",
+...                   {"/static/": ("10.0.0.9:9000", None)}),
+...     "*": ("127.0.0.1:9000", "round-robin"),
+... })
+>>> table.resolve("app.local", "/static/app.js").upstreams
+[<Upstream 10.0.0.9:9000>]
+"""
+
+from .upstream import get_upstream, RequestQueue
+from .balancer import create_balancer, parse_server, parse_max_conns, eligible
+
+#: Host name of the default virtual host.
+DEFAULT_HOST = "*"
+
+
+class Route:
+    """The :class:`Route <Route>` object, the backends serving one host or location.
+
+    :attrs name (str): ``host`` or ``host/prefix``, as reported on the status page.
+    :attrs upstreams (list): the :class:`Upstream <Upstream>` of each ``proxy_pass``.
+    :attrs policy (str): the ``dist_policy`` of the route.
+    :attrs retry (RetryPolicy): retries and hedging of the route, or None.
+    :attrs flight (SingleFlight): coalescing of identical GETs, or None.
+    :attrs queue (RequestQueue): where requests wait while every upstream is at its
+                                 ``max_conns``, or None if none has a limit.
+    """
+
+    __slots__ = ("name", "entries", "upstreams", "policy", "balancer", "retry", "flight",
+                 "queue")
+
+    def __init__(self, name, proxy_map, policy, retry=None, flight=None, queue=None):
+        entries = proxy_map if isinstance(proxy_map, list) else [proxy_map] if proxy_map else []
+        self.name = name
+        self.entries = entries
+        self.upstreams = [get_upstream(*parse_server(entry)[:2]) for entry in entries]
+        self.policy = policy
+        self.balancer = create_balancer(policy, entries) if len(entries) > 1 else None
+        self.retry = retry
+        self.flight = flight
+        self.queue = queue
+
+    def pick(self, request=None, client_ip=None, exclude=()):
+        """
+        :param request (ProxyRequest): the client request (sticky policies).
+        :param client_ip (str): the client address.
+        :param exclude (collection): ``"host:port"`` names already tried.
+
+        :rtype Upstream: the upstream to send to, None if every one is ejected or excluded.
+        """
+        if self.balancer is not None:
+            return self.balancer.pick(request, client_ip, exclude)
+        if self.upstreams and eligible(self.upstreams[0], exclude):
+            return self.upstreams[0]
+        return None
+
+    def reserve(self, request=None, client_ip=None, exclude=()):
+        """
+        Pick an upstream and take one of its connection slots.
+
+        :rtype Upstream: the reserved upstream, None if every one is ejected,
+                         excluded or saturated.
+        """
+        upstream = self.pick(request, client_ip, exclude)
+        skipped = None
+        while upstream is not None and not upstream.reserve():
+            # Another request took its last slot since the pick
+            skipped = set(exclude) if skipped is None else skipped
+            skipped.add(upstream.name)
+            upstream = self.pick(request, client_ip, skipped)
+        return upstream
+
+    def busy(self, exclude=()):
+        """
+        :rtype bool: True if an upstream could take the request but for its ``max_conns``.
+        """
+        return any(upstream.saturated() and upstream.name not in exclude and upstream.available()
+                   for upstream in self.upstreams)
+
+    def adopt(self, previous):
+        """
+        Carry over the runtime state of the same route in the previous table: the
+        balancer (rotation position) if the backends and policy are unchanged, and
+        the latency samples and budget of the retry policy.
+
+        :param previous (Route): the route of the same name before a reload.
+        """
+        if previous.entries == self.entries and previous.policy == self.policy:
+            self.balancer = previous.balancer
+        if self.retry is not None and previous.retry is not None:
+            self.retry.adopt(previous.retry)
+
+
+class VirtualHost:
+    """The :class:`VirtualHost <VirtualHost>` object, the routes of one host keyed by
+    path prefix. Lookups try each distinct prefix length once, longest first.
+    """
+
+    def __init__(self, name, routes):
+        """
+        :param name (str): the configured host name.
+        :param routes (dict): path prefix -> Route.
+        """
+        self.name = name
+        self.routes = routes
+        self.lengths = sorted({len(prefix) for prefix in routes}, reverse=True)
+
+    def match(self, target):
+        """
+        :param target (str): the request target.
+
+        :rtype Route: the route of the longest matching prefix, or None.
+        """
+        for length in self.lengths:
+            route = self.routes.get(target[:length])
+            if route is not None:
+                return route
+        return None
+
+
+def strip_port(hostname):
+    """
+    :rtype str: ``hostname`` without its ``:port`` suffix.
+    """
+    name, sep, port = hostname.rpartition(":")
+    if sep and port.isdigit() and not name.endswith(":"):
+        return name
+    return hostname
+
+
+class RoutingTable:
+    """The :class:`RoutingTable <RoutingTable>` object, every virtual host of the proxy.
+
+    :attrs exact (dict): lowercase host name -> VirtualHost.
+    :attrs wildcards (dict): ``".suffix"`` -> VirtualHost of ``*.suffix``.
+    :attrs default (VirtualHost): the ``*`` host, or None.
+    :attrs retries (dict): ``host`` or ``host/prefix`` -> RetryPolicy.
+    :attrs flights (dict): ``host`` or ``host/prefix`` -> SingleFlight.
+    :attrs queues (dict): route name -> RequestQueue of the routes with limited upstreams.
+    :attrs named (dict): route name -> Route.
+    :attrs limits (dict): upstream name -> ``max_conns`` given by this table, set on
+                          the shared upstreams by :func:`apply_limits`.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.wildcards = {}
+        self.default = None
+        self.retries = {}
+        self.flights = {}
+        self.queues = {}
+        self.named = {}
+        self.limits = {}
+
+    def add(self, vhost):
+        """
+        Register a virtual host under its exact, wildcard or default name.
+
+        :param vhost (VirtualHost): the host to add.
+        """
+        self.named.update((route.name, route) for route in vhost.routes.values())
+        name = vhost.name.lower()
+        if name == DEFAULT_HOST:
+            self.default = vhost
+        elif name.startswith("*."):
+            self.wildcards[name[1:]] = vhost
+        else:
+            self.exact[name] = vhost
+
+    def lookup(self, hostname):
+        """
+        :param hostname (str): the request's ``Host`` header.
+
+        :rtype VirtualHost: the matching host, or None.
+        """
+        name = hostname.lower()
+        vhost = self.exact.get(name)
+        if vhost is not None:
+            return vhost
+        name = strip_port(name)
+        vhost = self.exact.get(name)
+        if vhost is not None:
+            return vhost
+        dot = name.find(".")
+        while dot >= 0:
+            vhost = self.wildcards.get(name[dot:])
+            if vhost is not None:
+                return vhost
+            dot = name.find(".", dot + 1)
+        return self.default
+
+    def resolve(self, hostname, target):
+        """
+        :param hostname (str): the request's ``Host`` header.
+        :param target (str): the request target.
+
+        :rtype Route: the route serving the request, or None if nothing matches.
+        """
+        vhost = self.lookup(hostname)
+        if vhost is None:
+            return None
+        return vhost.match(target)
+
+    def routes(self):
+        """
+        :rtype list: every Route of the table.
+        """
+        return list(self.named.values())
+
+    def upstream_names(self):
+        """
+        :rtype set: ``"host:port"`` of every upstream referenced by the table.
+        """
+        return {upstream.name for route in self.named.values() for upstream in route.upstreams}
+
+
+def compile_routes(routes, flights=None, retries=None, queues=None, previous=None):
+    """
+    Build the :class:`RoutingTable <RoutingTable>` of a ``routes`` dictionary.
+
+    :param routes (dict): hostname -> ``(proxy_map, policy[, locations])``.
+    :param flights (dict): ``host`` or ``host/prefix`` -> SingleFlight; a host entry
+                           also covers its locations without their own, a None entry
+                           turns coalescing off.
+    :param retries (dict): ``host`` or ``host/prefix`` -> RetryPolicy, inherited alike.
+    :param queues (dict): ``host`` or ``host/prefix`` -> RequestQueue, inherited alike;
+                          routes with a limited upstream and no queue shed at once.
+    :param previous (RoutingTable): the table being replaced by a reload, whose
+                                    routes hand their state to the new ones.
+
+    :rtype RoutingTable: the compiled table.
+    """
+    flights = flights or {}
+    retries = retries or {}
+    queues = queues or {}
+    table = RoutingTable()
+    table.flights = {name: flight for name, flight in flights.items() if flight is not None}
+    table.retries = {name: policy for name, policy in retries.items() if policy is not None}
+    for host, spec in routes.items():
+        proxy_map, policy = spec[0], spec[1] or "round-robin"
+        locations = spec[2] if len(spec) > 2 else {}
+        host_routes = {}
+        if proxy_map:
+            host_routes["/"] = Route(host, proxy_map, policy, retries.get(host),
+                                     flights.get(host), queues.get(host))
+        for prefix, (location_map, location_policy) in locations.items():
+            name = host + prefix
+            host_routes[prefix] = Route(name, location_map or proxy_map,
+                                        location_policy or policy,
+                                        retries.get(name, retries.get(host)),
+                                        flights.get(name, flights.get(host)),
+                                        queues.get(name, queues.get(host)))
+        if previous is not None:
+            for route in host_routes.values():
+                if route.name in previous.named:
+                    route.adopt(previous.named[route.name])
+        table.add(VirtualHost(host, host_routes))
+        for prefix, route in sorted(host_routes.items()):
+            print(f"[Proxy] Route {host}{prefix if prefix != '/' else ''} -> "
+                  f"{', '.join(upstream.name for upstream in route.upstreams)} ({route.policy})")
+    plan_limits(table)
+    # A reload candidate must not touch the live upstreams before it is accepted:
+    # the reloader applies its limits once the table is swapped in
+    if previous is None:
+        apply_limits(table)
+    return table
+
+
+def plan_limits(table):
+    """
+    Compute the ``max_conns`` of every upstream of the table, the smallest one given
+    by its ``proxy_pass`` entries (0, no limit, if none gives one), into
+    ``table.limits``, and give the routes that have a limited upstream but no queue
+    an empty one, so their overflow is shed and counted. The upstreams, shared with
+    the table in use, are left untouched.
+
+    :param table (RoutingTable): the compiled table.
+    """
+    limits = table.limits
+    for route in table.named.values():
+        for upstream, entry in zip(route.upstreams, route.entries):
+            limit = parse_max_conns(entry)
+            current = limits.get(upstream.name, 0)
+            limits[upstream.name] = min(current, limit) if current and limit else current or limit
+    for route in table.named.values():
+        if any(limits[upstream.name] for upstream in route.upstreams):
+            if route.queue is None:
+                route.queue = RequestQueue(size=0)
+            table.queues.setdefault(route.name, route.queue)
+            print(f"[Proxy] Route {route.name} limits: "
+                  f"{', '.join(f'{u.name} max_conns={limits[u.name] or None}' for u in route.upstreams)}"
+                  f", queue size={route.queue.size} timeout={route.queue.timeout}s")
+
+
+def apply_limits(table):
+    """
+    Set the ``max_conns`` computed by :func:`plan_limits` on the upstreams of the
+    table, once it is the table in use.
+
+    :param table (RoutingTable): the table in use.
+    """
+    for route in table.named.values():
+        for upstream in route.upstreams:
+            upstream.max_conns = table.limits[upstream.name]
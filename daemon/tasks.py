@@ -0,0 +1,222 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.tasks
+~~~~~~~~~~~~~~~~~
+
+This module provides a :class:`TaskQueue <TaskQueue>` object, a bounded in-process queue
+served by a pool of worker threads. WeApRous handlers enqueue side effects (logging,
+notifications, persistence) into it so that the response only waits for the critical
+path work.
+
+Notes:
+------
+- Failed tasks are retried with an exponential backoff up to their retry count.
+- ``shutdown`` stops accepting new tasks and drains the pending ones before the
+  worker threads exit.
+
+Usage Example:
+--------------
+>>> tasks = TaskQueue(workers=2, max_pending=100)
+>>> tasks.start()
+>>> tasks.submit(print, args=("done",), retries=3)
+True
+>>> tasks.shutdown(timeout=5)
+"""
+
+import time
+import queue
+import threading
+
+
+class TaskQueue:
+    """The :class:`TaskQueue <TaskQueue>` object, a bounded queue of callables executed
+    by background worker threads.
+
+    :attrs workers (int): number of worker threads.
+    :attrs max_pending (int): maximum number of queued tasks, further submissions are rejected.
+    :attrs retries (int): default number of retries of a failing task.
+    :attrs retry_delay (float): base delay in seconds before the first retry.
+    """
+
+    def __init__(self, workers=2, max_pending=1000, retries=0, retry_delay=0.5):
+        """
+        Initialize a new task queue, the workers are started by :meth:`start`.
+
+        :param workers (int): number of worker threads.
+        :param max_pending (int): capacity of the queue.
+        :param retries (int): default retry count for submitted tasks.
+        :param retry_delay (float): base backoff delay in seconds.
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "retried": 0,
+            "rejected": 0,
+            "running": 0,
+            "high_water": 0,
+        }
+
+    def start(self):
+        """
+        Start the worker threads (idempotent).
+        """
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        # Called with the lock held
+        if self.threads:
+            return
+        self.closed = False
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._work, name=f"weaprous-task-{i}")
+            worker.daemon = True
+            worker.start()
+            self.threads.append(worker)
+
+    def submit(self, func, args=(), kwargs=None, retries=None):
+        """
+        Enqueue ``func(*args, **kwargs)`` for background execution.
+
+        :param func (callable): the task.
+        :param args (tuple): positional arguments of the task.
+        :param kwargs (dict): keyword arguments of the task.
+        :param retries (int): retry count, defaults to the queue setting.
+
+        :rtype bool: True if queued, False if the queue is full or shutting down.
+        """
+        if retries is None:
+            retries = self.retries
+        # Checked and enqueued under the lock shutdown() takes, so no task can
+        # land behind the stop sentinels
+        with self.lock:
+            if self.closed:
+                reason = "queue is shutting down"
+            else:
+                if not self.threads:
+                    self._start()
+                try:
+                    self.queue.put_nowait((func, args, kwargs or {}, retries))
+                    reason = None
+                except queue.Full:
+                    reason = "queue is full"
+            if reason is not None:
+                self.counters["rejected"] += 1
+            else:
+                self.counters["submitted"] += 1
+                depth = self.queue.qsize()
+                if depth > self.counters["high_water"]:
+                    self.counters["high_water"] = depth
+        if reason is not None:
+            print(f"[TaskQueue] Rejected task {getattr(func, '__name__', func)}: {reason}")
+            return False
+        return True
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def _work(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+            func, args, kwargs, retries = task
+            self._count("running")
+            try:
+                self._run(func, args, kwargs, retries)
+            finally:
+                self._count("running", -1)
+                self.queue.task_done()
+
+    def _run(self, func, args, kwargs, retries):
+        attempt = 0
+        while True:
+            try:
+                func(*args, **kwargs)
+                self._count("completed")
+                return
+            except Exception as e:
+                if attempt >= retries:
+                    print(f"[TaskQueue] Task {getattr(func, '__name__', func)} failed after "
+                          f"{attempt + 1} attempt(s): {e}")
+                    self._count("failed")
+                    return
+                delay = self.retry_delay * (2 ** attempt)
+                attempt += 1
+                print(f"[TaskQueue] Task {getattr(func, '__name__', func)} failed ({e}), "
+                      f"retry {attempt}/{retries} in {delay:.2f}s")
+                self._count("retried")
+                time.sleep(delay)
+
+    def shutdown(self, timeout=None):
+        """
+        Stop accepting tasks, wait for the pending ones and stop the workers.
+
+        :param timeout (float): maximum seconds to wait for the drain, None waits forever.
+
+        :rtype bool: True if every pending task finished within the timeout.
+        """
+        with self.lock:
+            self.closed = True
+            threads = list(self.threads)
+        if not threads:
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        drained = True
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    drained = False
+                    break
+                self.queue.all_tasks_done.wait(remaining)
+
+        if not drained:
+            print(f"[TaskQueue] Drain timed out with {self.queue.qsize()} task(s) pending")
+            return False
+
+        for _ in threads:
+            self.queue.put(None)
+        for worker in threads:
+            worker.join()
+        with self.lock:
+            self.threads = []
+        print("[TaskQueue] Drained and stopped")
+        return True
+
+    def stats(self):
+        """
+        Return a snapshot of the queue metrics.
+
+        :rtype dict: depth, capacity, worker count and task counters.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["depth"] = self.queue.qsize()
+        snapshot["max_pending"] = self.max_pending
+        snapshot["workers"] = len(self.threads)
+        return snapshot
@@ -0,0 +1,169 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.tls
+~~~~~~~~~~~~~~~~~
+
+This module terminates TLS on the proxy listener with the ``ssl`` module, so clients
+speak HTTPS to the proxy while the backends keep plain HTTP.
+
+Each ``host`` block of ``proxy.conf`` may name its certificate
+(``ssl_certificate`` / ``ssl_certificate_key``); the certificate of a handshake is
+chosen from the client's SNI server name with the same order as the routes: exact
+name, ``*.suffix`` wildcards (longest first), then the default host ``*``. Clients
+without SNI, or naming no configured host, get the default certificate.
+
+Notes:
+------
+- Resumption: TLS 1.3 session tickets (``num_tickets`` per full handshake) and the
+  OpenSSL server session cache for TLS 1.2 are kept by the default context, whatever
+  certificate the SNI selected. Contexts created before the worker processes are
+  forked share their ticket keys, so a ticket issued by one worker resumes on any.
+- The threaded engine performs the handshake in the connection's own thread, bounded
+  by ``handshake_timeout``, never in the accept loop; the asyncio engine lets the
+  event loop perform it.
+- Certificates are read at startup; a restart (``SIGUSR2``) picks up new ones.
+
+Usage Example:
+--------------
+>>> tls = TlsTerminator({"app1.local": ("certs/app1.pem", "certs/app1.key"),
+...                      "*": ("certs/default.pem", "certs/default.key")})
+>>> conn = tls.wrap(conn)  # in the connection thread, None if the handshake failed
+"""
+
+import ssl
+import socket
+import threading
+
+#: Seconds a client has to complete the TLS handshake.
+HANDSHAKE_TIMEOUT = 10.0
+
+
+class TlsTerminator:
+    """The :class:`TlsTerminator <TlsTerminator>` object, the server side TLS
+    contexts of the proxy listener.
+
+    :attrs context (ssl.SSLContext): the default context, which handshakes start
+                                     with and which keeps the session cache.
+    :attrs handshake_timeout (float): seconds a client has to complete the handshake.
+    """
+
+    def __init__(self, certificates, handshake_timeout=HANDSHAKE_TIMEOUT, num_tickets=2):
+        """
+        :param certificates (dict): host name -> (certificate file, key file); the
+                                    host ``*`` (or else the first one) is the default.
+        :param handshake_timeout (float): seconds a client has to complete the handshake.
+        :param num_tickets (int): TLS 1.3 session tickets sent per full handshake.
+        """
+        if not certificates:
+            raise ValueError("TLS needs at least one ssl_certificate")
+        self.handshake_timeout = handshake_timeout
+        self.num_tickets = num_tickets
+        self.exact = {}
+        self.wildcards = {}
+        self.context = None
+        loaded = {}
+        for host, files in certificates.items():
+            # Hosts sharing a certificate share its context
+            context = loaded.get(files) or loaded.setdefault(files, self._context(*files))
+            name = host.lower()
+            if name == "*":
+                self.context = context
+            elif name.startswith("*."):
+                self.wildcards[name[1:]] = context
+            else:
+                self.exact[name] = context
+            print(f"[TLS] Certificate {files[0]} for {host}")
+        if self.context is None:
+            self.context = loaded[next(iter(certificates.values()))]
+        self.context.sni_callback = self._select
+        self.lock = threading.Lock()
+        self.counters = {"handshakes": 0, "resumed": 0, "failures": 0}
+
+    def _context(self, certfile, keyfile):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.load_cert_chain(certfile, keyfile)
+        context.set_alpn_protocols(["http/1.1"])
+        context.num_tickets = self.num_tickets
+        return context
+
+    def lookup(self, server_name):
+        """
+        :param server_name (str): the SNI name sent by the client.
+
+        :rtype ssl.SSLContext: the context of the matching host, None for the default.
+        """
+        name = server_name.lower()
+        context = self.exact.get(name)
+        if context is not None:
+            return context
+        dot = name.find(".")
+        while dot >= 0:
+            context = self.wildcards.get(name[dot:])
+            if context is not None:
+                return context
+            dot = name.find(".", dot + 1)
+        return None
+
+    def _select(self, tls_socket, server_name, initial):
+        if server_name:
+            context = self.lookup(server_name)
+            if context is not None and context is not initial:
+                tls_socket.context = context
+        return None
+
+    def count(self, tls_object):
+        """
+        Count a completed handshake.
+
+        :param tls_object (ssl.SSLSocket or ssl.SSLObject): the TLS connection.
+        """
+        with self.lock:
+            self.counters["handshakes"] += 1
+            if tls_object.session_reused:
+                self.counters["resumed"] += 1
+
+    def wrap(self, conn):
+        """
+        Perform the server handshake on an accepted connection, in the calling
+        (connection) thread.
+
+        :param conn (socket.socket): the accepted plaintext connection.
+
+        :rtype ssl.SSLSocket: the TLS connection, or None if the handshake failed
+                              (``conn`` is then closed).
+        """
+        conn.settimeout(self.handshake_timeout)
+        try:
+            tls_conn = self.context.wrap_socket(conn, server_side=True,
+                                                do_handshake_on_connect=False)
+            tls_conn.do_handshake()
+        except (ssl.SSLError, socket.timeout, OSError) as e:
+            with self.lock:
+                self.counters["failures"] += 1
+            print(f"[TLS] Handshake failed: {e}")
+            conn.close()
+            return None
+        tls_conn.settimeout(None)
+        self.count(tls_conn)
+        return tls_conn
+
+    def stats(self):
+        """
+        :rtype dict: handshake counters and the session cache figures of OpenSSL.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["session_cache"] = self.context.session_stats()
+        return snapshot
@@ -0,0 +1,275 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.tracing
+~~~~~~~~~~~~~~~~~
+
+This module follows one request from the proxy to the WeApRous backend that served
+it, so that the proxy latency of a slow request can be lined up with the time its
+handler took.
+
+- Propagation: the W3C Trace Context ``traceparent`` header
+  (``00-<trace id>-<parent span id>-<flags>``). The proxy continues the trace of a
+  client that sent one, or starts a new one, and passes its own span id on to the
+  backend.
+- Spans: a :class:`Span <Span>` per step, written by a :class:`SpanExporter
+  <SpanExporter>` in the Zipkin v2 JSON format, one span object per line (a file
+  wrapped in ``[...]`` with commas is a Zipkin upload body).
+
+The backend side, :class:`ServerTrace <ServerTrace>`, records a ``SERVER`` span for
+the request and one child span per step of :class:`HttpAdapter <HttpAdapter>`:
+``parse``, ``dispatch`` (rate limit, cache and hook), ``serialize`` and ``send``.
+
+Notes:
+------
+- Only sampled traces (flag ``01``) are exported; new traces are sampled.
+- Timestamps are wall clock microseconds, durations come from the monotonic clock.
+
+Usage Example:
+--------------
+>>> exporter = SpanExporter("traces.jsonl", "chat-tracker")
+>>> trace = ServerTrace(exporter, request.headers, started)
+>>> trace.lap("parse")
+>>> ...
+>>> trace.finish(status=200)
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+#: Header carrying the trace context between the proxy and the backends.
+TRACEPARENT = "traceparent"
+
+#: Header carrying the time the proxy received the request, ``t=<epoch microseconds>``.
+REQUEST_START = "X-Request-Start"
+
+
+def new_id(size):
+    """
+    :param size (int): id size in bytes, 16 for a trace, 8 for a span.
+
+    :rtype str: a random non-zero lowercase hex id.
+    """
+    while True:
+        value = os.urandom(size).hex()
+        if value.strip("0"):
+            return value
+
+
+def parse_traceparent(value):
+    """
+    :param value (str): a ``traceparent`` header value, or None.
+
+    :rtype tuple: (trace id, parent span id, sampled), or None if the value is
+                  missing or malformed.
+    """
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] == "ff":
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    # Version 00 has exactly four fields, later versions may append some
+    if version == "00" and len(parts) != 4:
+        return None
+    try:
+        int(version, 16), int(trace_id, 16), int(parent_id, 16)
+        sampled = int(flags, 16) & 1
+    except ValueError:
+        return None
+    if (len(version), len(trace_id), len(parent_id), len(flags)) != (2, 32, 16, 2):
+        return None
+    if not trace_id.strip("0") or not parent_id.strip("0"):
+        return None
+    return trace_id, parent_id, bool(sampled)
+
+
+def format_traceparent(trace_id, span_id, sampled=True):
+    """
+    :rtype str: the ``traceparent`` value naming ``span_id`` as the parent.
+    """
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+def request_start(value):
+    """
+    :param value (str): an ``X-Request-Start`` header value (``t=<microseconds>``).
+
+    :rtype float: the epoch time it carries, or None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith("t="):
+        value = value[2:]
+    try:
+        return int(value) / 1e6
+    except ValueError:
+        return None
+
+
+class Span:
+    """The :class:`Span <Span>` object, one timed step of a trace.
+
+    :attrs start (float): monotonic start time.
+    :attrs end (float): monotonic end time, None while the span is open.
+    :attrs tags (dict): string annotations of the span.
+    """
+
+    __slots__ = ("name", "trace_id", "id", "parent_id", "kind", "start", "end", "tags")
+
+    def __init__(self, name, trace_id, parent_id=None, kind=None, start=None, span_id=None):
+        """
+        :param name (str): the step name.
+        :param trace_id (str): the trace it belongs to.
+        :param parent_id (str): the id of the parent span, None for a root span.
+        :param kind (str): ``"SERVER"``, ``"CLIENT"`` or None for a local step.
+        :param start (float): monotonic start time, now by default.
+        :param span_id (str): the span id, random by default.
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.id = span_id or new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.monotonic() if start is None else start
+        self.end = None
+        self.tags = {}
+
+    def child(self, name, start=None, end=None):
+        """
+        :rtype Span: a local step of this span, closed at ``end`` when given.
+        """
+        span = Span(name, self.trace_id, self.id, start=start)
+        span.end = end
+        return span
+
+    def finish(self, end=None):
+        self.end = time.monotonic() if end is None else end
+
+    def record(self, service, offset):
+        """
+        :param service (str): the service name of the local endpoint.
+        :param offset (float): wall clock minus monotonic clock, in seconds.
+
+        :rtype dict: the span in the Zipkin v2 JSON format.
+        """
+        entry = {"traceId": self.trace_id}
+        if self.parent_id:
+            entry["parentId"] = self.parent_id
+        entry["id"] = self.id
+        if self.kind:
+            entry["kind"] = self.kind
+        entry["name"] = self.name
+        entry["timestamp"] = int((self.start + offset) * 1e6)
+        end = self.end if self.end is not None else time.monotonic()
+        entry["duration"] = max(1, int((end - self.start) * 1e6))
+        entry["localEndpoint"] = {"serviceName": service}
+        if self.tags:
+            entry["tags"] = {key: str(value) for key, value in self.tags.items()
+                             if value is not None}
+        return entry
+
+
+class SpanExporter:
+    """The :class:`SpanExporter <SpanExporter>` object, a local file of finished
+    spans, one Zipkin v2 JSON object per line.
+
+    :attrs path (str): the span file, ``"-"`` for the standard output.
+    :attrs service (str): service name written in every span.
+    """
+
+    def __init__(self, path, service):
+        self.path = path
+        self.service = service
+        self.lock = threading.Lock()
+        # Line buffered: every span reaches the file as soon as it is written
+        self.stream = sys.stdout if path == "-" else open(path, "a", buffering=1)
+
+    def export(self, spans):
+        """
+        :param spans (list): the finished spans of one request.
+        """
+        offset = time.time() - time.monotonic()
+        lines = "".join(json.dumps(span.record(self.service, offset), separators=(",", ":")) + "\n"
+                        for span in spans)
+        with self.lock:
+            self.stream.write(lines)
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class ServerTrace:
+    """The :class:`ServerTrace <ServerTrace>` object, the spans of one request served
+    by a backend: a ``SERVER`` span continuing the caller's ``traceparent`` and one
+    child span per step, each step lasting from the end of the previous one.
+
+    :attrs root (Span): the request span.
+    :attrs steps (list): the child spans, in order.
+    """
+
+    def __init__(self, exporter, headers, started):
+        """
+        :param exporter (SpanExporter): where the spans go once the request is done.
+        :param headers (dict): the request headers, lowercase names.
+        :param started (float): monotonic time the connection was accepted.
+        """
+        self.exporter = exporter
+        context = parse_traceparent(headers.get(TRACEPARENT))
+        if context is None:
+            trace_id, parent_id, self.sampled = new_id(16), None, True
+        else:
+            trace_id, parent_id, self.sampled = context
+        self.root = Span("request", trace_id, parent_id, "SERVER", started)
+        self.steps = []
+        self.last = started
+        proxied = request_start(headers.get(REQUEST_START.lower()))
+        if proxied is not None:
+            # Time between the proxy reading the request and this backend accepting it
+            # (clocks of different hosts may disagree)
+            accepted = started + time.time() - time.monotonic()
+            self.root.tags["proxy.queue_ms"] = round(max(0.0, accepted - proxied) * 1000, 3)
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            self.root.tags["http.client_ip"] = forwarded.split(",")[0].strip()
+
+    def lap(self, name):
+        """
+        Close the step ``name``, which started at the end of the previous one.
+        """
+        now = time.monotonic()
+        self.steps.append(self.root.child(name, self.last, now))
+        self.last = now
+
+    def server_timing(self):
+        """
+        :rtype str: the steps so far as a ``Server-Timing`` header value.
+        """
+        return ", ".join(f"{span.name};dur={(span.end - span.start) * 1000:.3f}"
+                         for span in self.steps)
+
+    def finish(self, **tags):
+        """
+        Close the request span and export the trace if it is sampled.
+
+        :param tags: annotations of the request span (method, path, status...).
+        """
+        self.root.finish(self.last)
+        self.root.tags.update(tags)
+        if self.sampled:
+            self.exporter.export([self.root] + self.steps)
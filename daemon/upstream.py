@@ -0,0 +1,465 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.upstream
+~~~~~~~~~~~~~~~~~
+
+This module provides the :class:`Upstream <Upstream>` object that represents one backend
+of a ``proxy_pass`` list, together with its pool of persistent connections.
+
+Notes:
+------
+- Idle connections are reused most-recent-first and checked on checkout: a connection
+  that is too old, idle for too long, or closed/readable on the backend side is dropped.
+- Only connections whose last response was fully read and allowed keep-alive are put
+  back in the pool.
+- An upstream with ``max_conns`` never has more requests in flight: a request
+  :meth:`reserves <Upstream.reserve>` a slot before it is sent, and a request finding
+  every upstream of its route full waits in the route's :class:`RequestQueue
+  <RequestQueue>` until a slot is freed or the queue timeout expires.
+
+Usage Example:
+--------------
+>>> upstream = get_upstream("127.0.0.1", 9000)
+>>> conn = upstream.pool.acquire()
+>>> conn.sock.sendall(request)
+>>> upstream.pool.release(conn, reusable=True)
+"""
+
+import time
+import socket
+import threading
+from collections import deque
+
+from .framing import HttpReader
+from .health import CircuitBreaker
+
+#: Seconds to wait for a backend connection to be established.
+CONNECT_TIMEOUT = 3.0
+
+#: Seconds to wait on a backend read or write.
+IO_TIMEOUT = 30.0
+
+#: Seconds an idle pooled connection may wait for reuse. Kept well below the
+#: backend's own keep-alive timeout (15s for WeApRous), which starts earlier, so the
+#: pool never hands out a connection the backend is closing.
+POOL_IDLE_TIMEOUT = 10.0
+
+#: Weight of the newest sample in the latency moving average.
+EWMA_ALPHA = 0.3
+
+
+class PooledConnection:
+    """One persistent connection to an upstream, with its read buffer."""
+
+    __slots__ = ("sock", "reader", "created", "last_used", "acquired", "requests")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = HttpReader(sock)
+        self.created = time.monotonic()
+        self.last_used = self.created
+        #: When the current request checked it out of the pool
+        self.acquired = self.created
+        #: Number of requests already sent on this connection
+        self.requests = 0
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def is_reusable(sock):
+    """
+    Check an idle connection without blocking: it is reusable only if the backend
+    neither closed it nor sent unexpected bytes.
+
+    :param sock (socket.socket): idle connection.
+
+    :rtype bool: True if the connection can carry a new request.
+    """
+    try:
+        sock.setblocking(False)
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        finally:
+            sock.settimeout(IO_TIMEOUT)
+    except (BlockingIOError, InterruptedError):
+        # Nothing to read: the connection is open and quiet
+        return True
+    except OSError:
+        return False
+    # Readable means the backend closed (b"") or sent bytes nobody asked for
+    return False
+
+
+class ConnectionPool:
+    """The :class:`ConnectionPool <ConnectionPool>` object, the idle persistent
+    connections to one upstream address.
+
+    :attrs max_idle (int): maximum number of idle connections kept.
+    :attrs max_age (float): seconds after which a connection is retired.
+    :attrs idle_timeout (float): seconds an idle connection may wait for reuse.
+    """
+
+    def __init__(self, host, port, max_idle=16, max_age=60.0, idle_timeout=POOL_IDLE_TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.idle = deque()
+        self.lock = threading.Lock()
+        #: Set once the upstream is retired: released connections are closed
+        self.closed = False
+        self.counters = {"created": 0, "reused": 0, "expired": 0,
+                         "stale": 0, "discarded": 0, "pooled": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def connect(self):
+        """
+        Open a new connection to the upstream.
+
+        :rtype PooledConnection: the fresh connection.
+        """
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(IO_TIMEOUT)
+        self._count("created")
+        return PooledConnection(sock)
+
+    def acquire(self):
+        """
+        Check out a healthy idle connection, or open a new one.
+
+        :rtype PooledConnection: a connection ready for a request.
+        """
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                return self.connect()
+
+            now = time.monotonic()
+            if now - conn.created > self.max_age or now - conn.last_used > self.idle_timeout:
+                self._count("expired")
+                conn.close()
+                continue
+            if not is_reusable(conn.sock):
+                self._count("stale")
+                conn.close()
+                continue
+            self._count("reused")
+            return conn
+
+    def release(self, conn, reusable):
+        """
+        Return a connection after a complete exchange.
+
+        :param conn (PooledConnection): the connection.
+        :param reusable (bool): whether the response allowed keep-alive and was fully read.
+        """
+        conn.requests += 1
+        now = time.monotonic()
+        if not reusable or self.closed or conn.reader.buf or now - conn.created > self.max_age:
+            self.discard(conn)
+            return
+        conn.last_used = now
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                self.counters["pooled"] += 1
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        """
+        Close a connection that must not be reused.
+
+        :param conn (PooledConnection): the connection.
+        """
+        self._count("discarded")
+        conn.close()
+
+    def close_all(self):
+        """
+        Close every idle connection and stop pooling new ones.
+        """
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """
+        :rtype dict: pool counters and current idle count.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+            snapshot["idle"] = len(self.idle)
+        return snapshot
+
+
+class Upstream:
+    """The :class:`Upstream <Upstream>` object, one backend address of a ``proxy_pass``
+    list and the state the proxy keeps about it.
+
+    The live load figures (``in_flight`` and the EWMA of the time to first byte) are
+    updated by ``forward_request`` and read without locking by the balancing policies.
+
+    :attrs host (str): backend IP address or hostname.
+    :attrs port (int): backend port.
+    :attrs name (str): ``"host:port"`` as written in ``proxy.conf``.
+    :attrs pool (ConnectionPool): persistent connections to the backend.
+    :attrs in_flight (int): requests currently sent to the backend, or holding a slot.
+    :attrs max_conns (int): most requests in flight at once, 0 for no limit.
+    :attrs ewma (float): smoothed time to first byte in seconds (0 until measured).
+    :attrs breaker (CircuitBreaker): ejects the backend after repeated failures.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = int(port)
+        self.name = f"{host}:{self.port}"
+        self.pool = ConnectionPool(host, self.port)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_conns = 0
+        self.ewma = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.breaker = CircuitBreaker(self.name)
+
+    def __repr__(self):
+        return f"<Upstream {self.name}>"
+
+    def available(self):
+        """
+        :rtype bool: False while the backend is ejected by its circuit breaker.
+        """
+        return self.breaker.allow()
+
+    def saturated(self):
+        """
+        :rtype bool: True while every connection slot allowed by ``max_conns`` is taken.
+        """
+        return 0 < self.max_conns <= self.in_flight
+
+    def reserve(self):
+        """
+        Take a connection slot for a request, to be given back by :meth:`end` once
+        it is sent or by :meth:`release` if it is not.
+
+        :rtype bool: False if the upstream is saturated.
+        """
+        with self.lock:
+            if 0 < self.max_conns <= self.in_flight:
+                return False
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        """
+        Give back a slot taken by :meth:`reserve` for a request that was not sent.
+        """
+        with self.lock:
+            self.in_flight -= 1
+        if self.max_conns:
+            SLOT_WAITERS.notify()
+
+    def begin(self):
+        """
+        Count a request sent to this upstream, on a slot taken by :meth:`reserve`.
+
+        :rtype float: start timestamp to pass to :meth:`observe`.
+        """
+        self.breaker.on_request()
+        with self.lock:
+            self.requests += 1
+        return time.monotonic()
+
+    def observe(self, started):
+        """
+        Fold the time to first byte of a response into the latency EWMA.
+
+        :param started (float): timestamp returned by :meth:`begin`.
+        """
+        latency = time.monotonic() - started
+        with self.lock:
+            if self.ewma == 0.0:
+                self.ewma = latency
+            else:
+                self.ewma += EWMA_ALPHA * (latency - self.ewma)
+
+    def end(self, ok=True):
+        """
+        Mark a request to this upstream as finished.
+
+        :param ok (bool): False if the exchange failed, fed to the circuit breaker;
+                          None if it was abandoned (a hedge that lost the race).
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if ok is False:
+                self.failures += 1
+        if ok is not None:
+            self.breaker.record(ok)
+        if self.max_conns:
+            SLOT_WAITERS.notify()
+
+    def stats(self):
+        """
+        :rtype dict: load, latency, health and pool figures of the upstream.
+        """
+        return {
+            "health": self.breaker.stats(),
+            "in_flight": self.in_flight,
+            "max_conns": self.max_conns,
+            "ewma_ms": round(self.ewma * 1000, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "pool": self.pool.stats(),
+        }
+
+
+class SlotWaiters:
+    """The requests queued for a connection slot, woken whenever an upstream with
+    ``max_conns`` frees one. Every waiter is woken and tries its route again, so a
+    waiter whose route does not use that upstream simply waits on.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = set()
+
+    def add(self, wake):
+        """
+        :param wake (callable): called without arguments, from any thread, when a
+                                slot is freed.
+        """
+        with self.lock:
+            self.waiters.add(wake)
+
+    def discard(self, wake):
+        with self.lock:
+            self.waiters.discard(wake)
+
+    def notify(self):
+        if not self.waiters:
+            return
+        with self.lock:
+            waiters = list(self.waiters)
+        for wake in waiters:
+            wake()
+
+
+#: Requests waiting for a slot of a saturated upstream.
+SLOT_WAITERS = SlotWaiters()
+
+
+class RequestQueue:
+    """The :class:`RequestQueue <RequestQueue>` object, the bounded wait queue of a
+    route whose upstreams are all at their ``max_conns``.
+
+    :attrs size (int): most requests waiting at once; 0 sheds them immediately.
+    :attrs timeout (float): longest wait for a slot in seconds.
+    :attrs waiting (int): requests currently waiting.
+    """
+
+    def __init__(self, size=0, timeout=5.0):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.counters = {"queued": 0, "dequeued": 0, "rejected": 0, "timeouts": 0}
+
+    def enter(self):
+        """
+        :rtype bool: True if the request may wait, False if the queue is full.
+        """
+        with self.lock:
+            if self.waiting >= self.size:
+                self.counters["rejected"] += 1
+                return False
+            self.waiting += 1
+            self.counters["queued"] += 1
+        return True
+
+    def leave(self, served):
+        """
+        :param served (bool): whether the request got a slot before the timeout.
+        """
+        with self.lock:
+            self.waiting -= 1
+            self.counters["dequeued" if served else "timeouts"] += 1
+
+    def stats(self):
+        """
+        :rtype dict: queue limits, current length and counters.
+        """
+        with self.lock:
+            snapshot = dict(self.counters)
+            snapshot["waiting"] = self.waiting
+        snapshot["size"] = self.size
+        snapshot["timeout"] = self.timeout
+        return snapshot
+
+
+#: Every upstream known to this proxy process, keyed by ``"host:port"``.
+UPSTREAMS = {}
+upstreams_lock = threading.Lock()
+
+
+def get_upstream(host, port):
+    """
+    Return the shared :class:`Upstream <Upstream>` for an address, creating it on
+    first use so that every route pointing at the same backend shares one pool.
+
+    :param host (str): backend IP address or hostname.
+    :param port (int): backend port.
+
+    :rtype Upstream: the upstream.
+    """
+    name = f"{host}:{int(port)}"
+    upstream = UPSTREAMS.get(name)
+    if upstream is None:
+        with upstreams_lock:
+            upstream = UPSTREAMS.get(name)
+            if upstream is None:
+                upstream = Upstream(host, port)
+                UPSTREAMS[name] = upstream
+    return upstream
+
+
+def retire_upstream(name):
+    """
+    Forget an upstream that no route references anymore, closing its idle
+    connections. Requests still holding it finish normally.
+
+    :param name (str): ``"host:port"`` of the upstream.
+
+    :rtype Upstream: the retired upstream, or None if it was unknown.
+    """
+    with upstreams_lock:
+        upstream = UPSTREAMS.pop(name, None)
+    if upstream is not None:
+        upstream.pool.close_all()
+    return upstream
@@ -17,7 +17,17 @@ deamon.weaproute
 This module provides a WeApRous object to deploy RESTful url web app with routing
 """
 
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 from .backend import create_backend
+from .cache import ResponseCache
+from .tasks import TaskQueue
+from .ratelimit import RateLimiter
+from .tracing import SpanExporter
+from .request import Request
+from .response import Response
+from .httpadapter import run_hook, cache_lookup, cache_store, serialize_hook_result
 
 class WeApRous:
     """The fully mutable :class:`WeApRous <WeApRous>` object, which is a lightweight,
@@ -40,18 +50,45 @@ class WeApRous:
       >>> def hello(headers, body):
       >>>     return {'message': 'Hello, world!'}
 
+      >>> @app.route('/channels', methods=['GET'], cache_ttl=5)
+      >>> def channels(headers, body):
+      >>>     return {'channels': ['general']}
+
+      >>> app.invalidate('/channels')
+      >>> app.background(print, 'runs after the response')
+      >>> app.enable_batch('/batch')
+      >>> app.enable_tracing('traces.jsonl')
       >>> app.run()
     """
 
-    def __init__(self):
+    def __init__(self, task_workers=2, task_queue_size=1000, task_retries=0,
+                 drain_timeout=10):
         """
         Initialize a new WeApRous instance.
 
         Sets up an empty route registry and prepares placeholders for IP and port.
+
+        :param task_workers (int): worker threads of the background task queue.
+        :param task_queue_size (int): maximum number of pending background tasks.
+        :param task_retries (int): default retry count of background tasks.
+        :param drain_timeout (float): seconds to drain in-flight requests and background
+                                      tasks at shutdown.
         """
         self.routes = {}
         self.ip = None
         self.port = None
+        #: Serialized responses of the routes declared with ``cache_ttl``
+        self.cache = ResponseCache()
+        #: Side effects deferred by handlers until after the response
+        self.tasks = TaskQueue(workers=task_workers, max_pending=task_queue_size,
+                               retries=task_retries)
+        self.drain_timeout = drain_timeout
+        #: Path of the batch endpoint, None until :meth:`enable_batch` is called
+        self.batch_path = None
+        #: Per-client admission control, None until limits are configured
+        self.limiter = None
+        #: Span exporter, None until :meth:`enable_tracing` is called
+        self.tracer = None
         return
 
     def prepare_address(self, ip, port):
@@ -64,12 +101,66 @@ class WeApRous:
         self.ip = ip
         self.port = port
 
-    def route(self, path, methods=['GET']):
+    def limit_clients(self, rate=None, burst=None, max_conns=None,
+                      max_clients=10000, idle_timeout=60, trusted_proxies=None):
+        """
+        Enable per-client admission control on the backend. Connections over the
+        limits are answered with 429 and ``Retry-After`` before being parsed.
+
+        :param rate (float): requests per second allowed per client IP.
+        :param burst (int): token bucket size per client IP (defaults to ``rate``).
+        :param max_conns (int): concurrent connections allowed per client IP.
+        :param max_clients (int): bound on the number of tracked clients.
+        :param idle_timeout (float): idle seconds before a client's state is evicted.
+        :param trusted_proxies (iterable): addresses of proxies whose ``X-Forwarded-For``
+                                           names the client to limit.
+
+        :rtype RateLimiter: the configured limiter.
+        """
+        if self.limiter is None:
+            self.limiter = RateLimiter(rate, burst, max_conns, max_clients, idle_timeout,
+                                       trusted_proxies)
+        else:
+            self.limiter.rate = rate
+            self.limiter.burst = burst if burst is not None else rate
+            self.limiter.max_conns = max_conns
+            self.limiter.max_clients = max_clients
+            self.limiter.idle_timeout = idle_timeout
+            self.limiter.trusted_proxies = frozenset(trusted_proxies or ())
+        return self.limiter
+
+    def enable_tracing(self, path, service="weaprous"):
+        """
+        Trace every request: continue the ``traceparent`` sent by the proxy (or
+        start a trace) and write the spans of the parse, dispatch, serialize and
+        send steps to ``path`` in the Zipkin v2 JSON format, one span per line.
+
+        :param path (str): the span file, ``"-"`` for the standard output.
+        :param service (str): service name recorded in the spans.
+
+        :rtype SpanExporter: the exporter.
+        """
+        self.tracer = SpanExporter(path, service)
+        return self.tracer
+
+    def route(self, path, methods=['GET'], cache_ttl=None, cache_vary=None, rate_limit=None):
         """
         Decorator to register a route handler for a specific path and HTTP methods.
 
+        When ``cache_ttl`` is given, the serialized response of the handler is kept
+        for that many seconds and later requests are answered from the cache without
+        calling the handler. ``cache_vary`` receives the :class:`Request <Request>`
+        and returns a hashable key, so that requests producing different responses
+        (e.g. a different body or cookie) get separate cache entries.
+
+        ``rate_limit`` gives every client IP its own token bucket for this route;
+        requests over it are answered with 429.
+
         :param path (str): The URL path to route.
         :param methods (list): A list of HTTP methods (e.g., ['GET', 'POST']) to bind.
+        :param cache_ttl (float): Seconds to cache the response, None disables caching.
+        :param cache_vary (callable): Function ``request -> key`` to vary the cache by.
+        :param rate_limit (float|tuple): Per-client ``rate`` or ``(rate, burst)`` of this route.
 
         :rtype: function - A decorator that registers the handler function.
         """
@@ -81,9 +172,200 @@ class WeApRous:
             func._route_path = path
             func._route_methods = methods
 
+            if cache_ttl:
+                func._route_cache = self.cache
+                func._route_cache_ttl = cache_ttl
+                func._route_cache_vary = cache_vary
+
+            if rate_limit:
+                rate, burst = rate_limit if isinstance(rate_limit, tuple) else (rate_limit, None)
+                if self.limiter is None:
+                    self.limiter = RateLimiter()
+                func._route_rate_limit = (self.limiter, rate, burst)
+
             return func
         return decorator
 
+    def invalidate(self, path=None, method=None, vary_key=None):
+        """
+        Drop cached responses of a route, typically called by write handlers
+        after they modified the data served by a cached route.
+
+        :param path (str): The routed path, None invalidates every route.
+        :param method (str): Only invalidate this HTTP method (default: all).
+        :param vary_key (hashable): Only invalidate this vary key (default: all).
+
+        :rtype int: number of cached responses removed.
+        """
+        return self.cache.invalidate(path, method, vary_key)
+
+    def cache_stats(self):
+        """
+        Return the per-route response cache statistics (hits, misses, stores,
+        expirations, evictions, invalidations and hit ratio).
+
+        :rtype dict: cache statistics snapshot.
+        """
+        return self.cache.stats()
+
+    def background(self, func, *args, retries=None, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` on the background task queue, so a handler
+        can respond before its side effects (logging, notifications, persistence)
+        are done.
+
+        :param func (callable): the task to run.
+        :param retries (int): times a failing task is retried, defaults to the
+                              queue setting (keyword only).
+
+        :rtype bool: True if the task was queued, False if the queue is full.
+        """
+        return self.tasks.submit(func, args, kwargs, retries=retries)
+
+    def task_stats(self):
+        """
+        Return the background task queue metrics (depth, high water mark,
+        completed, failed, retried and rejected counts).
+
+        :rtype dict: task queue statistics snapshot.
+        """
+        return self.tasks.stats()
+
+    def limiter_stats(self):
+        """
+        Return the rate limiter counters, or None when no limits are configured.
+
+        :rtype dict: admitted, limited and evicted counts.
+        """
+        return self.limiter.stats() if self.limiter is not None else None
+
+    def enable_batch(self, path='/batch', parallel=False, max_requests=50, workers=8):
+        """
+        Register a batch endpoint that executes several routed calls in one
+        round trip.
+
+        The endpoint accepts ``POST`` with a JSON array of ``{"method", "path", "body"}``
+        sub-requests, or an object ``{"requests": [...], "parallel": true}``. With
+        ``"stop_on_error": true`` in the object, the sub-requests run sequentially and
+        those following a failed one (HTTP error status, or a body whose ``status``
+        is ``"error"``) are skipped with ``424``, for calls depending on the previous
+        ones (register then join). Each
+        sub-request is dispatched in-process through the route table, with the route
+        rate limits and response caches of a direct request, inheriting the
+        headers, cookies and client address of the batch request, and the endpoint
+        returns ``{"status": "success", "results": [{"status", "body"}, ...]}`` in
+        the order of the sub-requests. Sub-requests run sequentially unless the
+        endpoint allows parallelism and the client asks for it.
+
+        :param path (str): The URL path of the batch endpoint.
+        :param parallel (bool): Allow clients to request parallel execution.
+        :param max_requests (int): Maximum number of sub-requests per batch.
+        :param workers (int): Maximum threads used for a parallel batch.
+        """
+        self.batch_path = path
+
+        def failed(result):
+            body = result["body"]
+            return result["status"] >= 400 or (isinstance(body, dict) and body.get("status") == "error")
+
+        def batch(request, response):
+            try:
+                payload = json.loads(request.body or "[]")
+            except ValueError as e:
+                response.status_code = 400
+                response.reason = "Bad Request"
+                return {"status": "error", "message": f"Invalid batch body: {e}"}
+
+            run_parallel = stop_on_error = False
+            if isinstance(payload, dict):
+                stop_on_error = bool(payload.get("stop_on_error"))
+                run_parallel = parallel and bool(payload.get("parallel")) and not stop_on_error
+                payload = payload.get("requests", [])
+            if not isinstance(payload, list):
+                response.status_code = 400
+                response.reason = "Bad Request"
+                return {"status": "error", "message": "Batch body must be a list of requests"}
+            if len(payload) > max_requests:
+                response.status_code = 413
+                response.reason = "Payload Too Large"
+                return {"status": "error",
+                        "message": f"Batch is limited to {max_requests} requests"}
+
+            if run_parallel and len(payload) > 1:
+                with ThreadPoolExecutor(max_workers=min(workers, len(payload))) as pool:
+                    results = list(pool.map(lambda sub: self.dispatch(request, sub), payload))
+            elif stop_on_error:
+                results = []
+                for sub in payload:
+                    if results and failed(results[-1]):
+                        results.append({"status": 424, "body": {
+                            "status": "error", "message": "Skipped after a failed sub-request"}})
+                    else:
+                        results.append(self.dispatch(request, sub))
+            else:
+                results = [self.dispatch(request, sub) for sub in payload]
+            return {"status": "success", "results": results}
+
+        self.route(path, methods=['POST'])(batch)
+
+    def dispatch(self, parent, call):
+        """
+        Execute one batch sub-request through the route table.
+
+        :param parent (Request): the batch request the sub-request inherits
+                                 headers, cookies and client address from.
+        :param call (dict): ``{"method": str, "path": str, "body": str|object}``.
+
+        :rtype dict: ``{"status": int, "body": object}``.
+        """
+        if not isinstance(call, dict):
+            return {"status": 400, "body": {"status": "error", "message": "Sub-request must be an object"}}
+
+        method = str(call.get("method", "GET")).upper()
+        path = call.get("path")
+        body = call.get("body", "")
+        if body is None:
+            body = ""
+        elif not isinstance(body, str):
+            body = json.dumps(body)
+
+        hook = self.routes.get((method, path))
+        if hook is None or path == self.batch_path:
+            return {"status": 404, "body": {"status": "error", "message": f"No route for {method} {path}"}}
+
+        route_limit = getattr(hook, '_route_rate_limit', None)
+        if route_limit is not None:
+            limiter, rate, burst = route_limit
+            allowed, retry_after = limiter.check_route(parent.client_ip, method, path, rate, burst)
+            if not allowed:
+                return {"status": 429, "body": {"status": "error", "message": "Too Many Requests",
+                                                "retry_after": retry_after}}
+
+        sub = Request()
+        sub.method = method
+        sub.path = path
+        sub.version = parent.version
+        sub.headers = dict(parent.headers or {})
+        sub.cookies = dict(parent.cookies or {})
+        sub.connaddr = parent.connaddr
+        sub.client_ip = parent.client_ip
+        sub.body = body
+        sub.routes = self.routes
+        sub.hook = hook
+
+        # Same route cache as a direct request
+        lookup = cache_lookup(sub)
+        cached = lookup[3]
+        if cached is not None:
+            return {"status": int(cached[9:12]),
+                    "body": json.loads(cached.split(b"\r\n\r\n", 1)[1])}
+
+        resp = Response()
+        result = run_hook(sub, resp)
+        if lookup[0] is not None:
+            cache_store(sub, resp, serialize_hook_result(sub, resp, result), lookup)
+        return {"status": resp.status_code or 200, "body": result}
+
     def run(self):
         """
         Start the backend server and begin handling requests.
@@ -97,5 +379,10 @@ class WeApRous:
             print("Rous app need to preapre address"
                   "by calling app.prepare_address(ip,port)")
 
-        create_backend(self.ip, self.port, self.routes)
+        self.tasks.start()
+        try:
+            create_backend(self.ip, self.port, self.routes, self.limiter, self.drain_timeout,
+                           self.tracer)
+        finally:
+            self.tasks.shutdown(timeout=self.drain_timeout)
         
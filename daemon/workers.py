@@ -0,0 +1,189 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.workers
+~~~~~~~~~~~~~~~~~
+
+This module runs the proxy as several worker processes sharing one listening port,
+so that parsing and relaying are spread over the cores instead of one interpreter
+lock.
+
+A master process creates the listening socket (or adopts the one handed over by
+``SIGUSR2``), then forks the workers. Every worker inherits the socket through
+``WEAPROUS_LISTEN_FD``, exactly as a restarted daemon does, and runs a complete
+engine: its own routing table, reloader, pools and histograms. What must agree
+across workers is shared or made deterministic:
+
+- health: ejections and re-admissions go through a :class:`HealthBoard
+  <HealthBoard>` in shared memory; only worker 0 runs the active health checks;
+- rotation: worker ``i`` starts its round-robin rotations at position ``i``.
+
+Signals go to the master: ``SIGTERM``/``SIGINT`` drain every worker, ``SIGHUP``
+makes them reload the config, ``SIGUSR2`` starts a new master on the same socket
+then drains the workers. A worker that dies is started again.
+
+Notes:
+------
+- Workers are forked, so this mode needs a Unix system; elsewhere the proxy runs
+  in a single process.
+- Load-aware policies (``least-conn``, ``ewma``...) only see the requests of their
+  own worker.
+
+Usage Example:
+--------------
+>>> def serve(index):
+...     create_proxy("0.0.0.0", 8080, load_routing_table("config/proxy.conf"),
+...                  health_check="tcp" if index == 0 else None)
+>>> run_workers(4, "0.0.0.0", 8080, serve)
+"""
+
+import os
+import sys
+import time
+import signal
+import traceback
+
+from .lifecycle import create_listener, spawn_successor, LISTEN_FD_ENV
+from .health import HealthBoard, share_health
+from .balancer import set_rotation_offset
+
+#: Listen backlog of the shared socket, sized for several accepting workers.
+BACKLOG = 1024
+
+#: A worker dying sooner than this after its start is restarted after a pause.
+RESTART_PAUSE = 1.0
+
+
+class WorkerPool:
+    """The :class:`WorkerPool <WorkerPool>` object, the master process state: the
+    shared listening socket and the running workers.
+
+    :attrs count (int): number of workers.
+    :attrs children (dict): pid -> worker index.
+    """
+
+    def __init__(self, count, listener, serve):
+        """
+        :param count (int): number of workers.
+        :param listener (socket.socket): the shared listening socket.
+        :param serve (callable): ``serve(index)`` runs the engine of one worker until
+                                 it has stopped.
+        """
+        self.count = count
+        self.listener = listener
+        self.serve = serve
+        self.board = HealthBoard()
+        self.children = {}
+        self.started = {}
+        self.stopping = False
+
+    def start(self, index):
+        """
+        Fork worker ``index``.
+        """
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            self.started[index] = time.monotonic()
+            return
+        # In the worker: the engine installs its own handlers
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR2):
+            signal.signal(signum, signal.SIG_DFL)
+        os.environ[LISTEN_FD_ENV] = str(self.listener.fileno())
+        set_rotation_offset(index)
+        share_health(self.board)
+        code = 0
+        try:
+            self.serve(index)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+
+    def signal_all(self, signum):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _on_stop(self, signum, frame):
+        if not self.stopping:
+            print(f"[Workers] Signal {signum} received, draining {len(self.children)} worker(s)")
+        # A second signal reaches the workers too, which then abandon their drain
+        self.stopping = True
+        self.signal_all(signal.SIGTERM)
+
+    def _on_reload(self, signum, frame):
+        self.signal_all(signal.SIGHUP)
+
+    def _on_restart(self, signum, frame):
+        if self.stopping:
+            return
+        try:
+            spawn_successor("Workers", self.listener)
+        except OSError as e:
+            print(f"[Workers] Restart failed, keep serving: {e}")
+            return
+        self._on_stop(signum, frame)
+
+    def run(self):
+        """
+        Start the workers, restart those that die, and return once all of them
+        have stopped after a stop or restart signal.
+        """
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGUSR2, self._on_restart)
+        for index in range(self.count):
+            self.start(index)
+        print(f"[Workers] Master pid {os.getpid()} started {self.count} worker(s)")
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                # A successor started by SIGUSR2 is a child too
+                continue
+            print(f"[Workers] Worker {index} (pid {pid}) exited with status {status}, restarting")
+            if time.monotonic() - self.started[index] < RESTART_PAUSE:
+                time.sleep(RESTART_PAUSE)
+            if not self.stopping:
+                self.start(index)
+        self.listener.close()
+        print("[Workers] All workers stopped")
+
+
+def run_workers(count, ip, port, serve):
+    """
+    Serve with ``count`` worker processes sharing one listening socket.
+
+    :param count (int): number of workers.
+    :param ip (str): IP address to bind.
+    :param port (int): port number to listen on.
+    :param serve (callable): ``serve(index)`` runs the engine of worker ``index``
+                             (from 0) and returns once it has stopped. It is called
+                             in the forked worker, so the engine's threads and
+                             config are created there.
+    """
+    if not hasattr(os, "fork"):
+        print("[Workers] Worker processes need os.fork, serving in a single process")
+        serve(0)
+        return
+    listener = create_listener(ip, port, BACKLOG)
+    WorkerPool(count, listener, serve).run()
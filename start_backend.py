@@ -26,6 +26,7 @@ import socket
 import argparse
 
 from daemon import create_backend
+from daemon.tracing import SpanExporter
 
 # Default port number used if none is specified via command-line arguments.
 PORT = 9000 
@@ -40,6 +41,8 @@ if __name__ == "__main__":
 
     :arg --server-ip (str): IP address to bind the server (default: 127.0.0.1).
     :arg --server-port (int): Port number to bind the server (default: 9000).
+    :arg --trace-log (str): File receiving the spans of every request, "-" for the
+                            standard output (default: off).
     """
 
     parser = argparse.ArgumentParser(
@@ -58,9 +61,15 @@ if __name__ == "__main__":
         default=PORT,
         help='Port number to bind the server. Default is {}.'.format(PORT)
     )
+    parser.add_argument(
+        '--trace-log',
+        default=None,
+        help='File receiving the request spans (Zipkin v2 JSON lines). Default is off.'
+    )
  
     args = parser.parse_args()
     ip = args.server_ip
     port = args.server_port
+    tracer = SpanExporter(args.trace_log, "backend") if args.trace_log else None
 
-    create_backend(ip, port)
+    create_backend(ip, port, tracer=tracer)
@@ -2,115 +2,178 @@
 import json
 import socket
 import argparse
-import threading # <-- 1. Import threading
+import threading
+import time
 from daemon.weaprous import WeApRous
+from chat_tracker import TrackerStore, TrackerJournal, TrackerError
 
 PORT = 8000  # Port cho server trung tâm
+CHANNELS_CACHE_TTL = 30  # Giây giữ response của /chat/channels trong cache
+CLIENT_RATE = 20         # Số request/giây cho mỗi IP client
+CLIENT_BURST = 40        # Kích thước token bucket mỗi IP
+CLIENT_MAX_CONNS = 16    # Số kết nối đồng thời tối đa mỗi IP
+LEASE_TTL = 60           # Giây một peer còn trong danh sách nếu không gửi heartbeat
 app = WeApRous()
 
 # ----- Cơ sở dữ liệu "in-memory" (giống file PDF) -----
 
-db_lock = threading.Lock() # <-- 2. Tạo một Lock toàn cục
-
-db = {
-    "peers": {
-        # "username": {"ip": "1.2.3.4", "port": 5001, "channels": ["general"]}
-    },
-    "channels": {
-        "general": {"description": "Kênh chat chung"},
-        "random": {"description": "Kênh chat ngẫu nhiên"}
-    }
-}
+# Peers, kênh và chỉ mục channel -> peers / peer -> channels (xem chat_tracker.py).
+# Store tự khóa các thao tác ghi; các thao tác đọc không khóa, nên /chat/channels
+# và /chat/peers không phải chờ nhau hay chờ các lượt đăng ký
+db = TrackerStore(channels={
+    "general": "Kênh chat chung",
+    "random": "Kênh chat ngẫu nhiên",
+})
 # ------------------------------------------------
 
+# Parse body và dựng response đều nằm ngoài lock của store
+
 # API 1: Peer đăng ký (Peer registration)
 #
 @app.route('/chat/register', methods=['POST'])
 def register_peer(request, response):
-    with db_lock: # <-- 3. Khóa tài nguyên
-        try:
-            body_data = json.loads(request.body)
-            username = body_data['username']
-            p2p_port = int(body_data['p2p_port'])
-            
-            # Lấy IP của client từ connection
-            ip = request.connaddr[0] 
-            
-            if username in db["peers"]:
-                 return {"status": "error", "message": "Username đã tồn tại"}
+    try:
+        body_data = json.loads(request.body)
+        username = body_data['username']
+        p2p_port = int(body_data['p2p_port'])
+        
+        # Lấy IP của client (qua X-Forwarded-For nếu đi qua proxy tin cậy)
+        ip = request.client_ip
+        
+        db.register(username, ip, p2p_port)
+        app.background(print, f"[ChatServer] Đăng ký Peer: {username} tại {ip}:{p2p_port}")
+        
+        return {"status": "success", "message": f"Chào mừng {username}",
+                "lease_ttl": db.lease_ttl}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
 
-            db["peers"][username] = {"ip": ip, "port": p2p_port, "channels": []}
-            print(f"[ChatServer] Đăng ký Peer: {username} tại {ip}:{p2p_port}")
-            
-            return {"status": "success", "message": f"Chào mừng {username}"}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
+# API 1b: Heartbeat, gia hạn lease của peer (client gửi khoảng mỗi lease_ttl/3 giây)
+@app.route('/chat/heartbeat', methods=['POST'])
+def heartbeat(request, response):
+    try:
+        body_data = json.loads(request.body)
+        ttl = db.heartbeat(body_data['username'])
+        return {"status": "success", "lease_ttl": ttl}
+    except TrackerError as e:
+        # "code" == "not_registered": lease đã hết hạn, client phải đăng ký lại
+        return {"status": "error", "code": e.code, "message": str(e)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
 
 # API 2: Lấy danh sách kênh
-@app.route('/chat/channels', methods=['GET'])
+# Response được cache, /chat/join sẽ invalidate khi tạo kênh mới
+@app.route('/chat/channels', methods=['GET'], cache_ttl=CHANNELS_CACHE_TTL)
 def get_channels(request, response):
-    with db_lock: # <-- 3. Khóa tài nguyên (kể cả khi chỉ đọc)
-        return {"status": "success", "channels": list(db["channels"].keys())}
+    return {"status": "success", "channels": db.channel_names()}
 
 # API 3: Tham gia kênh
 @app.route('/chat/join', methods=['POST'])
 def join_channel(request, response):
-    with db_lock: # <-- 3. Khóa tài nguyên
-        try:
-            body_data = json.loads(request.body)
-            username = body_data['username']
-            channel = body_data['channel']
-
-            if username not in db["peers"]:
-                return {"status": "error", "message": "Peer chưa đăng ký"}
-            if channel not in db["channels"]:
-                db["channels"][channel] = {"description": f"Kênh {channel} được tạo tự động"}
-                print(f"[ChatServer] Kênh mới được tạo: {channel}")
-
-
-            if channel not in db["peers"][username]["channels"]:
-                db["peers"][username]["channels"].append(channel)
-                
-            print(f"[ChatServer] Peer {username} tham gia kênh {channel}")
-            return {"status": "success", "message": f"{username} đã tham gia {channel}"}
-        except Exception as e:
-            return {"status": "error", "message": str(e)}
+    try:
+        body_data = json.loads(request.body)
+        username = body_data['username']
+        channel = body_data['channel']
+
+        if db.join(username, channel):
+            app.invalidate('/chat/channels')
+            app.background(print, f"[ChatServer] Kênh mới được tạo: {channel}")
+            
+        app.background(print, f"[ChatServer] Peer {username} tham gia kênh {channel}")
+        return {"status": "success", "message": f"{username} đã tham gia {channel}"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+# API 3b: Rời kênh
+@app.route('/chat/leave', methods=['POST'])
+def leave_channel(request, response):
+    try:
+        body_data = json.loads(request.body)
+        username = body_data['username']
+        channel = body_data['channel']
+
+        if not db.leave(username, channel):
+            return {"status": "error", "message": f"{username} không ở trong {channel}"}
+        app.background(print, f"[ChatServer] Peer {username} rời kênh {channel}")
+        return {"status": "success", "message": f"{username} đã rời {channel}"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
 
 # API 4: Lấy danh sách peer trong kênh (Peer discovery)
-#
+# Chỉ duyệt các thành viên của kênh nhờ chỉ mục channel -> peers
 @app.route('/chat/peers', methods=['POST'])
 def get_peers(request, response):
-    with db_lock: # <-- 3. Khóa tài nguyên
+    try:
+        body_data = json.loads(request.body)
+        channel = body_data['channel']
+        my_username = body_data['username'] # Để không lấy chính mình
+
+        return {"status": "success", "peers": db.peers_in(channel, exclude=my_username)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+# API 5: Thống kê cache (để tinh chỉnh TTL) và hàng đợi tác vụ nền
+@app.route('/chat/stats', methods=['GET'])
+def get_stats(request, response):
+    return {"status": "success", "tracker": db.stats(), "cache": app.cache_stats(),
+            "tasks": app.task_stats(), "limiter": app.limiter_stats()}
+
+# API 6: Gộp nhiều lời gọi API trong một round trip (register + join + peers...)
+app.enable_batch('/chat/batch')
+
+def reap_peers(tick):
+    """Mỗi tick quay bánh xe lease một lần, xóa các peer không còn heartbeat."""
+    while True:
+        time.sleep(tick)
         try:
-            body_data = json.loads(request.body)
-            channel = body_data['channel']
-            my_username = body_data['username'] # Để không lấy chính mình
-
-            if channel not in db["channels"]:
-                return {"status": "error", "message": "Kênh không tồn tại"}
-
-            peer_list = []
-            # Vòng lặp for cũng cần được bảo vệ
-            for username, data in db["peers"].items():
-                # Nếu peer có trong kênh VÀ không phải là tôi
-                if channel in data["channels"] and username != my_username:
-                    peer_list.append({
-                        "username": username,
-                        "ip": data["ip"],
-                        "port": data["port"]
-                    })
-            
-            return {"status": "success", "peers": peer_list}
+            for username in db.expire():
+                app.background(print, f"[ChatServer] Peer {username} hết hạn lease, đã xóa")
         except Exception as e:
-            return {"status": "error", "message": str(e)}
+            print(f"[ChatServer] Lỗi khi xóa peer hết hạn: {e}")
 
 # --- Main ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog='ChatServer', description='Chat Tracker Server')
     parser.add_argument('--server-ip', default='0.0.0.0')
     parser.add_argument('--server-port', type=int, default=PORT)
+    parser.add_argument('--client-rate', type=float, default=CLIENT_RATE,
+                        help='Requests per second per client IP (0 disables)')
+    parser.add_argument('--client-burst', type=int, default=CLIENT_BURST)
+    parser.add_argument('--client-max-conns', type=int, default=CLIENT_MAX_CONNS,
+                        help='Concurrent connections per client IP (0 disables)')
+    parser.add_argument('--trusted-proxy', action='append', default=[],
+                        help='Proxy address whose X-Forwarded-For names the client (repeatable)')
+    parser.add_argument('--trace-log', default=None,
+                        help='File receiving the request spans (Zipkin v2 JSON lines)')
+    parser.add_argument('--data-dir', default=None,
+                        help='Directory of the tracker journal and snapshots (default: in memory only)')
+    parser.add_argument('--snapshot-every', type=int, default=10000,
+                        help='Journal records between two snapshots')
+    parser.add_argument('--lease-ttl', type=float, default=LEASE_TTL,
+                        help='Seconds a peer stays registered without a heartbeat (0 disables expiry)')
+    parser.add_argument('--lease-tick', type=float, default=1.0,
+                        help='Resolution of peer expiry in seconds')
     args = parser.parse_args()
+
+    # Khôi phục peers/kênh trước khi nhận request, để client không phải đăng ký lại
+    journal = None
+    if args.data_dir:
+        journal = TrackerJournal(args.data_dir, snapshot_every=args.snapshot_every)
+        journal.open(db)
+    # Peer khôi phục từ journal cũng nhận lease mới, phải heartbeat lại trong lease_ttl
+    if args.lease_ttl > 0:
+        db.enable_leases(args.lease_ttl, tick=args.lease_tick)
+        threading.Thread(target=reap_peers, args=(args.lease_tick,), daemon=True).start()
     
+    if args.trace_log:
+        app.enable_tracing(args.trace_log, service="chat-tracker")
+    app.limit_clients(rate=args.client_rate or None, burst=args.client_burst,
+                      max_conns=args.client_max_conns or None,
+                      trusted_proxies=args.trusted_proxy)
     app.prepare_address(args.server_ip, args.server_port)
     print(f"[ChatServer] Bắt đầu Tracker Server tại {args.server_ip}:{args.server_port}")
-    app.run()
\ No newline at end of file
+    try:
+        app.run()
+    finally:
+        if journal is not None:
+            journal.close()
\ No newline at end of file
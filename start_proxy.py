@@ -35,72 +35,340 @@ Requirements:
 
 """
 
+import os
 import socket
 import threading
 import argparse
 import re
-from urlparse import urlparse
+from functools import partial
+from urllib.parse import urlparse
 from collections import defaultdict
 
-from daemon import create_proxy
+from daemon import (create_proxy, create_async_proxy, HttpCache, SingleFlight, RetryPolicy,
+                    ConfigReloader, RequestQueue, TlsTerminator)
+from daemon.asyncproxy import Timeouts
+from daemon.accesslog import AccessLog
+from daemon.tracing import SpanExporter
+from daemon.workers import run_workers
+from daemon.routing import compile_routes
 
 PROXY_PORT = 8080
+CONFIG_FILE = "config/proxy.conf"
 
 
-def parse_virtual_hosts(config_file):
+def block_end(text, start):
+    """
+    Finds the brace closing the block opened just before ``start``.
+
+    :text (str): the config text.
+    :start (int): index right after the opening brace.
+    :rtype int: index of the closing brace (end of text if it is missing).
     """
-    Parses virtual host blocks from a config file.
+
+    depth = 1
+    for index in range(start, len(text)):
+        if text[index] == '{':
+            depth += 1
+        elif text[index] == '}':
+            depth -= 1
+            if depth == 0:
+                return index
+    return len(text)
+
+
+def read_host_blocks(config_file):
+    """
+    Reads the host blocks of a config file, without comments.
 
     :config_file (str): Path to the NGINX config file.
-    :rtype list of dict: Each dict contains 'listen'and 'server_name'.
+    :rtype list of tuple: (host, block body) pairs, location blocks included.
     """
 
     with open(config_file, 'r') as f:
         config_text = f.read()
 
-    # Match each host block
-    host_blocks = re.findall(r'host\s+"([^"]+)"\s*\{(.*?)\}', config_text, re.DOTALL)
+    # Drop comments (# ... end of line)
+    config_text = re.sub(r'#[^\n]*', '', config_text)
+
+    blocks = []
+    for match in re.finditer(r'host\s+"([^"]+)"\s*\{', config_text):
+        end = block_end(config_text, match.end())
+        blocks.append((match.group(1), config_text[match.end():end]))
+    return blocks
+
 
-    dist_policy_map = ""
+def split_locations(block):
+    """
+    Separates the ``location /prefix { ... }`` blocks from the rest of a host block.
+
+    :block (str): body of a host block.
+    :rtype tuple: (host directives, list of (prefix, location body)).
+    """
+
+    own, locations, position = [], [], 0
+    for match in re.finditer(r'location\s+(\S+)\s*\{', block):
+        if match.start() < position:
+            continue
+        end = block_end(block, match.end())
+        own.append(block[position:match.start()])
+        locations.append((match.group(1), block[match.end():end]))
+        position = end + 1
+    own.append(block[position:])
+    return "".join(own), locations
+
+
+def read_scopes(config_file):
+    """
+    Reads every host and location block of a config file.
+
+    :config_file (str): Path to the NGINX config file.
+    :rtype list of tuple: (host, prefix, directives) with prefix None for the
+                          host's own directives.
+    """
+
+    scopes = []
+    for host, block in read_host_blocks(config_file):
+        own, locations = split_locations(block)
+        scopes.append((host, None, own))
+        scopes.extend((host, prefix, body) for prefix, body in locations)
+    return scopes
+
+
+def scope_name(host, prefix):
+    """
+    :rtype str: ``host`` or ``host/prefix``, the key of per-route settings.
+    """
+
+    return host if prefix is None else host + prefix
+
+
+def parse_proxy_passes(block):
+    """
+    :block (str): directives of a host or location.
+    :rtype list: the proxy_pass entries, keeping optional parameters (weight=N,
+                 max_conns=N).
+    """
+
+    return [
+        " ".join([server] + params.split())
+        for server, params in re.findall(r'proxy_pass\s+http://([^\s;]+)([^;]*);', block)
+    ]
+
+
+def parse_dist_policy(block):
+    """
+    :block (str): directives of a host or location.
+    :rtype str: the dist_policy <name> [argument], e.g. "consistent-hash cookie:session",
+                or None.
+    """
+
+    policy_match = re.search(r'dist_policy\s+([\w-]+(?:[ \t]+[^\s;]+)?)', block)
+    return policy_match.group(1) if policy_match else None
+
+
+def parse_virtual_hosts(config_file):
+    """
+    Parses virtual host blocks from a config file.
+
+    Host names may be exact (``app1.local``), wildcards (``*.local``) or the default
+    host ``*``. A host may contain ``location /prefix { ... }`` blocks with their own
+    proxy_pass and dist_policy; missing ones are inherited from the host.
+
+    :config_file (str): Path to the NGINX config file.
+    :rtype dict: hostname -> (proxy_map, policy) or (proxy_map, policy, locations)
+                 with locations mapping a prefix to its (proxy_map, policy).
+    """
 
     routes = {}
-    for host, block in host_blocks:
-        proxy_map = {}
-
-        # Find all proxy_pass entries
-        proxy_passes = re.findall(r'proxy_pass\s+http://([^\s;]+);', block)
-        map = proxy_map.get(host,[])
-        map = map + proxy_passes
-        proxy_map[host] = map
-
-        # Find dist_policy if present
-        policy_match = re.search(r'dist_policy\s+(\w+)', block)
-        if policy_match:
-            dist_policy_map = policy_match.group(1)
-        else: #default policy is round_robin
-            dist_policy_map = 'round-robin'
-            
-        #
-        # @bksysnet: Build the mapping and policy
-        # TODO: this policy varies among scenarios 
-        #       the default policy is provided with one proxy_pass
-        #       In the multi alternatives of proxy_pass then
-        #       the policy is applied to identify the highes matching
-        #       proxy_pass
-        #
-        if len(proxy_map.get(host,[])) == 1:
-            routes[host] = (proxy_map.get(host,[])[0], dist_policy_map)
-        # esle if:
-        #         TODO:  apply further policy matching here
-        #
+    for host, prefix, block in read_scopes(config_file):
+        proxy_map = parse_proxy_passes(block)
+        # A single proxy_pass is kept as a plain string
+        if len(proxy_map) == 1:
+            proxy_map = proxy_map[0]
+        policy = parse_dist_policy(block)
+        if prefix is None:
+            #default policy is round_robin
+            routes[host] = (proxy_map, policy or 'round-robin')
         else:
-            routes[host] = (proxy_map.get(host,[]), dist_policy_map)
+            proxy_map_host, policy_host = routes[host][:2]
+            locations = routes[host][2] if len(routes[host]) > 2 else {}
+            locations[prefix] = (proxy_map, policy)
+            routes[host] = (proxy_map_host, policy_host, locations)
 
     for key, value in routes.items():
         print (key, value)
     return routes
 
 
+def parse_single_flight(config_file):
+    """
+    Parses the ``single_flight`` directive of the host and location blocks, e.g.
+    ``single_flight on;`` or ``single_flight timeout=5 max_waiters=100;``.
+
+    :config_file (str): Path to the NGINX config file.
+    :rtype dict: ``host`` or ``host/prefix`` -> SingleFlight for the routes that
+                 enable coalescing, None for those that turn it off.
+    """
+
+    flights = {}
+    for host, prefix, block in read_scopes(config_file):
+        match = re.search(r'single_flight\s+([^;]*);', block)
+        if not match:
+            continue
+        name = scope_name(host, prefix)
+        if match.group(1).strip() == 'off':
+            # Explicitly off: a location does not inherit the host's setting
+            flights[name] = None
+            continue
+        params = dict(re.findall(r'(\w+)=([\d.]+)', match.group(1)))
+        flights[name] = SingleFlight(timeout=float(params.get('timeout', 5)),
+                                     max_waiters=int(params.get('max_waiters', 100)))
+        print(f"[Proxy] Single-flight enabled for {name}: {params or 'defaults'}")
+    return flights
+
+
+def parse_retry_policies(config_file):
+    """
+    Parses the ``retry`` directive of the host and location blocks, e.g.
+    ``retry retries=2 on=502,503,504 hedge=p95 budget=0.2;``.
+
+    - retries: extra attempts per idempotent request (retries and hedges together).
+    - on: response statuses retried on another upstream (connect failures always are).
+    - hedge: latency percentile after which a duplicate is sent, or ``off``.
+    - budget: retries and hedges allowed per request, as a fraction of the traffic.
+
+    :config_file (str): Path to the NGINX config file.
+    :rtype dict: ``host`` or ``host/prefix`` -> RetryPolicy for the routes that
+                 enable retries, None for those that turn them off.
+    """
+
+    policies = {}
+    for host, prefix, block in read_scopes(config_file):
+        match = re.search(r'retry\s+([^;]*);', block)
+        if not match:
+            continue
+        name = scope_name(host, prefix)
+        if match.group(1).strip() == 'off':
+            policies[name] = None
+            continue
+        params = dict(re.findall(r'(\w+)=([^\s;]+)', match.group(1)))
+        hedge = params.get('hedge', 'off')
+        policies[name] = RetryPolicy(
+            retries=int(params.get('retries', 2)),
+            retry_on=[int(code) for code in params.get('on', '502,503,504').split(',')],
+            hedge=hedge != 'off',
+            hedge_quantile=int(hedge[1:]) / 100 if hedge.startswith('p') else 0.95,
+            budget_ratio=float(params.get('budget', 0.2)))
+        print(f"[Proxy] Retry policy for {name}: {params or 'defaults'}")
+    return policies
+
+
+def parse_queues(config_file):
+    """
+    Parses the ``queue`` directive of the host and location blocks, e.g.
+    ``queue 100 timeout=2;``: while every upstream of the route is at its
+    ``max_conns``, up to 100 requests wait at most 2 seconds for a free slot.
+    Without it, such requests are answered 503 at once.
+
+    :config_file (str): Path to the NGINX config file.
+    :rtype dict: ``host`` or ``host/prefix`` -> RequestQueue.
+    """
+
+    queues = {}
+    for host, prefix, block in read_scopes(config_file):
+        match = re.search(r'queue\s+(\d+)([^;]*);', block)
+        if not match:
+            continue
+        name = scope_name(host, prefix)
+        params = dict(re.findall(r'(\w+)=([\d.]+)', match.group(2)))
+        queues[name] = RequestQueue(size=int(match.group(1)),
+                                    timeout=float(params.get('timeout', 5)))
+    return queues
+
+
+def parse_certificates(config_file):
+    """
+    Parses the ``ssl_certificate`` and ``ssl_certificate_key`` directives of the
+    host blocks, e.g. ``ssl_certificate certs/app1.pem;``. Without a key, the
+    certificate file must also hold the private key.
+
+    :config_file (str): Path to the NGINX config file.
+    :rtype dict: hostname -> (certificate file, key file) of the hosts with one.
+    """
+
+    certificates = {}
+    for host, prefix, block in read_scopes(config_file):
+        match = re.search(r'ssl_certificate\s+([^\s;]+)\s*;', block)
+        if prefix is not None or not match:
+            continue
+        key = re.search(r'ssl_certificate_key\s+([^\s;]+)\s*;', block)
+        certificates[host] = (match.group(1), key.group(1) if key else match.group(1))
+    return certificates
+
+
+def load_routing_table(config_file, previous=None):
+    """
+    Parses a config file and compiles its routing table.
+
+    :config_file (str): Path to the NGINX config file.
+    :previous (RoutingTable): the table being replaced by a reload, or None.
+    :rtype RoutingTable: the compiled routes with their retry, single-flight and
+                         queueing settings.
+    """
+
+    return compile_routes(parse_virtual_hosts(config_file), parse_single_flight(config_file),
+                          parse_retry_policies(config_file), parse_queues(config_file),
+                          previous=previous)
+
+
+def serve_proxy(args, index=0, workers=1, tls=None):
+    """
+    Runs one proxy engine with the command-line settings until it is stopped.
+
+    :args (argparse.Namespace): the parsed command line.
+    :index (int): the worker index, 0 without worker processes.
+    :workers (int): number of worker processes.
+    :tls (TlsTerminator): the TLS contexts of the listener, None for plain HTTP.
+    """
+
+    ip = args.server_ip
+    port = args.server_port
+    health_check = None if args.health_check == 'off' else args.health_check
+    if index > 0:
+        # Worker 0 probes for everyone, results are shared through the health board
+        health_check = None
+
+    cache = None
+    if args.cache_size > 0:
+        cache_dir = args.cache_dir
+        if cache_dir and workers > 1:
+            # Each worker keeps its own disk tier, the file names would collide
+            cache_dir = os.path.join(cache_dir, f"worker-{index}")
+        cache = HttpCache(max_bytes=args.cache_size * 1024 * 1024,
+                          max_object=args.cache_max_object * 1024,
+                          disk_dir=cache_dir,
+                          disk_max_bytes=args.cache_disk_size * 1024 * 1024)
+
+    access_log = AccessLog(args.access_log) if args.access_log else None
+    tracer = SpanExporter(args.trace_log, "proxy") if args.trace_log else None
+
+    # The reloader owns the routing table, SIGHUP or an edit of the file swaps it
+    reloader = ConfigReloader(CONFIG_FILE, load_routing_table, interval=args.reload_interval)
+
+    if args.engine == 'asyncio':
+        if cache is not None or reloader.table.flights:
+            print("[Proxy] Cache and single_flight are not supported by the asyncio engine, ignored")
+        timeouts = Timeouts(connect=args.connect_timeout, first_byte=args.first_byte_timeout,
+                            idle=args.idle_timeout)
+        create_async_proxy(ip, port, reloader.table, health_check=health_check,
+                           health_interval=args.health_interval, timeouts=timeouts,
+                           reloader=reloader, access_log=access_log, tls=tls, tracer=tracer)
+    else:
+        create_proxy(ip, port, reloader.table, health_check=health_check,
+                     health_interval=args.health_interval, cache=cache, reloader=reloader,
+                     access_log=access_log, tls=tls, tracer=tracer)
+
+
 if __name__ == "__main__":
     """
     Entry point for launching the proxy server.
@@ -111,16 +379,60 @@ if __name__ == "__main__":
 
     :arg --server-ip (str): IP address to bind the server (default: 127.0.0.1).
     :arg --server-port (int): Port number to bind the server (default: 9000).
+    :arg --health-check (str): "tcp", an HTTP path to probe (e.g. /healthz) or "off".
+    :arg --health-interval (float): Seconds between two health check rounds.
+    :arg --cache-size (int): Memory cache size in MB, 0 disables the proxy cache.
+    :arg --cache-max-object (int): Largest cached response in KB.
+    :arg --cache-dir (str): Directory of the optional disk cache tier.
+    :arg --cache-disk-size (int): Disk cache size in MB.
+    :arg --engine (str): "threads" (one thread per client) or "asyncio" (event loop).
+    :arg --connect-timeout (float): asyncio engine, seconds to connect to an upstream.
+    :arg --first-byte-timeout (float): asyncio engine, seconds to the response header.
+    :arg --idle-timeout (float): asyncio engine, longest silence while relaying.
+    :arg --reload-interval (float): Seconds between two checks of the config file for
+                                    changes, 0 to reload on SIGHUP only.
+    :arg --access-log (str): File receiving one JSON line per request with its timing
+                             spans, "-" for the standard output (default: off).
+    :arg --trace-log (str): File receiving one span per request (Zipkin v2 JSON lines),
+                            "-" for the standard output (default: off). The trace id
+                            is propagated to the backends either way.
+    :arg --workers (int): Number of proxy processes sharing the listening port
+                          (default: 1, a single process).
+    :arg --tls: Serve HTTPS with the ssl_certificate of each host in the config,
+                chosen by SNI (default: plain HTTP).
+    :arg --tls-handshake-timeout (float): Seconds a client has to complete the TLS
+                                          handshake.
     """
 
     parser = argparse.ArgumentParser(prog='Proxy', description='', epilog='Proxy daemon')
     parser.add_argument('--server-ip', default='0.0.0.0')
     parser.add_argument('--server-port', type=int, default=PROXY_PORT)
+    parser.add_argument('--health-check', default='tcp')
+    parser.add_argument('--health-interval', type=float, default=5.0)
+    parser.add_argument('--cache-size', type=int, default=0)
+    parser.add_argument('--cache-max-object', type=int, default=1024)
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--cache-disk-size', type=int, default=512)
+    parser.add_argument('--engine', choices=('threads', 'asyncio'), default='threads')
+    parser.add_argument('--connect-timeout', type=float, default=3.0)
+    parser.add_argument('--first-byte-timeout', type=float, default=30.0)
+    parser.add_argument('--idle-timeout', type=float, default=30.0)
+    parser.add_argument('--reload-interval', type=float, default=1.0)
+    parser.add_argument('--access-log', default=None)
+    parser.add_argument('--trace-log', default=None)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--tls', action='store_true')
+    parser.add_argument('--tls-handshake-timeout', type=float, default=10.0)
  
     args = parser.parse_args()
-    ip = args.server_ip
-    port = args.server_port
-
-    routes = parse_virtual_hosts("config/proxy.conf")
-
-    create_proxy(ip, port, routes)
+    tls = None
+    if args.tls:
+        # Created before the workers are forked: they share the session ticket keys,
+        # so a session resumes on whichever worker accepts the reconnection.
+        # Certificates are not reloaded by SIGHUP, a restart (SIGUSR2) reads them again
+        tls = TlsTerminator(parse_certificates(CONFIG_FILE), args.tls_handshake_timeout)
+    if args.workers > 1:
+        run_workers(args.workers, args.server_ip, args.server_port,
+                    partial(serve_proxy, args, workers=args.workers, tls=tls))
+    else:
+        serve_proxy(args, tls=tls)
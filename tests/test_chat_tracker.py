@@ -0,0 +1,186 @@
+"""Tests of the tracker's journal and lease wheel (chat_tracker)."""
+
+import random
+import shutil
+
+import pytest
+
+import chat_tracker
+from chat_tracker import NOT_REGISTERED, TimingWheel, TrackerError, TrackerJournal, TrackerStore
+
+
+def populate(directory):
+    """Open a journal on a fresh store and record a few operations."""
+    store = TrackerStore()
+    journal = TrackerJournal(str(directory))
+    journal.open(store)
+    store.register("alice", "10.0.0.1", 9001)
+    store.register("bob", "10.0.0.2", 9002)
+    store.join("alice", "general")
+    store.join("bob", "general")
+    store.leave("bob", "general")
+    return store, journal
+
+
+def crash_copy(source, target):
+    """The files as a crash would leave them: durable records, no final snapshot."""
+    shutil.copytree(source, target)
+    return target
+
+
+def restore(directory):
+    store = TrackerStore()
+    journal = TrackerJournal(str(directory))
+    journal.open(store)
+    return store, journal
+
+
+def test_journal_replay_drops_torn_tail(tmp_path):
+    _, journal = populate(tmp_path / "live")
+    crashed = crash_copy(tmp_path / "live", tmp_path / "crashed")
+    journal.close()
+    with open(crashed / "journal.log", "ab") as f:
+        f.write(b'{"seq": 6, "op": "register", "username": "mallory", "ip": "10.0.0.6", "po')
+
+    store, journal = restore(crashed)
+    try:
+        assert sorted(store.peers) == ["alice", "bob"]
+        assert store.peers_in("general") == [{"username": "alice", "ip": "10.0.0.1", "port": 9001}]
+        assert store.stats()["memberships"] == 1
+        # The replay was folded into a snapshot and the journal restarts empty
+        assert (crashed / "snapshot.json").exists()
+        assert (crashed / "journal.log").read_bytes() == b""
+        # Numbering continues after the last complete record
+        assert journal.stats()["seq"] == 5
+        store.register("carol", "10.0.0.3", 9003)
+        again = crash_copy(crashed, tmp_path / "again")
+    finally:
+        journal.close()
+
+    store, journal = restore(again)
+    try:
+        assert sorted(store.peers) == ["alice", "bob", "carol"]
+        assert journal.stats()["seq"] == 6
+    finally:
+        journal.close()
+
+
+def test_journal_truncates_lone_torn_record(tmp_path):
+    tmp_path.joinpath("journal.log").write_bytes(b'{"seq": 1, "op": "regis')
+    store, journal = restore(tmp_path)
+    try:
+        assert store.peers == {}
+        assert not (tmp_path / "snapshot.json").exists()
+        store.register("alice", "10.0.0.1", 9001)
+        # The new record starts on a clean line instead of after the torn bytes
+        assert tmp_path.joinpath("journal.log").read_bytes().startswith(b'{"seq": 1, "op": "register"')
+    finally:
+        journal.close()
+
+
+def test_journal_close_snapshots_and_restores(tmp_path):
+    _, journal = populate(tmp_path)
+    journal.close()
+    assert (tmp_path / "journal.log").read_bytes() == b""
+
+    store, journal = restore(tmp_path)
+    try:
+        assert sorted(store.peers) == ["alice", "bob"]
+        assert store.memberships["bob"] == set()
+        assert store.channel_names() == ["general"]
+    finally:
+        journal.close()
+
+
+def test_wheel_expires_on_deadline_tick():
+    wheel = TimingWheel(tick=1.0, slots=4, levels=3, now=0)
+    wheel.schedule("a", 2.5)
+    assert wheel.advance(2) == []
+    assert wheel.advance(3) == ["a"]
+    assert len(wheel) == 0
+
+
+def test_wheel_cascades_down_the_levels():
+    wheel = TimingWheel(tick=1.0, slots=4, levels=3, now=0)
+    wheel.schedule("near", 3)
+    wheel.schedule("mid", 10)
+    wheel.schedule("far", 40)
+    assert [wheel.where[key][0] for key in ("near", "mid", "far")] == [0, 1, 2]
+    assert wheel.advance(9) == ["near"]
+    # "mid" was moved down to the first level when its slot came round
+    assert wheel.where["mid"][0] == 0
+    assert wheel.advance(10) == ["mid"]
+    assert wheel.advance(39) == []
+    assert wheel.advance(40) == ["far"]
+
+
+def test_wheel_requeues_deadlines_beyond_its_range():
+    # Three levels of four slots cover 64 ticks; 100 goes round the top level again
+    wheel = TimingWheel(tick=1.0, slots=4, levels=3, now=0)
+    wheel.schedule("late", 100)
+    assert wheel.advance(99) == []
+    assert wheel.advance(100) == ["late"]
+
+
+def test_wheel_cancel_reschedule_and_past_deadline():
+    wheel = TimingWheel(tick=1.0, slots=4, levels=3, now=0)
+    wheel.schedule("a", 5)
+    wheel.schedule("b", 5)
+    wheel.cancel("b")
+    wheel.schedule("a", 20)
+    wheel.schedule("late", -3)
+    assert wheel.advance(1) == ["late"]
+    assert wheel.advance(19) == []
+    assert wheel.advance(20) == ["a"]
+
+
+def test_wheel_matches_sorted_deadlines():
+    rng = random.Random(7)
+    wheel = TimingWheel(tick=0.5, slots=8, levels=3, now=0)
+    deadlines = {f"k{i}": rng.uniform(0, 400) for i in range(2000)}
+    for key, deadline in deadlines.items():
+        wheel.schedule(key, deadline)
+    now, seen = 0.0, set()
+    while len(wheel):
+        now += rng.uniform(0.1, 7)
+        expired = wheel.advance(now)
+        for key in expired:
+            # Due by now, and not already due at the previous advance
+            assert deadlines[key] <= int(now / 0.5) * 0.5
+        assert not seen & set(expired)
+        seen.update(expired)
+        assert all(deadlines[key] > int(now / 0.5) * 0.5 for key in wheel.where)
+    assert seen == set(deadlines)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_leases_expire_unless_renewed(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(chat_tracker.time, "monotonic", clock)
+    store = TrackerStore()
+    store.enable_leases(ttl=30, tick=1.0)
+    store.register("alice", "10.0.0.1", 9001)
+    store.register("bob", "10.0.0.2", 9002)
+    store.join("alice", "general")
+    store.join("bob", "general")
+
+    clock.now += 20
+    store.heartbeat("alice")
+    clock.now += 15
+    assert store.expire() == ["bob"]
+    assert [peer["username"] for peer in store.peers_in("general")] == ["alice"]
+    clock.now += 14
+    assert store.expire() == []
+    clock.now += 2
+    assert store.expire() == ["alice"]
+    assert store.stats()["expired"] == 2
+    with pytest.raises(TrackerError) as caught:
+        store.heartbeat("alice")
+    assert caught.value.code == NOT_REGISTERED
@@ -0,0 +1,204 @@
+"""Tests of daemon.retry and the retry/hedge loop of daemon.proxy.open_response."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from daemon import proxy, retry
+from daemon.retry import RetryBudget, RetryPolicy
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, "monotonic", clock)
+    return clock
+
+
+def request(method="GET", body=b""):
+    return SimpleNamespace(method=method, body=body, replayable=body is not None)
+
+
+def test_budget_starts_with_the_floor_and_earns_by_ratio(clock):
+    budget = RetryBudget(ratio=0.25, min_per_sec=1.0)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    for _ in range(4):
+        budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    assert budget.exhausted == 2
+
+
+def test_budget_refills_over_time_up_to_cap(clock):
+    budget = RetryBudget(ratio=0.1, min_per_sec=2.0, cap=3.0)
+    assert budget.withdraw() and budget.withdraw()
+    clock.now += 0.25
+    assert not budget.withdraw()
+    clock.now += 0.25
+    assert budget.withdraw()
+    clock.now += 60
+    assert [budget.withdraw() for _ in range(4)] == [True, True, True, False]
+
+
+def test_policy_allows_only_replayable_idempotent_requests():
+    policy = RetryPolicy()
+    assert policy.allows(request("GET"))
+    assert policy.allows(request("DELETE"))
+    assert not policy.allows(request("POST"))
+    assert not policy.allows(request("PUT", body=None))
+    assert not RetryPolicy(retries=0).allows(request("GET"))
+
+
+def observe(policy, name, samples):
+    for seconds in samples:
+        policy.observe(SimpleNamespace(name=name), seconds)
+
+
+def test_hedge_delay_uses_the_median_upstream():
+    policy = RetryPolicy(hedge=True, min_samples=20, hedge_min_delay=0.005)
+    observe(policy, "a", [0.010] * 19)
+    assert policy.hedge_delay() is None
+    observe(policy, "a", [0.010])
+    assert policy.hedge_delay() == 0.010
+    # One stalling upstream out of three does not stretch the delay
+    observe(policy, "b", [0.020] * 20)
+    observe(policy, "c", [5.0] * 20)
+    assert policy.hedge_delay() == 0.020
+    observe(policy, "fast", [0.001] * 20)
+    observe(policy, "faster", [0.0001] * 20)
+    assert policy.hedge_delay() == 0.010
+    assert RetryPolicy(hedge=False).hedge_delay() is None
+
+
+def test_hedge_delay_has_a_floor():
+    policy = RetryPolicy(hedge=True, min_samples=1, hedge_min_delay=0.005)
+    observe(policy, "a", [0.0001])
+    assert policy.hedge_delay() == 0.005
+
+
+def test_adopt_keeps_samples_and_caps_tokens():
+    previous = RetryPolicy(hedge=True, min_samples=1)
+    observe(previous, "a", [0.05])
+    previous.budget.tokens = 500.0
+    policy = RetryPolicy(hedge=True, min_samples=1)
+    policy.adopt(previous)
+    assert policy.hedge_delay() == 0.05
+    assert policy.budget.tokens == policy.budget.cap
+
+
+class FakeUpstream:
+    def __init__(self, name, status=200, error=None, delay=0.0):
+        self.name = name
+        self.status = status
+        self.error = error
+        self.delay = delay
+        self.sent = 0
+        self.released = 0
+
+    def release(self):
+        self.released += 1
+
+
+class FakeAttempt:
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.status = upstream.status
+        self.started = time.monotonic()
+        self.closed = None
+
+    def close(self, ok=True):
+        self.closed = ok
+
+
+@pytest.fixture
+def send(monkeypatch):
+    def send_attempt(upstream, head, request):
+        upstream.sent += 1
+        if upstream.delay:
+            time.sleep(upstream.delay)
+        if upstream.error is not None:
+            raise upstream.error
+        return FakeAttempt(upstream)
+
+    monkeypatch.setattr(proxy, "send_attempt", send_attempt)
+
+
+def selector(*upstreams):
+    lock = threading.Lock()
+
+    def select_upstream(exclude):
+        with lock:
+            for upstream in upstreams:
+                if upstream.name not in exclude:
+                    return upstream
+        return None
+
+    return select_upstream
+
+
+def test_retries_on_another_upstream(send):
+    down = FakeUpstream("a", error=ConnectionRefusedError())
+    busy = FakeUpstream("b", status=503)
+    up = FakeUpstream("c")
+    policy = RetryPolicy(retries=2, budget_min_per_sec=5.0)
+    attempt = proxy.open_response(request(), b"", selector(down, busy, up), policy)
+    assert attempt.upstream is up
+    assert [down.sent, busy.sent, up.sent] == [1, 1, 1]
+    assert policy.stats()["retries"] == 2
+
+
+def test_last_retryable_response_is_returned(send):
+    first, second = FakeUpstream("a", status=502), FakeUpstream("b", status=503)
+    policy = RetryPolicy(retries=3, budget_min_per_sec=5.0)
+    attempt = proxy.open_response(request(), b"", selector(first, second), policy)
+    assert attempt.upstream is second
+    assert attempt.closed is None
+
+
+def test_connection_error_is_raised_when_nothing_answers(send):
+    down = FakeUpstream("a", error=ConnectionResetError())
+    with pytest.raises(ConnectionResetError):
+        proxy.open_response(request(), b"", selector(down), RetryPolicy())
+    with pytest.raises(proxy.NoUpstream):
+        proxy.open_response(request(), b"", selector(), RetryPolicy())
+
+
+def test_no_retry_for_post(send):
+    busy, up = FakeUpstream("a", status=503), FakeUpstream("b")
+    attempt = proxy.open_response(request("POST"), b"", selector(busy, up), RetryPolicy())
+    assert attempt.upstream is busy
+    assert up.sent == 0
+
+
+def test_exhausted_budget_stops_retries(send):
+    policy = RetryPolicy(retries=2, budget_ratio=0.0, budget_min_per_sec=1.0)
+    policy.budget.tokens = 0.0
+    busy, up = FakeUpstream("a", status=503), FakeUpstream("b")
+    attempt = proxy.open_response(request(), b"", selector(busy, up), policy)
+    assert attempt.upstream is busy
+    assert up.sent == 0
+    # The reserved slot of the upstream that was not used is given back
+    assert up.released == 1
+    assert policy.budget.exhausted == 1
+
+
+def test_slow_upstream_is_hedged(send):
+    policy = RetryPolicy(retries=1, hedge=True, min_samples=1, budget_min_per_sec=5.0)
+    observe(policy, "slow", [0.01])
+    slow, fast = FakeUpstream("slow", delay=0.5), FakeUpstream("fast")
+    attempt = proxy.open_response(request(), b"", selector(slow, fast), policy)
+    assert attempt.upstream is fast
+    stats = policy.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
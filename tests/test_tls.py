@@ -0,0 +1,160 @@
+"""Tests of daemon.tls with self-signed certificates generated for the run."""
+
+import queue
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+
+import pytest
+
+from daemon.tls import TlsTerminator
+
+pytestmark = pytest.mark.skipif(shutil.which("openssl") is None, reason="needs the openssl CLI")
+
+
+def make_certificate(directory, name):
+    cert, key = directory / f"{name}.pem", directory / f"{name}.key"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt",
+                    "ec_paramgen_curve:prime256v1", "-nodes", "-days", "1",
+                    "-subj", f"/CN={name}", "-keyout", str(key), "-out", str(cert)],
+                   check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+@pytest.fixture(scope="module")
+def certificates(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("certs")
+    return {
+        "*": make_certificate(directory, "default.test"),
+        "app1.local": make_certificate(directory, "app1.local"),
+        "*.wild.test": make_certificate(directory, "wild.test"),
+    }
+
+
+def der(path):
+    with open(path) as f:
+        return ssl.PEM_cert_to_DER_cert(f.read())
+
+
+class Server:
+    """Accepts connections and runs TlsTerminator.wrap in a thread per connection,
+    like the threaded proxy engine."""
+
+    def __init__(self, tls):
+        self.tls = tls
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.results = queue.Queue()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        tls_conn = self.tls.wrap(conn)
+        self.results.put(tls_conn)
+        if tls_conn is None:
+            return
+        try:
+            tls_conn.recv(1)
+            tls_conn.sendall(b"ok")
+        except OSError:
+            pass
+        finally:
+            tls_conn.close()
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def server(certificates):
+    server = Server(TlsTerminator(certificates, handshake_timeout=0.5))
+    yield server
+    server.close()
+
+
+def client_context(maximum_version=None):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    if maximum_version is not None:
+        context.maximum_version = maximum_version
+    return context
+
+
+def exchange(server, context, server_name=None, session=None):
+    """Connect, complete one request and return (peer certificate, session, reused)."""
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as raw:
+        with context.wrap_socket(raw, server_hostname=server_name, session=session) as conn:
+            conn.sendall(b"x")
+            # Reading lets the client receive the TLS 1.3 tickets sent after the handshake
+            assert conn.recv(2) == b"ok"
+            return conn.getpeercert(binary_form=True), conn.session, conn.session_reused
+
+
+@pytest.mark.parametrize("server_name, expected", [
+    ("app1.local", "app1.local"),
+    ("APP1.local", "app1.local"),
+    ("a.wild.test", "*.wild.test"),
+    ("x.b.wild.test", "*.wild.test"),
+    ("unknown.test", "*"),
+    (None, "*"),
+])
+def test_sni_selects_certificate(server, certificates, server_name, expected):
+    peer, _, _ = exchange(server, client_context(), server_name)
+    assert peer == der(certificates[expected][0])
+
+
+def test_lookup_falls_back_to_default(certificates):
+    tls = TlsTerminator(certificates)
+    assert tls.lookup("app1.local") is tls.exact["app1.local"]
+    assert tls.lookup("deep.sub.wild.test") is tls.wildcards[".wild.test"]
+    assert tls.lookup("wild.test") is None
+    assert tls.lookup("other.test") is None
+
+
+def test_first_certificate_is_default_without_star(certificates):
+    tls = TlsTerminator({"app1.local": certificates["app1.local"]})
+    assert tls.context is tls.exact["app1.local"]
+
+
+def test_needs_a_certificate():
+    with pytest.raises(ValueError):
+        TlsTerminator({})
+
+
+@pytest.mark.parametrize("maximum_version", [None, ssl.TLSVersion.TLSv1_2])
+def test_session_resumption(server, maximum_version):
+    context = client_context(maximum_version)
+    _, session, reused = exchange(server, context, "app1.local")
+    assert not reused
+    peer, _, reused = exchange(server, context, "app1.local", session)
+    assert reused
+    stats = server.tls.stats()
+    assert stats["handshakes"] == 2
+    assert stats["resumed"] == 1
+
+
+def test_plain_http_fails_handshake(server):
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as raw:
+        raw.sendall(b"GET / HTTP/1.1\r\nHost: app1.local\r\n\r\n")
+        assert server.results.get(timeout=5) is None
+    assert server.tls.stats()["failures"] == 1
+
+
+def test_idle_client_times_out(server):
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5):
+        # Never starts the handshake: wrap gives up after handshake_timeout
+        assert server.results.get(timeout=5) is None
+    # The terminator keeps serving after giving up on the idle client
+    peer, _, _ = exchange(server, client_context(), "app1.local")
+    assert peer
+    assert server.tls.stats()["failures"] == 1